@@ -21,6 +21,7 @@ a = Analysis(
         'pydantic',
         'dotenv',
         'rich',
+        'waitress',
     ],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,330 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+from karoloke.events import (
+    KEEP_ALIVE_MESSAGE,
+    RETRY_MESSAGE,
+    EventBroker,
+    get_event_broker,
+)
+from karoloke.settings import (
+    EVENTS_HEARTBEAT,
+    SERVER_THREADS,
+    STREAM_CHUNK_SIZE,
+)
+
+EVENT_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+# Set in the environ of the requests served through the bridge
+ASGI_ENVIRON_KEY = 'karoloke.asgi'
+
+
+class FileWrapper:
+    """``wsgi.file_wrapper`` offered to the WSGI app by :class:`AsgiBridge`.
+
+    The file is read from its current position in ``block_size`` chunks;
+    the bridge stops at ``Content-Length``, so a file positioned at the
+    start of a byte range is sent as that range only.
+    """
+
+    def __init__(self, f, block_size: int = STREAM_CHUNK_SIZE):
+        self.file = f
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            data = self.file.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+def _wsgi_str(text: str) -> str:
+    # WSGI carries bytes as latin-1 strings (PEP 3333)
+    return text.encode('utf-8').decode('latin-1')
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """Translate an ASGI HTTP scope into a WSGI environ.
+
+    Parameters
+    ----------
+    scope : dict
+        ASGI connection scope of an ``http`` request.
+    body : bytes
+        Complete request body.
+
+    Returns
+    -------
+    dict
+        WSGI environ for the same request.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _wsgi_str(root_path),
+        'PATH_INFO': _wsgi_str(path),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': str(client[0]),
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileWrapper,
+        # /events is served on the event loop: pages may hold it open
+        ASGI_ENVIRON_KEY: True,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        if key in environ:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            value = f'{environ[key]}{separator}{value}'
+        environ[key] = value
+    return environ
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def _watch_disconnect(receive, disconnected: asyncio.Event, *wake):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            for event in wake:
+                event.set()
+            return
+
+
+class AsgiBridge:
+    """Serve the Flask app from an asyncio (ASGI) server.
+
+    Every route of the WSGI app keeps its exact behavior: requests are
+    translated to WSGI and run on a thread pool, and response bodies are
+    pulled one chunk at a time on that pool. Between two chunks, a slow
+    client only holds a coroutine, not a thread, so large video downloads
+    do not tie up the pool.
+
+    ``/events`` is served natively on the event loop from the
+    :class:`~karoloke.events.EventBroker`, so thousands of idle phones
+    waiting for queue updates cost one coroutine each.
+
+    Parameters
+    ----------
+    wsgi_app : callable
+        WSGI application, usually ``karoloke.jukebox_router.app``.
+    broker : EventBroker, optional
+        Broker feeding ``/events``. Defaults to the application broker.
+    max_workers : int
+        Threads running WSGI requests and blocking file reads.
+    heartbeat : float
+        Seconds between two keep-alive comments on idle event streams.
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        broker: Optional[EventBroker] = None,
+        max_workers: int = SERVER_THREADS,
+        heartbeat: float = EVENTS_HEARTBEAT,
+    ):
+        self.wsgi_app = wsgi_app
+        self.broker = broker or get_event_broker()
+        self.heartbeat = heartbeat
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='karoloke-asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'] == '/events' and scope['method'] == 'GET':
+                await self._events(receive, send)
+            else:
+                await self._wsgi(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, await _read_body(receive))
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = status
+            response['headers'] = headers
+            return written.append
+
+        def begin():
+            result = self.wsgi_app(environ, start_response)
+            iterator = iter(result)
+            # Generators may only call start_response on the first chunk
+            return result, iterator, next(iterator, None)
+
+        result, iterator, chunk = await loop.run_in_executor(
+            self.executor, begin
+        )
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(
+            _watch_disconnect(receive, disconnected)
+        )
+        try:
+            headers = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in response['headers']
+            ]
+            remaining = None
+            for name, value in headers:
+                if name == b'content-length':
+                    remaining = int(value)
+            await send(
+                {
+                    'type': 'http.response.start',
+                    'status': int(response['status'].split(' ', 1)[0]),
+                    'headers': headers,
+                }
+            )
+            response['sent'] = True
+            if written:
+                chunk = b''.join(written) + (chunk or b'')
+            while chunk is not None and not disconnected.is_set():
+                # Never send more than Content-Length (PEP 3333)
+                if remaining is not None:
+                    chunk = chunk[:remaining]
+                    remaining -= len(chunk)
+                if chunk:
+                    await send(
+                        {
+                            'type': 'http.response.body',
+                            'body': chunk,
+                            'more_body': True,
+                        }
+                    )
+                if remaining == 0:
+                    break
+                chunk = await loop.run_in_executor(
+                    self.executor, next, iterator, None
+                )
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+    async def _events(self, receive, send):
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        disconnected = asyncio.Event()
+
+        def on_push():
+            # Called from the publishing thread
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+        subscriber = self.broker.subscribe(on_push)
+        watcher = asyncio.ensure_future(
+            _watch_disconnect(receive, disconnected, wake)
+        )
+        try:
+            await send(
+                {
+                    'type': 'http.response.start',
+                    'status': 200,
+                    'headers': EVENT_STREAM_HEADERS,
+                }
+            )
+            await self._send_event(send, RETRY_MESSAGE)
+            while not disconnected.is_set():
+                try:
+                    await asyncio.wait_for(wake.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    await self._send_event(send, KEEP_ALIVE_MESSAGE)
+                    continue
+                wake.clear()
+                messages = subscriber.pop(timeout=0)
+                if messages and not disconnected.is_set():
+                    await self._send_event(send, b''.join(messages))
+        finally:
+            watcher.cancel()
+            self.broker.unsubscribe(subscriber)
+
+    @staticmethod
+    async def _send_event(send, data: bytes):
+        await send(
+            {'type': 'http.response.body', 'body': data, 'more_body': True}
+        )
+
+
+def create_asgi_app(wsgi_app=None, **kwargs) -> AsgiBridge:
+    """Return the ASGI application serving ``wsgi_app``.
+
+    Parameters
+    ----------
+    wsgi_app : callable, optional
+        WSGI application. Defaults to the Karoloke Flask app.
+    **kwargs
+        Passed to :class:`AsgiBridge`.
+
+    Returns
+    -------
+    AsgiBridge
+        ASGI application, e.g. for ``uvicorn``.
+    """
+    if wsgi_app is None:
+        from karoloke.jukebox_router import app as wsgi_app
+    return AsgiBridge(wsgi_app, **kwargs)
@@ -0,0 +1,622 @@
+import os
+import threading
+import weakref
+from collections import deque
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from karoloke.catalog_store import CatalogStore, get_catalog_store
+from karoloke.settings import VIDEO_FORMATS
+
+# Changes remembered for changes_since(); older ones mean a full rescan
+CHANGE_LOG_SIZE = 4096
+
+
+class CatalogEntry(NamedTuple):
+    """A single video file known to the catalog.
+
+    Attributes
+    ----------
+    path : str
+        Absolute path to the video file.
+    size : int
+        File size in bytes at the time it was indexed.
+    ext : str
+        Lower-cased file extension, including the leading dot.
+    mtime_ns : int
+        File modification time, in nanoseconds.
+    """
+
+    path: str
+    size: int
+    ext: str
+    mtime_ns: int = 0
+
+
+class VideoCatalog:
+    """In-memory index of the videos available in a video directory.
+
+    The catalog maps a song number (the file basename without extension) to
+    every matching file found under ``video_dir``. Lookups are answered in
+    O(1) and follow the same resolution order used by the original
+    directory walk: the first extension in ``VIDEO_FORMATS`` wins and, for
+    the same extension, the first file found by ``os.walk`` wins.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory containing the video files.
+    formats : tuple[str, ...]
+        Supported video extensions, in resolution order.
+    store : CatalogStore, optional
+        Persistent store used to skip unchanged directories on start-up and
+        to record every change applied to the index.
+    """
+
+    def __init__(
+        self,
+        video_dir: str,
+        formats: tuple = VIDEO_FORMATS,
+        store: Optional[CatalogStore] = None,
+        notify: bool = True,
+    ):
+        self.video_dir = video_dir
+        self.formats = tuple(ext.lower() for ext in formats)
+        self.store = store
+        self.version = 0
+        self._lock = threading.RLock()
+        self._songs: Dict[str, Dict[str, List[CatalogEntry]]] = {}
+        self._dirs: Dict[str, Dict[str, CatalogEntry]] = {}
+        # (version, entries added or changed by that version)
+        self._changes: deque = deque(maxlen=CHANGE_LOG_SIZE)
+        self.build(notify=notify)
+
+    def build(self, notify: bool = True):
+        """Walk ``video_dir`` and rebuild the whole index.
+
+        When a store is attached, directories whose mtime matches the stored
+        one are restored from the store instead of being listed again, and
+        every directory that is listed is written back to it. Files rewritten
+        in place (which does not change the directory mtime) are picked up
+        by the catalog watcher while the app runs.
+
+        Parameters
+        ----------
+        notify : bool
+            If False, the catalog listeners are not called; the caller
+            notifies them once it is safe to (see :func:`get_catalog`).
+        """
+        root = self.video_dir
+        cached_dirs = self.store.load_dirs(root) if self.store else {}
+        cached_files = self.store.load_files(root) if self.store else {}
+        children: Dict[Optional[str], List[str]] = {}
+        for dirpath, (parent, _) in cached_dirs.items():
+            children.setdefault(parent, []).append(dirpath)
+
+        songs: Dict[str, Dict[str, List[CatalogEntry]]] = {}
+        dirs: Dict[str, Dict[str, CatalogEntry]] = {}
+        seen = set()
+        # Depth-first, files before subdirectories: same order as os.walk
+        pending = [root]
+        while pending:
+            dirpath = pending.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(dirpath)
+            cached = cached_dirs.get(dirpath)
+            if cached is not None and cached[1] == mtime:
+                entries = [
+                    CatalogEntry(
+                        path, size, os.path.splitext(path)[1].lower(), f_mtime
+                    )
+                    for path, size, f_mtime in cached_files.get(dirpath, [])
+                ]
+                subdirs = children.get(dirpath, [])
+            else:
+                entries, subdirs = self._list_directory(dirpath)
+                if self.store:
+                    self.store.save_directory(
+                        root, dirpath, mtime, self._rows(entries)
+                    )
+            for entry in entries:
+                song_num = os.path.splitext(os.path.basename(entry.path))[0]
+                songs.setdefault(song_num, {}).setdefault(
+                    entry.ext, []
+                ).append(entry)
+                dirs.setdefault(dirpath, {})[entry.path] = entry
+            pending.extend(reversed(subdirs))
+
+        if self.store:
+            for dirpath in set(cached_dirs) - seen:
+                self.store.delete_tree(dirpath)
+
+        with self._lock:
+            self._songs = songs
+            self._dirs = dirs
+            self.version += 1
+            # Everything may have changed: older versions need a rescan
+            self._changes.clear()
+        if notify:
+            _notify(self)
+
+    def _changed(self, entries: Tuple[CatalogEntry, ...]):
+        # Called with the lock held
+        self.version += 1
+        self._changes.append((self.version, entries))
+
+    def changes_since(
+        self, version: int
+    ) -> Tuple[int, Optional[List[CatalogEntry]]]:
+        """Return the entries added or changed after ``version``.
+
+        Returns
+        -------
+        tuple
+            The current version, and the entries, or None if the changes
+            are no longer known (call :meth:`entries` instead).
+        """
+        with self._lock:
+            if version >= self.version:
+                return self.version, []
+            if version < self.version - len(self._changes):
+                return self.version, None
+            changed = [
+                entry
+                for change_version, entries in self._changes
+                if change_version > version
+                for entry in entries
+            ]
+            return self.version, changed
+
+    @staticmethod
+    def _rows(entries: List[CatalogEntry]) -> List[Tuple[str, int, int]]:
+        return [(e.path, e.size, e.mtime_ns) for e in entries]
+
+    def _list_directory(
+        self, dirpath: str
+    ) -> Tuple[List[CatalogEntry], List[str]]:
+        entries: List[CatalogEntry] = []
+        subdirs: List[str] = []
+        with os.scandir(dirpath) as it:
+            for item in it:
+                try:
+                    # Like os.walk: linked folders may loop back up the tree
+                    if item.is_dir(follow_symlinks=False):
+                        subdirs.append(item.path)
+                        continue
+                    entry = self._make_entry(item.path, item.stat())
+                except OSError:
+                    continue
+                if entry is not None:
+                    entries.append(entry)
+        return entries, subdirs
+
+    def _make_entry(
+        self, path: str, stat: Optional[os.stat_result] = None
+    ) -> Optional[CatalogEntry]:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self.formats:
+            return None
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        return CatalogEntry(
+            path=path, size=stat.st_size, ext=ext, mtime_ns=stat.st_mtime_ns
+        )
+
+    def _insert(self, entry: CatalogEntry):
+        song_num = os.path.splitext(os.path.basename(entry.path))[0]
+        candidates = self._songs.setdefault(song_num, {}).setdefault(
+            entry.ext, []
+        )
+        for idx, current in enumerate(candidates):
+            if current.path == entry.path:
+                candidates[idx] = entry
+                break
+        else:
+            candidates.append(entry)
+        self._dirs.setdefault(os.path.dirname(entry.path), {})[
+            entry.path
+        ] = entry
+
+    def _discard(self, entry: CatalogEntry):
+        song_num = os.path.splitext(os.path.basename(entry.path))[0]
+        by_ext = self._songs.get(song_num, {})
+        candidates = by_ext.get(entry.ext, [])
+        by_ext[entry.ext] = [c for c in candidates if c.path != entry.path]
+        if not by_ext[entry.ext]:
+            del by_ext[entry.ext]
+        if not by_ext:
+            self._songs.pop(song_num, None)
+        dirpath = os.path.dirname(entry.path)
+        in_dir = self._dirs.get(dirpath, {})
+        in_dir.pop(entry.path, None)
+        if not in_dir:
+            self._dirs.pop(dirpath, None)
+
+    def add_file(self, path: str) -> bool:
+        """Add or refresh a single file in the index.
+
+        Parameters
+        ----------
+        path : str
+            Absolute path to the file.
+
+        Returns
+        -------
+        bool
+            True if the index changed.
+        """
+        entry = self._make_entry(path)
+        if entry is None:
+            return self.remove_file(path)
+        with self._lock:
+            current = self._dirs.get(os.path.dirname(path), {}).get(path)
+            if current == entry:
+                return False
+            self._insert(entry)
+            self._changed((entry,))
+        if self.store:
+            self.store.save_file(
+                self.video_dir, entry.path, entry.size, entry.mtime_ns
+            )
+        _notify(self)
+        return True
+
+    def remove_file(self, path: str) -> bool:
+        """Remove a single file from the index.
+
+        Parameters
+        ----------
+        path : str
+            Absolute path to the file.
+
+        Returns
+        -------
+        bool
+            True if the file was indexed and has been removed.
+        """
+        with self._lock:
+            entry = self._dirs.get(os.path.dirname(path), {}).get(path)
+            if entry is None:
+                return False
+            self._discard(entry)
+            self._changed(())
+        if self.store:
+            self.store.delete_file(path)
+        _notify(self)
+        return True
+
+    def remove_tree(self, dirpath: str) -> int:
+        """Remove every file indexed under ``dirpath``.
+
+        Parameters
+        ----------
+        dirpath : str
+            Absolute path of a directory that was deleted or moved away.
+
+        Returns
+        -------
+        int
+            Number of files removed from the index.
+        """
+        prefix = os.path.join(dirpath, '')
+        with self._lock:
+            doomed = [
+                entry
+                for path, in_dir in list(self._dirs.items())
+                if path == dirpath or path.startswith(prefix)
+                for entry in list(in_dir.values())
+            ]
+            for entry in doomed:
+                self._discard(entry)
+            if doomed:
+                self._changed(())
+        if self.store:
+            self.store.delete_tree(dirpath)
+        if doomed:
+            _notify(self)
+        return len(doomed)
+
+    def sync_directory(self, dirpath: str) -> List[str]:
+        """Reconcile the files directly inside ``dirpath`` with the disk.
+
+        Only ``dirpath`` itself is listed; subdirectories are returned so the
+        caller can decide whether they need to be visited.
+
+        Parameters
+        ----------
+        dirpath : str
+            Absolute path of the directory to reconcile.
+
+        Returns
+        -------
+        list[str]
+            Absolute paths of the subdirectories found in ``dirpath``.
+        """
+        try:
+            # Sample the mtime first so a concurrent change is seen next time
+            mtime = os.stat(dirpath).st_mtime_ns
+            entries, subdirs = self._list_directory(dirpath)
+        except OSError:
+            self.remove_tree(dirpath)
+            return []
+        found = {entry.path: entry for entry in entries}
+
+        with self._lock:
+            known = dict(self._dirs.get(dirpath, {}))
+            removed = False
+            added = []
+            for path, entry in known.items():
+                if path not in found:
+                    self._discard(entry)
+                    removed = True
+            for path, entry in found.items():
+                if known.get(path) != entry:
+                    self._insert(entry)
+                    added.append(entry)
+            changed = removed or bool(added)
+            if changed:
+                self._changed(tuple(added))
+        if self.store:
+            self.store.save_directory(
+                self.video_dir, dirpath, mtime, self._rows(entries)
+            )
+        if changed:
+            _notify(self)
+        return subdirs
+
+    def lookup(
+        self, song_num: str, non_empty: bool = False
+    ) -> Optional[CatalogEntry]:
+        """Resolve a song number to its catalog entry.
+
+        Parameters
+        ----------
+        song_num : str
+            Song number (file basename without extension).
+        non_empty : bool
+            If True, skip files whose size is zero.
+
+        Returns
+        -------
+        CatalogEntry or None
+            The first matching entry, or None if the song is not available.
+        """
+        rendition = _renditions.get(self.video_dir, {}).get(song_num)
+        if rendition is not None:
+            return rendition
+        with self._lock:
+            by_ext = self._songs.get(song_num)
+            if not by_ext:
+                return None
+            for ext in self.formats:
+                for entry in by_ext.get(ext, ()):
+                    if non_empty and entry.size <= 0:
+                        continue
+                    return entry
+        return None
+
+    def entries(self) -> Iterator[CatalogEntry]:
+        """Iterate over every indexed file, in no particular order."""
+        with self._lock:
+            snapshot = [
+                entry
+                for by_ext in self._songs.values()
+                for candidates in by_ext.values()
+                for entry in candidates
+            ]
+        return iter(snapshot)
+
+    def songs(self) -> Iterator[Tuple[str, CatalogEntry]]:
+        """Iterate over every song number and its resolved entry."""
+        with self._lock:
+            song_nums = list(self._songs)
+        # Songs only available as a transcoded rendition
+        song_nums += [
+            song_num
+            for song_num in _renditions.get(self.video_dir, {})
+            if song_num not in self._songs
+        ]
+        for song_num in song_nums:
+            entry = self.lookup(song_num)
+            if entry is not None:
+                yield song_num, entry
+
+    def files_in(self, dirpath: str) -> Dict[str, CatalogEntry]:
+        """Return the entries indexed directly inside ``dirpath``.
+
+        Parameters
+        ----------
+        dirpath : str
+            Absolute path of the directory.
+
+        Returns
+        -------
+        dict[str, CatalogEntry]
+            Mapping of absolute file path to its entry.
+        """
+        with self._lock:
+            return dict(self._dirs.get(dirpath, {}))
+
+    def file_count(self) -> int:
+        """Return the number of indexed files, duplicates included."""
+        with self._lock:
+            return sum(len(in_dir) for in_dir in self._dirs.values())
+
+    def __contains__(self, song_num: str) -> bool:
+        return self.lookup(song_num) is not None
+
+    def __len__(self) -> int:
+        renditions = _renditions.get(self.video_dir, {})
+        with self._lock:
+            return len(self._songs) + sum(
+                song_num not in self._songs for song_num in renditions
+            )
+
+    def is_rendition(self, entry: CatalogEntry) -> bool:
+        """Return True if ``entry`` is a transcoded rendition of a song."""
+        return entry.path in _rendition_songs.get(self.video_dir, {})
+
+
+_catalogs: Dict[str, VideoCatalog] = {}
+_catalogs_lock = threading.Lock()
+_listeners: List[Callable[[VideoCatalog], None]] = []
+# {video_dir: {song_num: entry}}; kept when catalogs are rebuilt
+_renditions: Dict[str, Dict[str, CatalogEntry]] = {}
+# {rendition path: song number} of the renditions above, for constant-time
+# is_rendition() and rendition_song()
+_rendition_songs: Dict[str, Dict[str, str]] = {}
+_renditions_lock = threading.Lock()
+
+
+def add_catalog_listener(callback: Callable[[VideoCatalog], None]):
+    """Call ``callback(catalog)`` whenever any catalog changes.
+
+    Callbacks run on the thread that changed the catalog (usually the
+    catalog watcher) and should return quickly.
+    """
+    _listeners.append(callback)
+
+
+def _notify(catalog: VideoCatalog):
+    for callback in list(_listeners):
+        callback(catalog)
+
+
+def get_catalog(video_dir: str) -> VideoCatalog:
+    """Return the shared catalog for ``video_dir``, building it if needed.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory containing the video files.
+
+    Returns
+    -------
+    VideoCatalog
+        The catalog instance shared by every caller using the same directory.
+    """
+    key = os.path.abspath(str(video_dir))
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is not None:
+            return catalog
+        catalog = VideoCatalog(key, store=get_catalog_store(), notify=False)
+        _catalogs[key] = catalog
+    # Listeners may call get_catalog again: notify without holding the lock
+    _notify(catalog)
+    return catalog
+
+
+def reset_catalog(video_dir: Optional[str] = None):
+    """Drop cached catalogs so the next lookup rebuilds them.
+
+    Parameters
+    ----------
+    video_dir : str, optional
+        Directory whose catalog should be dropped. If None, every cached
+        catalog is dropped.
+    """
+    with _catalogs_lock:
+        if video_dir is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(os.path.abspath(str(video_dir)), None)
+
+
+def rendition_song(video_dir: str, path: str) -> Optional[str]:
+    """Return the song number of the rendition stored at ``path``, if any."""
+    key = os.path.abspath(str(video_dir))
+    return _rendition_songs.get(key, {}).get(path)
+
+
+def register_rendition(
+    video_dir: str, song_num: str, entry: Optional[CatalogEntry]
+):
+    """Resolve ``song_num`` to a transcoded rendition of its video.
+
+    Renditions live outside ``video_dir`` (see :mod:`karoloke.transcoder`)
+    and take precedence over the original files of the song, which
+    browsers cannot play.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the catalog.
+    song_num : str
+        Song number the rendition belongs to.
+    entry : CatalogEntry or None
+        The rendition, or None to drop the registered one.
+    """
+    register_renditions(video_dir, {song_num: entry})
+
+
+def register_renditions(
+    video_dir: str, renditions: Dict[str, Optional[CatalogEntry]]
+):
+    """Register several renditions with a single catalog change.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the catalog.
+    renditions : dict[str, CatalogEntry or None]
+        Rendition of each song number, or None to drop the registered one.
+    """
+    key = os.path.abspath(str(video_dir))
+    with _renditions_lock:
+        # Copy on write: readers use the mappings without a lock
+        current = _renditions.get(key, {})
+        updated = dict(current)
+        for song_num, entry in renditions.items():
+            if entry is None:
+                updated.pop(song_num, None)
+            else:
+                updated[song_num] = entry
+        if updated == current:
+            return
+        _renditions[key] = updated
+        _rendition_songs[key] = {
+            entry.path: song_num for song_num, entry in updated.items()
+        }
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+    if catalog is not None:
+        with catalog._lock:
+            catalog._changed(())
+        _notify(catalog)
+
+
+class CatalogChanges:
+    """Entries changed in each catalog since the previous call.
+
+    Meant for catalog listeners that only care about new or modified
+    files: calling the tracker with the notified catalog returns what
+    changed since it last saw that catalog, or every entry the first time
+    (and when the change log no longer reaches back that far).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = weakref.WeakKeyDictionary()
+
+    def __call__(self, catalog: VideoCatalog) -> List[CatalogEntry]:
+        with self._lock:
+            version, changed = catalog.changes_since(
+                self._versions.get(catalog, 0)
+            )
+            self._versions[catalog] = version
+        if changed is None:
+            return list(catalog.entries())
+        return changed
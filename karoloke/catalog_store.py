@@ -0,0 +1,229 @@
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_root ON dirs (root);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probe INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_root ON files (root);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+"""
+
+
+class CatalogStore:
+    """SQLite persistence for the video catalog.
+
+    The store records every indexed file (path, size, mtime and the last
+    playability probe result) together with the mtime of each directory at
+    the time it was listed. On the next start, directories whose mtime did
+    not change are restored from the store without being listed again.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database file. Parent directories are created
+        if needed.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        pathlib.Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def load_dirs(self, root: str) -> Dict[str, Tuple[Optional[str], int]]:
+        """Return ``{dirpath: (parent, mtime_ns)}`` for every known directory.
+
+        Parameters
+        ----------
+        root : str
+            Catalog root directory.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, parent, mtime_ns FROM dirs WHERE root = ? '
+                'ORDER BY rowid',
+                (root,),
+            ).fetchall()
+        return {path: (parent, mtime) for path, parent, mtime in rows}
+
+    def load_files(self, root: str) -> Dict[str, List[Tuple[str, int, int]]]:
+        """Return ``{dirpath: [(path, size, mtime_ns), ...]}`` for ``root``.
+
+        Parameters
+        ----------
+        root : str
+            Catalog root directory.
+        """
+        files: Dict[str, List[Tuple[str, int, int]]] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT dir, path, size, mtime_ns FROM files WHERE root = ? '
+                'ORDER BY rowid',
+                (root,),
+            ).fetchall()
+        for dirpath, path, size, mtime in rows:
+            files.setdefault(dirpath, []).append((path, size, mtime))
+        return files
+
+    def save_directory(
+        self,
+        root: str,
+        dirpath: str,
+        mtime_ns: int,
+        files: Iterable[Tuple[str, int, int]],
+    ):
+        """Replace the stored listing of ``dirpath``.
+
+        Probe results of files whose size and mtime did not change are kept.
+
+        Parameters
+        ----------
+        root : str
+            Catalog root directory.
+        dirpath : str
+            Directory that was just listed.
+        mtime_ns : int
+            Directory mtime sampled *before* it was listed.
+        files : iterable of (path, size, mtime_ns)
+            Video files found directly inside ``dirpath``.
+        """
+        parent = None if dirpath == root else os.path.dirname(dirpath)
+        files = list(files)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO dirs (path, root, parent, mtime_ns) '
+                'VALUES (?, ?, ?, ?)',
+                (dirpath, root, parent, mtime_ns),
+            )
+            keep = {path for path, _, _ in files}
+            stale = [
+                (path,)
+                for (path,) in self._conn.execute(
+                    'SELECT path FROM files WHERE dir = ?', (dirpath,)
+                )
+                if path not in keep
+            ]
+            self._conn.executemany('DELETE FROM files WHERE path = ?', stale)
+            self._upsert(root, files)
+
+    def save_file(self, root: str, path: str, size: int, mtime_ns: int):
+        """Insert or refresh a single file without touching its directory."""
+        with self._lock, self._conn:
+            self._upsert(root, [(path, size, mtime_ns)])
+
+    def _upsert(self, root: str, files: List[Tuple[str, int, int]]):
+        self._conn.executemany(
+            'INSERT INTO files (path, root, dir, size, mtime_ns) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (path) DO UPDATE SET '
+            'size = excluded.size, mtime_ns = excluded.mtime_ns, '
+            'probe = CASE WHEN files.size = excluded.size '
+            'AND files.mtime_ns = excluded.mtime_ns '
+            'THEN files.probe ELSE NULL END',
+            [
+                (path, root, os.path.dirname(path), size, mtime)
+                for path, size, mtime in files
+            ],
+        )
+
+    def delete_file(self, path: str):
+        """Forget a single file."""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def delete_tree(self, dirpath: str):
+        """Forget ``dirpath``, its subdirectories and every file below it."""
+        prefix = os.path.join(dirpath, '')
+        with self._lock, self._conn:
+            for table, column in (('files', 'dir'), ('dirs', 'path')):
+                self._conn.execute(
+                    f'DELETE FROM {table} WHERE {column} = ? '
+                    f'OR substr({column}, 1, ?) = ?',
+                    (dirpath, len(prefix), prefix),
+                )
+
+    def load_probes(self, root: str) -> Dict[str, Tuple[int, int, bool]]:
+        """Return ``{path: (size, mtime_ns, playable)}`` for probed files.
+
+        Parameters
+        ----------
+        root : str
+            Catalog root directory.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, size, mtime_ns, probe FROM files '
+                'WHERE root = ? AND probe IS NOT NULL',
+                (root,),
+            ).fetchall()
+        return {
+            path: (size, mtime, bool(probe))
+            for path, size, mtime, probe in rows
+        }
+
+    def save_probes(self, results: Iterable[Tuple[str, int, int, bool]]):
+        """Record probe results for files whose size and mtime still match.
+
+        Parameters
+        ----------
+        results : iterable of (path, size, mtime_ns, playable)
+            Probe outcomes, usually written in batches.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE files SET probe = ? '
+                'WHERE path = ? AND size = ? AND mtime_ns = ?',
+                [
+                    (int(ok), path, size, mtime)
+                    for path, size, mtime, ok in results
+                ],
+            )
+
+
+_store: Optional[CatalogStore] = None
+
+
+def open_catalog_store(db_path: str) -> CatalogStore:
+    """Open the catalog store used by every catalog created afterwards.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database file.
+
+    Returns
+    -------
+    CatalogStore
+        The shared store.
+    """
+    global _store
+    if _store is None or _store.db_path != db_path:
+        _store = CatalogStore(db_path)
+    return _store
+
+
+def get_catalog_store() -> Optional[CatalogStore]:
+    """Return the shared catalog store, or None if persistence is disabled."""
+    return _store
@@ -0,0 +1,406 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import struct
+import sys
+import threading
+from typing import Dict, Optional
+
+from karoloke.catalog import VideoCatalog, get_catalog
+from karoloke.settings import CATALOG_POLL_INTERVAL, CATALOG_WATCHER
+
+# inotify event flags (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct('iIII')
+
+# Mount table read to find the filesystem of the video directory (Linux)
+MOUNTS = '/proc/mounts'
+# Filesystems where inotify misses changes made from other machines
+NETWORK_FILESYSTEMS = frozenset(
+    {
+        '9p',
+        'afs',
+        'ceph',
+        'cifs',
+        'fuse.sshfs',
+        'glusterfs',
+        'lustre',
+        'ncpfs',
+        'nfs',
+        'nfs4',
+        'smb3',
+        'smbfs',
+    }
+)
+
+
+def _load_inotify():
+    """Return libc if it exposes the inotify API, otherwise None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def filesystem_type(path: str) -> Optional[str]:
+    """Return the type of the filesystem holding ``path``, if known."""
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    try:
+        with open(MOUNTS) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        # Spaces and other special characters are octal escapes
+        mount_point = re.sub(
+            r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1]
+        )
+        prefix = mount_point.rstrip('/') + '/'
+        inside = path == mount_point or path.startswith(prefix)
+        # The last of stacked mounts on the same point is the visible one
+        if inside and len(mount_point) >= len(best):
+            best, fstype = mount_point, fields[2]
+    return fstype
+
+
+class PollingWatcher:
+    """Keep a catalog in sync by polling directory modification times.
+
+    Only directory ``stat`` calls are made on every tick. A directory is
+    listed again only when its mtime changes, which happens whenever a file
+    is created, deleted or renamed inside it. Files that were added recently
+    are re-checked until their size settles, so songs still being copied do
+    not stay indexed with a partial size.
+
+    Parameters
+    ----------
+    catalog : VideoCatalog
+        Catalog to keep up to date.
+    interval : float
+        Seconds between two polls.
+    """
+
+    name = 'poll'
+
+    def __init__(self, catalog: VideoCatalog, interval: float):
+        self.catalog = catalog
+        self.interval = interval
+        self._dir_mtimes: Dict[str, int] = {}
+        self._settling: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._track_tree(catalog.video_dir, sync=False)
+
+    def _track_tree(self, top: str, sync: bool = True):
+        pending = [top]
+        while pending:
+            dirpath = pending.pop()
+            try:
+                self._dir_mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+                if sync:
+                    pending.extend(self._sync(dirpath))
+                    continue
+                with os.scandir(dirpath) as it:
+                    pending.extend(
+                        item.path
+                        for item in it
+                        if item.is_dir(follow_symlinks=False)
+                    )
+            except OSError:
+                continue
+
+    def _sync(self, dirpath: str) -> list:
+        before = self.catalog.files_in(dirpath)
+        subdirs = self.catalog.sync_directory(dirpath)
+        for path, entry in self.catalog.files_in(dirpath).items():
+            if before.get(path) != entry:
+                self._settling[path] = entry.size
+        return subdirs
+
+    def poll_once(self):
+        """Apply the changes made since the previous poll."""
+        for path, size in list(self._settling.items()):
+            self.catalog.add_file(path)
+            entry = self.catalog.files_in(os.path.dirname(path)).get(path)
+            if entry is None or entry.size == size:
+                del self._settling[path]
+            else:
+                self._settling[path] = entry.size
+
+        for dirpath, mtime in list(self._dir_mtimes.items()):
+            if dirpath not in self._dir_mtimes:
+                continue
+            try:
+                current = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                self._forget_tree(dirpath)
+                continue
+            if current == mtime:
+                continue
+            self._dir_mtimes[dirpath] = current
+            for subdir in self._sync(dirpath):
+                if subdir not in self._dir_mtimes:
+                    self._track_tree(subdir)
+
+    def _forget_tree(self, dirpath: str):
+        prefix = os.path.join(dirpath, '')
+        for known in list(self._dir_mtimes):
+            if known == dirpath or known.startswith(prefix):
+                del self._dir_mtimes[known]
+        self.catalog.remove_tree(dirpath)
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+    def stop(self):
+        self._stop.set()
+
+
+class InotifyWatcher:
+    """Keep a catalog in sync with Linux inotify events.
+
+    Every directory under the catalog root gets its own watch. Create,
+    delete and rename events are applied to the catalog as single-file
+    deltas; a queue overflow triggers a full rebuild.
+
+    Parameters
+    ----------
+    catalog : VideoCatalog
+        Catalog to keep up to date.
+    libc : ctypes.CDLL
+        C library exposing the inotify API.
+
+    Raises
+    ------
+    OSError
+        If inotify cannot be initialized or the watch limit is reached.
+    """
+
+    name = 'inotify'
+
+    def __init__(self, catalog: VideoCatalog, libc):
+        self.catalog = catalog
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches: Dict[int, str] = {}
+        self._stop = threading.Event()
+        try:
+            self._watch_tree(catalog.video_dir)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch_tree(self, top: str):
+        for dirpath, _, _ in os.walk(top):
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(dirpath), _WATCH_MASK
+            )
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOENT:
+                    continue
+                raise OSError(err, os.strerror(err), dirpath)
+            self._watches[wd] = dirpath
+
+    def _unwatch_tree(self, top: str):
+        prefix = os.path.join(top, '')
+        for wd, dirpath in list(self._watches.items()):
+            if dirpath == top or dirpath.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def handle_events(self, data: bytes):
+        """Apply a buffer of raw inotify events to the catalog."""
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.catalog.build()
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            dirpath = self._watches.get(wd)
+            if dirpath is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if dirpath == self.catalog.video_dir:
+                    continue
+                self.catalog.remove_tree(dirpath)
+                continue
+
+            path = os.path.join(dirpath, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path)
+                    pending = [path]
+                    while pending:
+                        pending.extend(
+                            self.catalog.sync_directory(pending.pop())
+                        )
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._unwatch_tree(path)
+                    self.catalog.remove_tree(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE):
+                self.catalog.add_file(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.catalog.remove_file(path)
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                self.handle_events(data)
+        finally:
+            os.close(self._fd)
+
+    def stop(self):
+        self._stop.set()
+
+
+class CatalogWatcher:
+    """Background thread that applies filesystem deltas to a catalog.
+
+    Parameters
+    ----------
+    catalog : VideoCatalog
+        Catalog to keep up to date.
+    backend : str
+        ``'inotify'``, ``'poll'`` or ``'auto'``. ``'auto'`` uses inotify
+        where available and falls back to mtime polling otherwise, or when
+        the videos are on a network share (NFS, SMB...), where inotify
+        does not see files added from other machines.
+    interval : float
+        Seconds between two polls when the polling backend is used.
+    """
+
+    def __init__(
+        self,
+        catalog: VideoCatalog,
+        backend: str = CATALOG_WATCHER,
+        interval: float = CATALOG_POLL_INTERVAL,
+    ):
+        self.catalog = catalog
+        self._impl = None
+        if backend == 'auto' and (
+            filesystem_type(catalog.video_dir) in NETWORK_FILESYSTEMS
+        ):
+            backend = 'poll'
+        if backend in ('auto', 'inotify'):
+            libc = _load_inotify()
+            if libc is not None:
+                try:
+                    self._impl = InotifyWatcher(catalog, libc)
+                except OSError:
+                    self._impl = None
+        if self._impl is None:
+            self._impl = PollingWatcher(catalog, interval)
+        self._thread = threading.Thread(
+            target=self._impl.run, name='karoloke-catalog-watcher', daemon=True
+        )
+
+    @property
+    def backend(self) -> str:
+        """Name of the backend in use."""
+        return self._impl.name
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 2.0):
+        self._impl.stop()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+_watcher: Optional[CatalogWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def watch_catalog(video_dir: str) -> CatalogWatcher:
+    """Start watching ``video_dir``, replacing any running watcher.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory containing the video files.
+
+    Returns
+    -------
+    CatalogWatcher
+        The running watcher.
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            # Do not wait: the old thread exits on its next wake-up
+            _watcher.stop(timeout=0)
+        _watcher = CatalogWatcher(get_catalog(video_dir))
+        _watcher.start()
+        return _watcher
+
+
+def rewatch_catalog(video_dir: str) -> Optional[CatalogWatcher]:
+    """Move the running watcher to ``video_dir``, if one is running.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory containing the video files.
+
+    Returns
+    -------
+    CatalogWatcher or None
+        The new watcher, or None if no watcher was running.
+    """
+    if _watcher is None:
+        return None
+    return watch_catalog(video_dir)
@@ -0,0 +1,223 @@
+import os
+import struct
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+HEAD_BYTES = 4 * 1024
+# An Ogg page is at most 65307 bytes, so the last capture pattern is always
+# found within this distance from the end of a complete stream
+OGG_TAIL_BYTES = 64 * 1024
+# Atom headers read per file; fragmented MP4s have two atoms per fragment
+MAX_ATOMS = 1024
+
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+WEBM_EXTENSIONS = ('.webm', '.mkv')
+OGG_EXTENSIONS = ('.ogg', '.ogv')
+
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+MATROSKA_SEGMENT = b'\x18\x53\x80\x67'
+OGG_CAPTURE = b'OggS'
+MP4_TOP_LEVEL_ATOMS = {
+    b'ftyp',
+    b'moov',
+    b'mdat',
+    b'free',
+    b'skip',
+    b'wide',
+    b'uuid',
+    b'pdin',
+    b'moof',
+    b'mfra',
+    b'meta',
+    b'sidx',
+    b'styp',
+    b'pnot',
+}
+
+
+class Atom(NamedTuple):
+    """Header of a top-level MP4 (ISO BMFF) atom.
+
+    Attributes
+    ----------
+    kind : bytes
+        Four-character atom type, e.g. ``b'moov'``.
+    offset : int
+        Offset of the atom header from the start of the file.
+    size : int
+        Total atom size in bytes, header included.
+    """
+
+    kind: bytes
+    offset: int
+    size: int
+
+
+def iter_mp4_atoms(f: BinaryIO, file_size: int) -> Iterator[Atom]:
+    """Walk the top-level atoms of an MP4 file by reading headers only.
+
+    Only the 8 or 16 header bytes of each atom are read; atom payloads are
+    skipped with ``seek``, so the walk is cheap even on multi-GB files. The
+    walk stops after ``MAX_ATOMS`` atoms.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        File opened in binary mode.
+    file_size : int
+        Size of the file in bytes.
+
+    Yields
+    ------
+    Atom
+        Each top-level atom, in file order, up to ``MAX_ATOMS`` of them.
+
+    Raises
+    ------
+    ValueError
+        If an atom header is malformed or an atom extends past the end of
+        the file (a truncated file).
+    """
+    offset = 0
+    for _ in range(MAX_ATOMS):
+        if offset == file_size:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError(f'truncated atom header at offset {offset}')
+        size, kind = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                raise ValueError(f'truncated atom header at offset {offset}')
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            # The last atom may extend to the end of the file
+            size = file_size - offset
+        if size < header_size or not _is_fourcc(kind):
+            raise ValueError(f'malformed atom at offset {offset}')
+        if offset + size > file_size:
+            raise ValueError(f'atom {kind!r} extends past the end of file')
+        yield Atom(kind, offset, size)
+        offset += size
+
+
+def mp4_index_span(f: BinaryIO, file_size: int) -> Optional[Tuple[int, int]]:
+    """Return ``(offset, size)`` of a ``moov`` atom stored after ``mdat``.
+
+    Browsers need the ``moov`` index before the first frame, so for files
+    that were not "fast-started" they first have to fetch the end of the
+    file. Only atom headers are read (see :func:`iter_mp4_atoms`).
+
+    Parameters
+    ----------
+    f : BinaryIO
+        File opened in binary mode.
+    file_size : int
+        Size of the file in bytes.
+
+    Returns
+    -------
+    tuple or None
+        The span of the trailing ``moov`` atom, or None if the index comes
+        first or the file is not a valid MP4.
+    """
+    seen_mdat = False
+    try:
+        for atom in iter_mp4_atoms(f, file_size):
+            if atom.kind == b'mdat':
+                seen_mdat = True
+            elif atom.kind == b'moov':
+                return (atom.offset, atom.size) if seen_mdat else None
+    except ValueError:
+        pass
+    return None
+
+
+def _is_fourcc(kind: bytes) -> bool:
+    return all(32 <= byte < 127 for byte in kind)
+
+
+def _sniff_mp4(f: BinaryIO, file_size: int) -> Optional[bool]:
+    kinds = set()
+    walked = 0
+    try:
+        for atom in iter_mp4_atoms(f, file_size):
+            if not walked and atom.kind not in MP4_TOP_LEVEL_ATOMS:
+                return False
+            walked += 1
+            kinds.add(atom.kind)
+            if b'moov' in kinds and (b'mdat' in kinds or b'moof' in kinds):
+                # Enough to play; fragmented files may hold many more atoms
+                return True
+    except ValueError:
+        return False
+    # A walk cut short by MAX_ATOMS gives no verdict
+    return None if walked == MAX_ATOMS else False
+
+
+def _sniff_webm(head: bytes) -> bool:
+    if not head.startswith(EBML_MAGIC):
+        return False
+    if b'webm' not in head[:64] and b'matroska' not in head[:64]:
+        return False
+    return MATROSKA_SEGMENT in head
+
+
+def _sniff_ogg(head: bytes, f: BinaryIO, file_size: int) -> bool:
+    # Capture pattern followed by stream structure version 0
+    if not head.startswith(OGG_CAPTURE + b'\x00'):
+        return False
+    f.seek(max(file_size - OGG_TAIL_BYTES, 0))
+    return OGG_CAPTURE in f.read(OGG_TAIL_BYTES)
+
+
+def sniff_container(path: str) -> Optional[bool]:
+    """Cheaply check that a video file has a sane container structure.
+
+    Only the first few KB of the file are read (plus the 8-byte header of
+    each top-level atom for MP4, and the last page for Ogg), which is
+    enough to reject truncated and zero-filled files without spawning
+    ``ffprobe``:
+
+    - MP4: a valid top-level atom chain that fits in the file and holds
+      ``moov`` and ``mdat`` atoms (usually starting with ``ftyp``).
+    - WebM/Matroska: an EBML header with a ``webm``/``matroska`` doctype
+      followed by a Segment element.
+    - Ogg: the ``OggS`` capture pattern at the start and within the last
+      page of the file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the video file.
+
+    Returns
+    -------
+    bool or None
+        True if the header looks valid, False if the file is clearly broken,
+        None if the container format is not recognized by its extension or
+        an MP4 has too many atoms to tell.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in MP4_EXTENSIONS + WEBM_EXTENSIONS + OGG_EXTENSIONS:
+        return None
+
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            head = f.read(HEAD_BYTES)
+            # Zero-filled data (e.g. a preallocated, unfinished download);
+            # valid files may end with padding, and truncation is caught by
+            # the container checks below
+            if not head.strip(b'\x00'):
+                return False
+            if ext in MP4_EXTENSIONS:
+                return _sniff_mp4(f, file_size)
+            if ext in WEBM_EXTENSIONS:
+                return _sniff_webm(head)
+            return _sniff_ogg(head, f, file_size)
+    except OSError:
+        return False
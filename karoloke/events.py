@@ -0,0 +1,184 @@
+import itertools
+import json
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from karoloke.settings import EVENTS_HEARTBEAT
+
+RETRY_MESSAGE = b'retry: 3000\n\n'
+KEEP_ALIVE_MESSAGE = b': keep-alive\n\n'
+
+
+def format_event(event_id: int, name: str, data) -> bytes:
+    """Encode one Server-Sent Events message.
+
+    Parameters
+    ----------
+    event_id : int
+        Value of the ``id`` field.
+    name : str
+        Event name (the ``event`` field).
+    data : Any
+        JSON-serializable payload.
+
+    Returns
+    -------
+    bytes
+        The encoded message, terminated by a blank line.
+    """
+    payload = json.dumps(data, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {name}\ndata: {payload}\n\n'.encode()
+
+
+class Subscriber:
+    """Pending messages of one connected client.
+
+    Every event carries a full state snapshot (the whole queue, the song
+    being played, ...), so only the latest message of each event name is
+    kept: a slow or sleeping client never buffers more than one message per
+    event name, however many updates it missed.
+
+    Parameters
+    ----------
+    on_push : callable, optional
+        Called without arguments after each new message, e.g. to wake up an
+        asyncio task instead of a blocked thread.
+    """
+
+    def __init__(self, on_push: Optional[Callable[[], None]] = None):
+        self._cond = threading.Condition()
+        self._pending: Dict[str, bytes] = {}
+        self._on_push = on_push
+        self.closed = False
+
+    def push(self, name: str, message: bytes):
+        with self._cond:
+            # Re-inserting keeps the delivery order of the latest updates
+            self._pending.pop(name, None)
+            self._pending[name] = message
+            self._cond.notify()
+        if self._on_push is not None:
+            self._on_push()
+
+    def pop(self, timeout: Optional[float] = None) -> List[bytes]:
+        """Wait for messages and return them, oldest first.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum number of seconds to wait.
+
+        Returns
+        -------
+        list[bytes]
+            Pending messages; empty on timeout or once closed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self.closed, timeout)
+            messages = list(self._pending.values())
+            self._pending.clear()
+            return messages
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class EventBroker:
+    """Fan-out of state updates to Server-Sent Events clients.
+
+    A message is encoded once by :meth:`publish` and handed to every
+    subscriber without blocking the publisher. The latest message of each
+    event name is also kept, so new clients start with the current state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+        self._latest: Dict[str, bytes] = {}
+        self._ids = itertools.count(1)
+
+    def publish(self, name: str, data):
+        """Send ``data`` as a ``name`` event to every subscriber.
+
+        Parameters
+        ----------
+        name : str
+            Event name, e.g. ``'queue'``.
+        data : Any
+            JSON-serializable state snapshot.
+        """
+        with self._lock:
+            message = format_event(next(self._ids), name, data)
+            self._latest[name] = message
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(name, message)
+
+    def subscribe(
+        self, on_push: Optional[Callable[[], None]] = None
+    ) -> Subscriber:
+        """Register a client, primed with the latest message of each event.
+
+        Parameters
+        ----------
+        on_push : callable, optional
+            See :class:`Subscriber`.
+        """
+        subscriber = Subscriber(on_push)
+        with self._lock:
+            for name, message in self._latest.items():
+                subscriber.push(name, message)
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, heartbeat: float = EVENTS_HEARTBEAT) -> Iterator[bytes]:
+        """Subscribe and yield the SSE byte stream until the client leaves.
+
+        The subscription is only made once the stream is consumed, so a
+        client that disconnects before the first byte leaves nothing behind.
+        A comment line is sent after ``heartbeat`` idle seconds, which keeps
+        proxies from closing the connection and lets the server notice
+        clients that went away.
+
+        Parameters
+        ----------
+        heartbeat : float
+            Seconds between two keep-alive comments.
+
+        Yields
+        ------
+        bytes
+            Encoded messages.
+        """
+        subscriber = self.subscribe()
+        try:
+            # Reconnect quickly after a Wi-Fi hiccup
+            yield RETRY_MESSAGE
+            while not subscriber.closed:
+                messages = subscriber.pop(heartbeat)
+                if messages:
+                    yield b''.join(messages)
+                elif not subscriber.closed:
+                    yield KEEP_ALIVE_MESSAGE
+        finally:
+            self.unsubscribe(subscriber)
+
+
+_broker = EventBroker()
+
+
+def get_event_broker() -> EventBroker:
+    """Return the broker shared by the whole application."""
+    return _broker
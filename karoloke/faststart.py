@@ -0,0 +1,279 @@
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from karoloke.catalog import (
+    CatalogChanges,
+    CatalogEntry,
+    VideoCatalog,
+    add_catalog_listener,
+    get_catalog,
+    register_rendition,
+    register_renditions,
+)
+from karoloke.container_sniffer import MP4_EXTENSIONS, mp4_index_span
+from karoloke.media_jobs import (
+    MediaJobQueue,
+    discard_output,
+    get_job_store,
+    replace_output,
+    run_ffmpeg,
+)
+from karoloke.settings import TRANSCODE_DIR
+
+FASTSTART = 'faststart'
+SUFFIX = '.faststart.mp4'
+
+# Time-to-first-frame labels, see FaststartOptimizer.label()
+MOOV_AT_END = 'moov_at_end'
+OPTIMIZED = 'faststart'
+PROGRESSIVE = 'progressive'
+
+
+def find_trailing_index(path: str) -> Optional[Tuple[int, int]]:
+    """Return the span of the ``moov`` atom of ``path`` if it comes last.
+
+    Only atom headers are read, so this is cheap even on network shares.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return mp4_index_span(f, os.fstat(f.fileno()).st_size)
+    except OSError:
+        return None
+
+
+class FaststartOptimizer:
+    """Remux MP4s that keep their index after the media data.
+
+    Such files make the browser fetch the end of a multi-GB file before
+    the first frame. Every MP4 of the catalog is checked by walking its
+    atom headers; flagged files are remuxed with ``ffmpeg -c copy
+    -movflags +faststart`` (no re-encoding) on a low-priority
+    :class:`~karoloke.media_jobs.MediaJobQueue`. The copy is registered in
+    the catalog as a rendition of the song, so the player loads it instead
+    of the original.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the video library.
+    output_dir : str
+        Directory of the optimized copies.
+    ffmpeg : str or None
+        Path to the ``ffmpeg`` executable; None disables remuxing.
+    **kwargs
+        Passed to :class:`~karoloke.media_jobs.MediaJobQueue`.
+    """
+
+    def __init__(
+        self,
+        video_dir: str,
+        output_dir: str = TRANSCODE_DIR,
+        ffmpeg: Optional[str] = None,
+        **kwargs,
+    ):
+        self.video_dir = os.path.abspath(str(video_dir))
+        self.output_dir = output_dir
+        self.ffmpeg = ffmpeg
+        os.makedirs(output_dir, exist_ok=True)
+        self.jobs = MediaJobQueue({FASTSTART: self.optimize}, **kwargs)
+        self._lock = threading.Lock()
+        # Flagged files whose copy is not made yet: {path: moov size}
+        self._flagged: Dict[str, int] = {}
+
+    def schedule(
+        self,
+        entries: Iterable[CatalogEntry],
+        catalog: Optional[VideoCatalog] = None,
+    ) -> int:
+        """Check the MP4s among ``entries`` and remux the flagged ones.
+
+        Copies made by a previous run are registered again.
+
+        Parameters
+        ----------
+        entries : Iterable[CatalogEntry]
+            Catalog entries to check.
+        catalog : VideoCatalog, optional
+            Catalog of ``entries``; by default, the shared catalog of
+            ``video_dir``.
+
+        Returns
+        -------
+        int
+            Number of jobs scheduled.
+        """
+        if self.ffmpeg is None:
+            return 0
+        if catalog is None:
+            catalog = get_catalog(self.video_dir)
+        pending = []
+        renditions = {}
+        for entry in entries:
+            if entry.ext not in MP4_EXTENSIONS or entry.size <= 0:
+                continue
+            if catalog.is_rendition(entry):
+                continue
+            output = self.jobs.result(FASTSTART, entry)
+            if output is None:
+                pending.append(entry)
+                continue
+            rendition = self._rendition(catalog, entry, output)
+            if rendition is not None:
+                renditions[rendition[0]] = rendition[1]
+        # One catalog change for every copy, however many there are
+        if renditions:
+            register_renditions(self.video_dir, renditions)
+        return self.jobs.submit_many(FASTSTART, pending)
+
+    def optimize(self, entry: CatalogEntry) -> Optional[str]:
+        """Remux ``entry`` to fast-start layout if its index comes last.
+
+        Returns
+        -------
+        str or None
+            Path of the optimized copy, or None if ``entry`` is fine.
+
+        Raises
+        ------
+        RuntimeError
+            If the remux fails.
+        """
+        span = find_trailing_index(entry.path)
+        if span is None:
+            return None
+        with self._lock:
+            self._flagged[entry.path] = span[1]
+        song_num = os.path.splitext(os.path.basename(entry.path))[0]
+        key = f'{entry.path}\0{entry.size}\0{entry.mtime_ns}'.encode()
+        name = f'{song_num}-{hashlib.sha1(key).hexdigest()[:12]}{SUFFIX}'
+        output = os.path.join(self.output_dir, name)
+        part = output + '.part'
+        remuxed = run_ffmpeg(
+            [
+                self.ffmpeg,
+                '-nostdin',
+                '-v',
+                'error',
+                '-y',
+                '-i',
+                entry.path,
+                '-map',
+                '0',
+                '-c',
+                'copy',
+                '-movflags',
+                '+faststart',
+                '-f',
+                'mp4',
+                part,
+            ],
+            timeout=3600,
+        )
+        # A truncated remux has no moov at all: only trust ffmpeg's status
+        if not remuxed:
+            discard_output(part, f'ffmpeg failed to remux {entry.path}')
+        if os.path.isfile(part) and find_trailing_index(part) is not None:
+            discard_output(part, f'remux kept the index last in {entry.path}')
+        replace_output(part, output)
+        rendition = self._rendition(get_catalog(self.video_dir), entry, output)
+        if rendition is not None:
+            register_rendition(self.video_dir, *rendition)
+        with self._lock:
+            self._flagged.pop(entry.path, None)
+        return output
+
+    @staticmethod
+    def _rendition(
+        catalog: VideoCatalog, source: CatalogEntry, output: str
+    ) -> Optional[Tuple[str, CatalogEntry]]:
+        # (song number, entry) of the copy, unless another file wins
+        song_num = os.path.splitext(os.path.basename(source.path))[0]
+        current = catalog.lookup(song_num)
+        if current is not None and not (
+            current.path == source.path or current.path.endswith(SUFFIX)
+        ):
+            # Another file (or a transcoded rendition) already wins
+            return None
+        stat = os.stat(output)
+        rendition = CatalogEntry(
+            output, stat.st_size, '.mp4', stat.st_mtime_ns
+        )
+        return song_num, rendition
+
+    def label(self, path: str) -> str:
+        """Classify a served file for the time-to-first-frame report.
+
+        Returns
+        -------
+        str
+            ``'faststart'`` for an optimized copy, ``'moov_at_end'`` for a
+            flagged original, ``'progressive'`` otherwise.
+        """
+        outputs = self.jobs.outputs(FASTSTART)
+        if path in outputs.values():
+            return OPTIMIZED
+        with self._lock:
+            flagged = path in self._flagged
+        if flagged or path in outputs:
+            return MOOV_AT_END
+        return PROGRESSIVE
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of flagged files and of optimized copies."""
+        optimized = len(self.jobs.outputs(FASTSTART))
+        with self._lock:
+            waiting = len(self._flagged)
+        return {'flagged': optimized + waiting, 'optimized': optimized}
+
+
+_optimizer: Optional[FaststartOptimizer] = None
+_optimizer_lock = threading.Lock()
+
+
+def get_faststart_optimizer() -> Optional[FaststartOptimizer]:
+    """Return the running optimizer, or None if it was not started."""
+    return _optimizer
+
+
+def start_faststart(video_dir: str) -> bool:
+    """Check the MP4s of ``video_dir`` and keep optimizing new ones.
+
+    Existing videos are checked from a background thread, and new or
+    changed ones whenever the catalog changes. Jobs left unfinished by the
+    previous run are resumed.
+
+    Returns
+    -------
+    bool
+        False if ffmpeg is not installed.
+    """
+    global _optimizer
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return False
+    with _optimizer_lock:
+        if _optimizer is None:
+            _optimizer = FaststartOptimizer(
+                video_dir, ffmpeg=ffmpeg, store=get_job_store()
+            )
+            _optimizer.jobs.resume()
+    optimizer = _optimizer
+
+    changes = CatalogChanges()
+
+    def on_catalog_change(catalog):
+        # Only new or modified files: registering copies changes the
+        # catalog too, but adds no entries
+        if catalog.video_dir == optimizer.video_dir:
+            optimizer.schedule(changes(catalog), catalog)
+
+    add_catalog_listener(on_catalog_change)
+    threading.Thread(
+        target=lambda: on_catalog_change(get_catalog(video_dir)),
+        name='karoloke-faststart',
+        daemon=True,
+    ).start()
+    return True
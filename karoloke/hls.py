@@ -0,0 +1,322 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from karoloke.catalog import CatalogEntry
+from karoloke.media_jobs import run_ffmpeg
+from karoloke.settings import (
+    HLS_DIR,
+    HLS_MAX_BYTES,
+    HLS_SEGMENT_SECONDS,
+    HLS_VARIANTS,
+)
+
+logger = logging.getLogger(__name__)
+
+MASTER_PLAYLIST = 'master.m3u8'
+PART_SUFFIX = '.part'
+# mimetypes maps .ts to Qt translation files
+MIMETYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
+# Time-to-first-frame label of the songs played through HLS
+HLS = 'hls'
+
+
+def package_name(entry: CatalogEntry) -> str:
+    """Return the directory name of the HLS package of ``entry``."""
+    song_num = os.path.splitext(os.path.basename(entry.path))[0]
+    key = f'{entry.path}\0{entry.size}\0{entry.mtime_ns}'.encode()
+    return f'{song_num}-{hashlib.sha1(key).hexdigest()[:12]}'
+
+
+def master_playlist(variants: Sequence[Tuple[int, int, int]]) -> str:
+    """Return the master playlist listing one media playlist per variant.
+
+    Parameters
+    ----------
+    variants : Sequence[tuple]
+        ``(height, video_kbps, audio_kbps)`` of each variant.
+    """
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for index, (height, video_kbps, audio_kbps) in enumerate(variants):
+        # Peak rate: the encoder may exceed the average by ~10%
+        bandwidth = int((video_kbps * 1.1 + audio_kbps) * 1000)
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},'
+            f'AVERAGE-BANDWIDTH={(video_kbps + audio_kbps) * 1000},'
+            f'NAME="{height}p"'
+        )
+        lines.append(f'v{index}/index.m3u8')
+    return '\n'.join(lines) + '\n'
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class HlsPackager:
+    """Multi-bitrate HLS packages of the songs about to be played.
+
+    Packaging is lazy: only songs given to :meth:`schedule` (the head of
+    the queue) are packaged, one at a time in a background thread, with one
+    low-priority ffmpeg run per variant. A package is written to a
+    ``.part`` directory and renamed once every variant is complete.
+    Packages take at most ``max_bytes``; the least recently played ones
+    are evicted first.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the packages.
+    ffmpeg : str or None
+        Path to the ``ffmpeg`` executable; None disables packaging.
+    variants : Sequence[tuple]
+        ``(height, video_kbps, audio_kbps)`` of each variant.
+    max_bytes : int
+        Size budget of the packages.
+    segment_seconds : int
+        Target segment duration.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = HLS_DIR,
+        ffmpeg: Optional[str] = None,
+        variants: Sequence[Tuple[int, int, int]] = HLS_VARIANTS,
+        max_bytes: int = HLS_MAX_BYTES,
+        segment_seconds: int = HLS_SEGMENT_SECONDS,
+    ):
+        self.output_dir = output_dir
+        self.ffmpeg = ffmpeg
+        self.variants = tuple(variants)
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        self._lock = threading.Condition()
+        self._packages: OrderedDict = OrderedDict()
+        self._used = 0
+        self._pending: List[CatalogEntry] = []
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(output_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for entry in os.scandir(self.output_dir):
+            if not entry.is_dir():
+                continue
+            if entry.name.endswith(PART_SUFFIX):
+                # Packaging interrupted by a previous shutdown
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            found.append((entry.stat().st_ctime, entry.name, entry.path))
+        for _, name, path in sorted(found):
+            size = _tree_size(path)
+            self._packages[name] = size
+            self._used += size
+
+    def lookup(self, entry: CatalogEntry) -> Optional[str]:
+        """Return the package directory of ``entry``, if packaged."""
+        name = package_name(entry)
+        with self._lock:
+            if name not in self._packages:
+                return None
+            self._packages.move_to_end(name)
+        return os.path.join(self.output_dir, name)
+
+    def schedule(self, entries: Sequence[CatalogEntry]):
+        """Package ``entries`` in the background, in order.
+
+        A newer call replaces entries that were not packaged yet, since
+        only the current head of the queue matters.
+        """
+        if self.ffmpeg is None:
+            return
+        with self._lock:
+            self._pending = [
+                entry
+                for entry in entries
+                if package_name(entry) not in self._packages
+            ]
+            if not self._pending:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='karoloke-hls', daemon=True
+                )
+                self._thread.start()
+            self._lock.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every scheduled song has been packaged."""
+        with self._lock:
+            return self._lock.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._pending)
+                entry = self._pending.pop(0)
+                self._busy = True
+            try:
+                self.package(entry)
+            except Exception:
+                # Keep packaging the next songs; the player uses /video
+                logger.exception('HLS packaging of %s failed', entry.path)
+            finally:
+                with self._lock:
+                    self._busy = False
+                    self._lock.notify_all()
+
+    def variant_command(
+        self, entry: CatalogEntry, index: int, target: str
+    ) -> List[str]:
+        """Return the ffmpeg command line writing variant ``index``."""
+        height, video_kbps, audio_kbps = self.variants[index]
+        variant_dir = os.path.join(target, f'v{index}')
+        seconds = self.segment_seconds
+        return [
+            self.ffmpeg,
+            '-nostdin',
+            '-v',
+            'error',
+            '-y',
+            '-i',
+            entry.path,
+            '-map',
+            '0:v:0',
+            '-map',
+            '0:a:0?',
+            '-vf',
+            f'scale=-2:{height}',
+            '-c:v',
+            'libx264',
+            '-preset',
+            'veryfast',
+            '-pix_fmt',
+            'yuv420p',
+            '-b:v',
+            f'{video_kbps}k',
+            '-maxrate',
+            f'{int(video_kbps * 1.1)}k',
+            '-bufsize',
+            f'{video_kbps * 2}k',
+            # Aligned keyframes let the player switch variants per segment
+            '-force_key_frames',
+            f'expr:gte(t,n_forced*{seconds})',
+            '-c:a',
+            'aac',
+            '-b:a',
+            f'{audio_kbps}k',
+            '-ac',
+            '2',
+            '-f',
+            'hls',
+            '-hls_time',
+            str(seconds),
+            '-hls_playlist_type',
+            'vod',
+            '-hls_segment_filename',
+            os.path.join(variant_dir, 'seg_%05d.ts'),
+            os.path.join(variant_dir, 'index.m3u8'),
+        ]
+
+    def package(self, entry: CatalogEntry) -> Optional[str]:
+        """Package ``entry`` now, unless it is already packaged.
+
+        Returns
+        -------
+        str or None
+            The package directory, or None if ffmpeg failed.
+        """
+        existing = self.lookup(entry)
+        if existing is not None:
+            return existing
+        name = package_name(entry)
+        target = os.path.join(self.output_dir, name)
+        part = target + PART_SUFFIX
+        shutil.rmtree(part, ignore_errors=True)
+        for index in range(len(self.variants)):
+            os.makedirs(os.path.join(part, f'v{index}'))
+            command = self.variant_command(entry, index, part)
+            playlist = command[-1]
+            if not run_ffmpeg(command, timeout=3600) or not os.path.isfile(
+                playlist
+            ):
+                shutil.rmtree(part, ignore_errors=True)
+                return None
+        with open(os.path.join(part, MASTER_PLAYLIST), 'w') as f:
+            f.write(master_playlist(self.variants))
+        os.replace(part, target)
+        size = _tree_size(target)
+        with self._lock:
+            self._packages[name] = size
+            self._used += size
+            self._evict(keep=name)
+        return target
+
+    def _evict(self, keep: str):
+        # Called with the lock held
+        for name in list(self._packages):
+            if self._used <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(
+                os.path.join(self.output_dir, name), ignore_errors=True
+            )
+            self._used -= self._packages.pop(name)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number and total size of the packages."""
+        with self._lock:
+            return {
+                'packages': len(self._packages),
+                'used_bytes': self._used,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_packager: Optional[HlsPackager] = None
+_packager_lock = threading.Lock()
+
+
+def open_hls_packager(**kwargs) -> Optional[HlsPackager]:
+    """Enable HLS packaging of the queued songs.
+
+    Returns
+    -------
+    HlsPackager or None
+        The shared packager, or None if ffmpeg is not installed.
+    """
+    global _packager
+    ffmpeg = kwargs.pop('ffmpeg', shutil.which('ffmpeg'))
+    if ffmpeg is None:
+        return None
+    with _packager_lock:
+        if _packager is None:
+            _packager = HlsPackager(ffmpeg=ffmpeg, **kwargs)
+        return _packager
+
+
+def get_hls_packager() -> Optional[HlsPackager]:
+    """Return the shared packager, or None if HLS is disabled."""
+    return _packager
+
+
+def close_hls_packager():
+    """Disable HLS packaging (packages are kept on disk)."""
+    global _packager
+    _packager = None
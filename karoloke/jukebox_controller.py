@@ -1,9 +1,82 @@
+import functools
+import hashlib
+import io
 import os
 import random
+import threading
+from typing import Optional, Tuple
 
-from flask import session
+import qrcode
 
-from karoloke.settings import VIDEO_FORMATS
+from karoloke.catalog import get_catalog
+from karoloke.probe_cache import get_probe_cache
+from karoloke.queue_store import get_song_queue
+from karoloke.settings import RENDITION_PREFIX
+from karoloke.streaming import video_mimetype
+from karoloke.utils import file_signature, load_playlist
+
+_playlist_views: dict = {}
+_playlist_views_lock = threading.Lock()
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+_listings: dict = {}
+_listings_lock = threading.Lock()
+
+
+def _cached_listing(path: str, kind: str, build) -> Optional[tuple]:
+    """Return ``build(path)``, reused until the directory mtime changes.
+
+    Adding, removing or renaming an entry updates the mtime of its
+    directory, so a single ``stat`` is enough to tell whether the cached
+    listing is still valid.
+
+    Parameters
+    ----------
+    path : str
+        Directory to list.
+    kind : str
+        Name of the listing, so that several listings of one directory
+        can be cached side by side.
+    build : callable
+        Function returning the listing of ``path``.
+
+    Returns
+    -------
+    tuple or None
+        The listing, or None if the directory does not exist.
+    """
+    try:
+        # Sampled before listing, so a concurrent change is seen next time
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    key = (path, kind)
+    with _listings_lock:
+        cached = _listings.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    listing = tuple(build(path))
+    with _listings_lock:
+        _listings[key] = (mtime, listing)
+    return listing
+
+
+def _list_subfolders(background_dir: str) -> list:
+    return [
+        f
+        for f in os.listdir(background_dir)
+        if os.path.isdir(os.path.join(background_dir, f))
+        and not f.startswith('.')
+    ]
+
+
+def _list_images(folder_path: str) -> list:
+    return [
+        f
+        for f in os.listdir(folder_path)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    ]
 
 
 def get_background_subfolders(background_dir: str) -> list[str]:
@@ -19,15 +92,11 @@ def get_background_subfolders(background_dir: str) -> list[str]:
     list[str]
         List of subfolder names
     """
-    if not os.path.exists(background_dir):
+    listing = _cached_listing(background_dir, 'subfolders', _list_subfolders)
+    if listing is None:
         return ['default']
 
-    subfolders = [
-        f
-        for f in os.listdir(background_dir)
-        if os.path.isdir(os.path.join(background_dir, f))
-        and not f.startswith('.')
-    ]
+    subfolders = list(listing)
 
     # Ensure 'default' is always first if it exists
     if 'default' in subfolders:
@@ -59,27 +128,12 @@ def validate_song_for_queue(song_num: str, video_dir: str) -> dict:
         - 'valid' (bool): Whether song is valid
         - 'reason' (str): Reason if invalid
     """
-    # Check if song is already in queue
-    queue = session.get('queue', [])
-    if song_num in queue:
+    # Check if song is already in the shared queue (set lookup)
+    if song_num in get_song_queue():
         return {'valid': False, 'reason': 'duplicate'}
 
-    # Check if video file exists and has supported format
-    video_file = None
-    for ext in VIDEO_FORMATS:
-        candidate = f'{song_num}{ext}'
-        for root, _, files in os.walk(video_dir):
-            if candidate in files:
-                video_path = os.path.join(root, candidate)
-                # Check file size is greater than 0
-                try:
-                    if os.path.getsize(video_path) > 0:
-                        video_file = video_path
-                        break
-                except (OSError, IOError):
-                    continue
-        if video_file:
-            break
+    # Check if video file exists, has supported format and size > 0
+    video_file = get_catalog(video_dir).lookup(song_num, non_empty=True)
 
     if not video_file:
         return {'valid': False, 'reason': 'error'}
@@ -92,6 +146,9 @@ def get_background_img(
 ):
     """Get a random background image from the specified subfolder.
 
+    The image names of each folder are cached until the folder changes, so
+    picking a background does not list the directory on every page render.
+
     Parameters
     ----------
     background_dir : str
@@ -114,16 +171,7 @@ def get_background_img(
             folder_path = background_dir
             subfolder = ''
 
-    if not os.path.exists(folder_path):
-        raise FileNotFoundError(
-            "No background images found in the 'background' directory."
-        )
-
-    images = [
-        f
-        for f in os.listdir(folder_path)
-        if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif'))
-    ]
+    images = _cached_listing(folder_path, 'images', _list_images)
     if not images:
         raise FileNotFoundError(
             "No background images found in the 'background' directory."
@@ -136,21 +184,166 @@ def get_background_img(
         return random.choice(images)
 
 
+def video_relpath(catalog, entry) -> str:
+    """Return the path of ``entry`` as served by the ``/video`` route.
+
+    Files of the catalog are relative to its video directory; transcoded
+    renditions live in ``TRANSCODE_DIR`` and are served under
+    ``RENDITION_PREFIX``.
+    """
+    if catalog.is_rendition(entry):
+        return f'{RENDITION_PREFIX}/{os.path.basename(entry.path)}'
+    return os.path.relpath(entry.path, catalog.video_dir)
+
+
 def get_video_file(song_num, video_dir):
-    video_file = None
-    for ext in VIDEO_FORMATS:
-        candidate = f'{song_num}{ext}'
-        # Recursively search for candidate in video_dir and subdirectories
-        for root, _, files in os.walk(video_dir):
-            if candidate in files:
-                video_file = os.path.relpath(
-                    os.path.join(root, candidate), video_dir
-                )
-                break
-        if video_file:
-            break
-
-    if video_file:
-        # Return the relative path from video_dir
-        return video_file
-    return None
+    """Resolve a song number to its video file.
+
+    The lookup is answered by the shared in-memory catalog of ``video_dir``,
+    so no directory walk happens per call.
+
+    Parameters
+    ----------
+    song_num : str
+        Song number (video basename without extension)
+    video_dir : str
+        Path to video directory
+
+    Returns
+    -------
+    str or None
+        Path to the video file relative to ``video_dir``, or None if the
+        song is not available.
+    """
+    catalog = get_catalog(video_dir)
+    entry = catalog.lookup(song_num)
+    if entry is None:
+        return None
+    # Return the relative path from video_dir
+    return video_relpath(catalog, entry)
+
+
+def get_video_details(song_num, video_dir) -> Optional[dict]:
+    """Resolve a song number to its video file, size and MIME type.
+
+    Lets the player announce the next video (e.g. with a preload link)
+    before it navigates to it.
+
+    Parameters
+    ----------
+    song_num : str
+        Song number (video basename without extension)
+    video_dir : str
+        Path to video directory
+
+    Returns
+    -------
+    dict or None
+        ``{'video', 'size', 'mimetype'}``, where ``video`` is the path
+        relative to ``video_dir`` as returned by :func:`get_video_file`, or
+        None if the song is not available.
+    """
+    catalog = get_catalog(video_dir)
+    entry = catalog.lookup(song_num)
+    if entry is None:
+        return None
+    return {
+        'video': video_relpath(catalog, entry),
+        'size': entry.size,
+        'mimetype': video_mimetype(entry.path),
+    }
+
+
+def get_playlist_view(playlist_path: str, video_dir: str) -> dict:
+    """Join the playlist JSON against the video catalog.
+
+    The result is memoized and only rebuilt when the playlist file changes
+    (mtime or size), when the catalog changes, or when new probe results
+    arrive, so paging through the song book is a cheap slice.
+
+    Parameters
+    ----------
+    playlist_path : str
+        Path to the playlist JSON file
+    video_dir : str
+        Path to video directory
+
+    Returns
+    -------
+    dict
+        View dict with keys:
+        - 'items' (list): Playlist rows whose video is available, in file
+          order. Rows still being probed carry ``pending=True``.
+        - 'ok_count' (int): Number of rows with a validated video
+        - 'pending_count' (int): Number of rows still being probed
+        - 'error_count' (int): Duplicates, broken videos and missing videos
+    """
+    catalog = get_catalog(video_dir)
+    probes = get_probe_cache(video_dir)
+    cache_key = (playlist_path, catalog.video_dir)
+    version = (
+        file_signature(playlist_path),
+        catalog.version,
+        probes.version,
+    )
+    with _playlist_views_lock:
+        cached = _playlist_views.get(cache_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    current_playlist = load_playlist(playlist_path)
+
+    # Resolve available videos from the catalog (first extension wins) and
+    # serve probe results from the cache; unknown files are probed in the
+    # background and listed as pending meanwhile
+    valid_videos = {}
+    scan_errors = catalog.file_count() - len(catalog)  # duplicate basenames
+    for basename, entry in catalog.songs():
+        playable = probes.status(entry)
+        if playable is False:
+            scan_errors += 1
+        else:
+            valid_videos[basename] = playable is None
+
+    # Filter playlist entries to those with valid (or pending) videos
+    items = []
+    pending_count = 0
+    for row in current_playlist:
+        pending = valid_videos.get(row.get('filename'))
+        if pending is None:
+            continue
+        if pending:
+            pending_count += 1
+            row = dict(row, pending=True)
+        items.append(row)
+    missing_errors = len(current_playlist) - len(items)
+
+    view = {
+        'items': items,
+        'ok_count': len(items) - pending_count,
+        'pending_count': pending_count,
+        'error_count': scan_errors + missing_errors,
+    }
+    with _playlist_views_lock:
+        _playlist_views[cache_key] = (version, view)
+    return view
+
+
+@functools.lru_cache(maxsize=16)
+def render_qr_png(url: str) -> Tuple[bytes, str]:
+    """Render the QR code of ``url`` as a PNG, once per URL.
+
+    Parameters
+    ----------
+    url : str
+        Text encoded in the QR code.
+
+    Returns
+    -------
+    tuple[bytes, str]
+        The PNG image and an ETag derived from its content.
+    """
+    buf = io.BytesIO()
+    qrcode.make(url).save(buf, 'PNG')
+    png = buf.getvalue()
+    return png, hashlib.sha1(png).hexdigest()
@@ -1,34 +1,69 @@
-import io
-import json
 import math
 import os
-import socket
+import threading
+from urllib.parse import unquote
 
-import qrcode
 from flask import (
     Flask,
+    abort,
     render_template,
     request,
     send_from_directory,
     session,
     url_for,
 )
-
+from werkzeug.security import safe_join
+
+from karoloke.asgi import ASGI_ENVIRON_KEY
+from karoloke.catalog import (
+    add_catalog_listener,
+    get_catalog,
+    rendition_song,
+    reset_catalog,
+)
+from karoloke.catalog_watcher import rewatch_catalog
+from karoloke.events import get_event_broker
+from karoloke.faststart import (
+    MOOV_AT_END,
+    OPTIMIZED,
+    PROGRESSIVE,
+    get_faststart_optimizer,
+)
+from karoloke.hls import HLS, MASTER_PLAYLIST, MIMETYPES, get_hls_packager
 from karoloke.jukebox_controller import (
     get_background_img,
     get_background_subfolders,
+    get_playlist_view,
+    get_video_details,
     get_video_file,
+    render_qr_png,
     validate_song_for_queue,
 )
+from karoloke.metrics import get_metrics
+from karoloke.network import get_local_address
+from karoloke.prefetcher import Prefetcher
+from karoloke.previews import get_previews
+from karoloke.probe_cache import get_probe_cache
+from karoloke.queue_store import get_song_queue
+from karoloke.search import get_fuzzy_index, get_search_index
 from karoloke.settings import (
     BACKGROUND_DIR,
+    BACKGROUND_MAX_AGE,
+    EVENTS_WSGI_STREAMS,
+    HLS_DEPTH,
     PLAYER_TEMPLATE,
+    RENDITION_PREFIX,
     SETTINGS_TEMPLATE,
+    TRANSCODE_DIR,
+    TTFF_MAX_MS,
+    VIDEO_CACHE_DEPTH,
     VIDEO_DIR,
-    VIDEO_FORMATS,
+    VIDEO_MAX_AGE,
     VIDEO_PATH_SETUP_TEMPLATE,
 )
-from karoloke.utils import collect_playlist, is_playable
+from karoloke.streaming import send_video
+from karoloke.utils import load_playlist
+from karoloke.video_cache import get_video_cache
 
 app = Flask(__name__)
 app.secret_key = (
@@ -38,22 +73,97 @@ app.secret_key = (
 playlist_path = os.path.join(
     os.path.dirname(__file__), 'static', 'playlist.json'
 )
-try:
-    with open(playlist_path, 'r') as f:
-        playlist_data = json.load(f)
-except (FileNotFoundError, json.JSONDecodeError):
-    # If the file doesn't exist or is invalid, start with an empty playlist.
-    # This makes the app more resilient.
-    playlist_data = []
+# If the file doesn't exist or is invalid, start with an empty playlist.
+# This makes the app more resilient.
+playlist_data = load_playlist(playlist_path)
+
+
+def publish_queue_change(song_queue, change):
+    """Push queue and now-playing changes to the /events clients."""
+    broker = get_event_broker()
+    if change == 'queue':
+        broker.publish(
+            'queue',
+            {'queue': song_queue.songs(), 'version': song_queue.version},
+        )
+    else:
+        broker.publish(
+            'now_playing',
+            {'song': song_queue.current_song, 'version': song_queue.version},
+        )
+
+
+def publish_catalog_change(catalog):
+    """Push the song count of the active video directory to /events."""
+    if catalog.video_dir != os.path.abspath(str(VIDEO_DIR)):
+        return
+    get_event_broker().publish(
+        'catalog', {'songs': len(catalog), 'version': catalog.version}
+    )
+
+
+prefetcher = Prefetcher(
+    lambda song_num: get_catalog(VIDEO_DIR).lookup(song_num, non_empty=True)
+)
+
+
+def prefetch_queue_head(song_queue, change):
+    """Warm the page cache with the songs about to be played."""
+    if change == 'queue':
+        prefetcher.schedule(song_queue.songs())
+
+
+def cache_queue_head(song_queue, change):
+    """Copy the songs about to be played to the local video cache."""
+    cache = get_video_cache()
+    if cache is None or change != 'queue':
+        return
+    catalog = get_catalog(VIDEO_DIR)
+    entries = []
+    for song_num in song_queue.songs()[:VIDEO_CACHE_DEPTH]:
+        entry = catalog.lookup(song_num, non_empty=True)
+        if entry is not None:
+            entries.append(entry)
+    cache.schedule(entries)
+
+
+def package_queue_head(song_queue, change):
+    """Package the songs about to be played as multi-bitrate HLS."""
+    packager = get_hls_packager()
+    if packager is None or change != 'queue':
+        return
+    catalog = get_catalog(VIDEO_DIR)
+    entries = []
+    for song_num in song_queue.songs()[:HLS_DEPTH]:
+        entry = catalog.lookup(song_num, non_empty=True)
+        if entry is not None:
+            entries.append(entry)
+    packager.schedule(entries)
+
+
+def hls_url(song_num):
+    """Return the master playlist URL of a song, once it is packaged."""
+    packager = get_hls_packager()
+    entry = get_catalog(VIDEO_DIR).lookup(song_num, non_empty=True)
+    if packager is None or entry is None:
+        return None
+    package = packager.lookup(entry)
+    if package is None:
+        return None
+    # The package name changes with the video, so its files can be cached
+    return url_for('hls', song_num=song_num, version=os.path.basename(package))
+
+
+get_song_queue().add_listener(publish_queue_change)
+get_song_queue().add_listener(prefetch_queue_head)
+get_song_queue().add_listener(cache_queue_head)
+get_song_queue().add_listener(package_queue_head)
+add_catalog_listener(publish_catalog_change)
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     # Initialize session variables if not present
-    if 'queue' not in session:
-        session['queue'] = []
-        session['current_song'] = None
-        session.modified = True
     if 'background_folder' not in session:
         session['background_folder'] = 'default'
         session.modified = True
@@ -65,7 +175,8 @@ def index():
     current_song = None
     queue_position = None
     queue_length = None
-    queue = session.get('queue', [])
+    song_queue = get_song_queue()
+    queue = song_queue.songs()
 
     if request.method == 'POST':
         song_num = request.form.get('song')
@@ -80,8 +191,7 @@ def index():
             video = get_video_file(song_num, VIDEO_DIR)
             if video:
                 current_song = song_num
-                session['current_song'] = song_num
-                session.modified = True
+                song_queue.play(song_num)
 
     # Calculate queue position if video is playing
     if current_song and queue:
@@ -89,13 +199,15 @@ def index():
             queue_position = queue.index(current_song) + 1
             queue_length = len(queue)
 
-    total_videos = len(collect_playlist(VIDEO_DIR))
+    # Number of distinct songs, kept up to date by the catalog
+    total_videos = len(get_catalog(VIDEO_DIR))
     playlist_url = url_for('playlist')
     playlist_qr_url = url_for('playlist_qr')
     return render_template(
         PLAYER_TEMPLATE,
         bg_img=bg_img,
         video=video,
+        hls=hls_url(current_song) if video else None,
         current_song=current_song,
         queue_position=queue_position,
         queue_length=queue_length,
@@ -107,40 +219,10 @@ def index():
 
 @app.route('/playlist')
 def playlist():
-    # Reload playlist JSON each request for freshness
-    try:
-        with open(playlist_path, 'r', encoding='utf-8') as f:
-            current_playlist = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        current_playlist = []
-
-    # Use shared is_playable from utils
-
-    # Discover available videos (first basename wins)
-    valid_videos = {}
-    scan_errors = 0
-    for root, _, files in os.walk(VIDEO_DIR):
-        for fname in files:
-            _, ext = os.path.splitext(fname)
-            if ext.lower() not in VIDEO_FORMATS:
-                continue
-            basename = os.path.splitext(fname)[0]
-            full_path = os.path.join(root, fname)
-            if basename in valid_videos:
-                scan_errors += 1  # duplicate basename
-                continue
-            if is_playable(full_path):
-                valid_videos[basename] = full_path
-            else:
-                scan_errors += 1
-
-    # Filter playlist entries to those with valid videos
-    filtered_playlist = [
-        row for row in current_playlist if row.get('filename') in valid_videos
-    ]
-    missing_errors = len(current_playlist) - len(filtered_playlist)
-    error_count = scan_errors + missing_errors
-    ok_count = len(filtered_playlist)
+    # Memoized join of playlist.json and the catalog; only the page slice
+    # below is computed per request
+    view = get_playlist_view(playlist_path, VIDEO_DIR)
+    filtered_playlist = view['items']
 
     # Pagination
     page = max(int(request.args.get('page', 1)), 1)
@@ -152,7 +234,7 @@ def playlist():
     if page_size not in allowed_page_sizes:
         page_size = allowed_page_sizes[0]
 
-    total_pages = max(math.ceil(ok_count / page_size), 1)
+    total_pages = max(math.ceil(len(filtered_playlist) / page_size), 1)
     if page > total_pages:
         page = total_pages
 
@@ -170,32 +252,56 @@ def playlist():
         page_size=page_size,
         page_sizes=allowed_page_sizes,
         pages_list=pages_list,
-        ok_count=ok_count,
-        error_count=error_count,
+        ok_count=view['ok_count'],
+        error_count=view['error_count'],
+        pending_count=view['pending_count'],
+        previews=get_previews() is not None,
+        live_events=live_events(),
     )
 
 
-@app.route('/playlist_qr')
-def playlist_qr():
-    # Try to get the server's local IP address for the QR code
+@app.route('/search')
+def search():
+    """Search the song book by artist, title, part or song number.
 
+    Words are matched by prefix; when nothing matches (or ``fuzzy=1`` is
+    given) the query is run through the typo-tolerant trigram index and the
+    results are ranked by similarity.
+    """
+    query = request.args.get('q', '').strip()
     try:
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-        # If localhost, try to get a better IP
-        if local_ip.startswith('127.') or local_ip == 'localhost':
-            # Try to get the first non-localhost IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            try:
-                # doesn't have to be reachable
-                s.connect(('8.8.8.8', 80))
-                local_ip = s.getsockname()[0]
-            except Exception:
-                pass
-            finally:
-                s.close()
-    except socket.gaierror:
-        local_ip = 'localhost'
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        limit = 50
+
+    # The index covers the whole playlist; keep the songs the song book
+    # lists (see get_playlist_view): in the library and not known to be
+    # unplayable, and skip empty files
+    catalog = get_catalog(VIDEO_DIR)
+    probes = get_probe_cache(VIDEO_DIR)
+
+    def accept(row):
+        entry = catalog.lookup(row.get('filename'), non_empty=True)
+        return entry is not None and probes.status(entry) is not False
+
+    fuzzy = request.args.get('fuzzy') == '1'
+    results = []
+    if not fuzzy:
+        results = get_search_index(playlist_path).search(
+            query, limit=limit, accept=accept
+        )
+    if not results and query:
+        fuzzy = True
+        results = get_fuzzy_index(playlist_path).search(
+            query, limit=limit, accept=accept
+        )
+    return {'query': query, 'fuzzy': fuzzy, 'results': results}, 200
+
+
+@app.route('/playlist_qr')
+def playlist_qr():
+    # The LAN address is looked up in the background (see karoloke.network)
+    local_ip = get_local_address().ip
     port = request.environ.get('SERVER_PORT', request.host.split(':')[-1])
 
     # Original playlist route logic (commented for future use)
@@ -204,21 +310,191 @@ def playlist_qr():
     # Temporary solution: QR code points to a PDF file
     playlist_url = 'https://drive.google.com/file/d/1Mv06a6NNCY1udz38Q2fYjKdg57lI1hJr/view?usp=sharing'
 
-    img = qrcode.make(playlist_url)
-    buf = io.BytesIO()
-    img.save(buf, 'PNG')
-    buf.seek(0)
-    return app.response_class(buf.read(), mimetype='image/png')
+    # Rendered once per URL; browsers revalidate it with If-None-Match
+    png, etag = render_qr_png(playlist_url)
+    response = app.response_class(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/background/<path:filename>')
 def background(filename):
-    return send_from_directory(BACKGROUND_DIR, filename)
+    # Conditional responses (ETag/Last-Modified) plus a long max-age
+    return send_from_directory(
+        BACKGROUND_DIR, filename, max_age=BACKGROUND_MAX_AGE
+    )
 
 
 @app.route('/video/<path:filename>')
 def video(filename):
-    return send_from_directory(VIDEO_DIR, filename)
+    prefix = f'{RENDITION_PREFIX}/'
+    if filename.startswith(prefix):
+        # Transcoded copy of a video browsers cannot play (already local),
+        # counted in the metrics of its song rather than of its file name
+        rendition = filename[len(prefix) :]
+        path = safe_join(TRANSCODE_DIR, rendition)
+        song = path and rendition_song(VIDEO_DIR, path)
+        return send_video(TRANSCODE_DIR, rendition, song=song)
+    cache = get_video_cache()
+    source = None
+    if cache is not None:
+        path = safe_join(os.path.abspath(str(VIDEO_DIR)), filename)
+        if path is not None:
+            in_dir = get_catalog(VIDEO_DIR).files_in(os.path.dirname(path))
+            entry = in_dir.get(path)
+            if entry is not None:
+                source = cache.lookup(entry)
+    # Only the bytes actually sent from the local copy were saved
+    on_sent = cache.record_served if source is not None else None
+    return send_video(VIDEO_DIR, filename, source=source, on_sent=on_sent)
+
+
+@app.route(
+    '/hls/<song_num>/<version>/', defaults={'filename': MASTER_PLAYLIST}
+)
+@app.route('/hls/<song_num>/<version>/<path:filename>')
+def hls(song_num, version, filename):
+    """Master playlist, variant playlists and segments of a song.
+
+    ``version`` is the package name given by the player page. Returns 404
+    until the song is packaged, or once the video changed; the player then
+    falls back to /video.
+    """
+    packager = get_hls_packager()
+    entry = get_catalog(VIDEO_DIR).lookup(song_num, non_empty=True)
+    if packager is None or entry is None:
+        abort(404)
+    package = packager.lookup(entry)
+    if package is None or os.path.basename(package) != version:
+        abort(404)
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in MIMETYPES:
+        abort(404)
+    return send_from_directory(
+        package,
+        filename,
+        mimetype=MIMETYPES[ext],
+        # A new version of the song gets new URLs
+        max_age=VIDEO_MAX_AGE,
+    )
+
+
+@app.route('/preview/<song_num>/<any(poster, clip):kind>')
+def preview(song_num, kind):
+    """Poster frame (JPEG) or short preview clip (MP4) of a song."""
+    generator = get_previews()
+    entry = get_catalog(VIDEO_DIR).lookup(song_num, non_empty=True)
+    if generator is None or entry is None:
+        abort(404)
+    path = (
+        generator.poster(entry) if kind == 'poster' else generator.clip(entry)
+    )
+    if path is None:
+        abort(404)
+    return send_from_directory(
+        generator.output_dir, os.path.basename(path), max_age=VIDEO_MAX_AGE
+    )
+
+
+@app.route('/previews/progress')
+def previews_progress():
+    """Return the number of preview jobs per status."""
+    generator = get_previews()
+    if generator is None:
+        return {'enabled': False}, 200
+    return {'enabled': True, **generator.progress()}, 200
+
+
+# Each /events stream served here holds a server thread until the page is
+# closed (the ASGI bridge serves it on the event loop instead)
+_event_streams = threading.BoundedSemaphore(EVENTS_WSGI_STREAMS)
+
+
+def live_events() -> bool:
+    """Return True if pages may hold an /events stream open for long."""
+    return bool(request.environ.get(ASGI_ENVIRON_KEY))
+
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of queue, now-playing and catalog updates.
+
+    Returns 503 once ``EVENTS_WSGI_STREAMS`` streams are open, so that the
+    thread pool keeps serving requests; pages then poll /get_queue.
+    """
+    if not _event_streams.acquire(blocking=False):
+        return {'error': 'too many event streams'}, 503
+    response = app.response_class(
+        get_event_broker().stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    response.call_on_close(_event_streams.release)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Return the serving counters, e.g. bytes sent per song."""
+    snapshot = get_metrics().snapshot()
+    cache = get_video_cache()
+    if cache is not None:
+        snapshot['video_cache'] = cache.stats()
+    packager = get_hls_packager()
+    if packager is not None:
+        snapshot['hls'] = packager.stats()
+    totals = snapshot.get('ttff_ms', {})
+    counts = snapshot.get('ttff_count', {})
+    average = {label: totals[label] // counts[label] for label in counts}
+    if average:
+        snapshot['ttff_avg_ms'] = average
+    optimizer = get_faststart_optimizer()
+    if optimizer is not None:
+        faststart = optimizer.stats()
+        if MOOV_AT_END in average and OPTIMIZED in average:
+            faststart['ttff_saved_ms'] = (
+                average[MOOV_AT_END] - average[OPTIMIZED]
+            )
+        snapshot['faststart'] = faststart
+    return snapshot, 200
+
+
+@app.route('/ttff', methods=['POST'])
+def ttff():
+    """Record the time to first frame measured by the player.
+
+    Expects ``{'video': <url of the video>, 'ms': <milliseconds>}``. Times
+    are summed per kind of file (see ``FaststartOptimizer.label``), so the
+    gain of fast-start copies shows in /metrics.
+    """
+    data = request.get_json(silent=True, force=True) or {}
+    try:
+        ms = int(data['ms'])
+        url = str(data['video'])
+        filename = '' if '/hls/' in url else url.split('/video/', 1)[1]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return {'error': 'expected video and ms'}, 400
+    if not 0 <= ms <= TTFF_MAX_MS:
+        return {'error': 'ms out of range'}, 400
+
+    label = PROGRESSIVE
+    if not filename:
+        label = HLS
+    else:
+        filename = unquote(filename)
+        prefix = f'{RENDITION_PREFIX}/'
+        if filename.startswith(prefix):
+            path = safe_join(TRANSCODE_DIR, filename[len(prefix) :])
+        else:
+            path = safe_join(os.path.abspath(str(VIDEO_DIR)), filename)
+        optimizer = get_faststart_optimizer()
+        if optimizer is not None and path is not None:
+            label = optimizer.label(path)
+    metrics = get_metrics()
+    metrics.increment('ttff_ms', label, ms)
+    metrics.increment('ttff_count', label)
+    return {'label': label}, 200
 
 
 @app.route('/setup_video_dir', methods=['GET', 'POST'])
@@ -228,6 +504,9 @@ def setup_video_dir():
         new_path = request.form.get('video_dir')
         if new_path and os.path.isdir(new_path):
             VIDEO_DIR = new_path
+            # Re-index the library so newly copied songs are picked up
+            reset_catalog(VIDEO_DIR)
+            rewatch_catalog(VIDEO_DIR)
             return {'status': 'success', 'video_dir': VIDEO_DIR}, 200
         return {'status': 'error', 'message': 'Invalid directory'}, 400
     # GET request: show the setup page
@@ -262,39 +541,68 @@ def add_to_queue():
                 'message': 'Erro nesta musica, escolha outra',
             }, 400
 
-    # Add to queue
-    if 'queue' not in session:
-        session['queue'] = []
-
-    session['queue'].append(song_num)
-    session.modified = True
+    # Add to the shared queue; another client may have queued it meanwhile
+    song_queue = get_song_queue()
+    if not song_queue.add(song_num):
+        return {
+            'status': 'duplicate',
+            'message': 'Música já selecionada',
+        }, 409
 
-    return {'status': 'ok', 'message': 'OK', 'queue': session['queue']}, 200
+    return {
+        'status': 'ok',
+        'message': 'OK',
+        'queue': song_queue.songs(),
+        'version': song_queue.version,
+    }, 200
 
 
 @app.route('/get_queue', methods=['GET'])
 def get_queue():
     """Get current queue."""
-    queue = session.get('queue', [])
-    return {'queue': queue}, 200
+    song_queue = get_song_queue()
+    return {'queue': song_queue.songs(), 'version': song_queue.version}, 200
+
+
+def upcoming_video(song_num):
+    """Return the URL, size and MIME type of a song's video, if available.
+
+    The URL is the one the player page loads, so a preloaded response is
+    reused by the ``<video>`` element.
+    """
+    if song_num is None:
+        return None
+    details = get_video_details(song_num, VIDEO_DIR)
+    if details is None:
+        return None
+    return {
+        'url': url_for('video', filename=details['video']),
+        'size': details['size'],
+        'mimetype': details['mimetype'],
+    }
+
+
+def preload_link(video):
+    """``Link`` header value asking the browser to fetch ``video`` early."""
+    return (
+        f'<{video["url"]}>; rel=preload; as=video; type="{video["mimetype"]}"'
+    )
 
 
 @app.route('/next_song', methods=['GET'])
 def next_song():
     """Remove current song from queue and load next one."""
-    if 'queue' not in session:
-        session['queue'] = []
-
-    # Remove current song from queue if it exists
-    current_song = session.get('current_song')
-    if current_song and current_song in session['queue']:
-        session['queue'].remove(current_song)
-        session.modified = True
-
-    # Check if there are more songs in queue
-    if session['queue'] and len(session['queue']) > 0:
+    # Remove current song from queue and check if there are more songs
+    upcoming = get_song_queue().advance()
+    if upcoming is not None:
         # Redirect to index to auto-load next song
-        return {'status': 'next', 'next_song': session['queue'][0]}, 200
+        # Fetched through fetch(), where a Link header preloads nothing:
+        # the score page it leads to preloads the video instead
+        return {
+            'status': 'next',
+            'next_song': upcoming,
+            'video': upcoming_video(upcoming),
+        }, 200
     else:
         # Queue is empty, redirect to score
         return {'status': 'empty'}, 200
@@ -304,7 +612,14 @@ def next_song():
 def score():
     bg_folder = session.get('background_folder', 'default')
     bg_img = get_background_img(BACKGROUND_DIR, bg_folder)
-    return render_template('score.html', bg_img=bg_img)
+    # The score screen is shown right before the next queued song
+    video = upcoming_video(get_song_queue().first())
+    response = app.make_response(
+        render_template('score.html', bg_img=bg_img, next_video=video)
+    )
+    if video is not None:
+        response.headers['Link'] = preload_link(video)
+    return response
 
 
 @app.route('/settings')
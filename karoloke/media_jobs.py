@@ -0,0 +1,426 @@
+import os
+import pathlib
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from karoloke.catalog import CatalogEntry
+from karoloke.settings import (
+    MEDIA_JOB_CPU_SHARE,
+    MEDIA_JOB_WORKERS,
+    MEDIA_JOBS_DB,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    output TEXT,
+    error TEXT,
+    PRIMARY KEY (kind, path)
+);
+"""
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# (size, mtime_ns, status, output)
+JobState = Tuple[int, int, str, Optional[str]]
+
+
+class JobStore:
+    """SQLite persistence of background media jobs.
+
+    One row per ``(kind, path)`` records the version of the source file
+    (size and mtime), the job status and its output, so that a restart
+    resumes unfinished jobs and does not retry failed ones.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database file. Parent directories are created
+        if needed.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        pathlib.Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def load(self, kind: str) -> Dict[str, JobState]:
+        """Return ``{path: (size, mtime_ns, status, output)}`` for ``kind``."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, size, mtime_ns, status, output FROM jobs '
+                'WHERE kind = ?',
+                (kind,),
+            ).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def save(
+        self,
+        kind: str,
+        entry: CatalogEntry,
+        status: str,
+        output: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """Record the status of the ``kind`` job of ``entry``."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO jobs '
+                '(kind, path, size, mtime_ns, status, output, error) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    kind,
+                    entry.path,
+                    entry.size,
+                    entry.mtime_ns,
+                    status,
+                    output,
+                    error,
+                ),
+            )
+
+    def save_many(
+        self, kind: str, entries: Sequence[CatalogEntry], status: str
+    ):
+        """Record the same status for the ``kind`` jobs of ``entries``.
+
+        Rows are written in a single transaction.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO jobs '
+                '(kind, path, size, mtime_ns, status, output, error) '
+                'VALUES (?, ?, ?, ?, ?, NULL, NULL)',
+                [
+                    (kind, entry.path, entry.size, entry.mtime_ns, status)
+                    for entry in entries
+                ],
+            )
+
+
+def run_ffmpeg(args: Sequence[str], timeout: float = 600) -> bool:
+    """Run an ``ffmpeg`` command line at low CPU priority.
+
+    Parameters
+    ----------
+    args : Sequence[str]
+        Full command line, ``ffmpeg`` executable first.
+    timeout : float
+        Seconds after which the process is killed.
+
+    Returns
+    -------
+    bool
+        True if ffmpeg exited successfully.
+    """
+    kwargs = {}
+    if sys.platform.startswith('win'):
+        kwargs['creationflags'] = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+    elif hasattr(os, 'nice'):
+        kwargs['preexec_fn'] = lambda: os.nice(10)
+    try:
+        result = subprocess.run(
+            list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            check=False,
+            **kwargs,
+        )
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+class MediaJobQueue:
+    """Persistent, throttled pool of background jobs over catalog entries.
+
+    Each job kind maps to a task ``task(entry) -> output``, which returns
+    the path of the file it produced, or raises on failure. Jobs are keyed
+    by ``(kind, path)`` and tied to the size and mtime of the source: a
+    changed source is processed again, an unchanged one never twice.
+
+    The pool runs ``workers`` jobs at the same time and pauses between two
+    jobs so that, on average, the pool takes about ``cpu_share`` of the
+    machine; tasks are expected to run their subprocess single-threaded
+    and at low priority (see :func:`run_ffmpeg`), so playback always wins.
+
+    Parameters
+    ----------
+    tasks : dict
+        ``{kind: task}``.
+    store : JobStore, optional
+        Persistence of the job states. Without it, jobs are kept in memory.
+    workers : int
+        Jobs running at the same time.
+    cpu_share : float
+        Fraction of the CPUs the pool may use, between 0 and 1.
+    """
+
+    def __init__(
+        self,
+        tasks: Dict[str, Callable[[CatalogEntry], str]],
+        store: Optional[JobStore] = None,
+        workers: int = MEDIA_JOB_WORKERS,
+        cpu_share: float = MEDIA_JOB_CPU_SHARE,
+    ):
+        self.tasks = tasks
+        self.store = store
+        self.workers = workers
+        # Fraction of the time each worker may spend running a job
+        self.duty = min(1.0, cpu_share * (os.cpu_count() or 1) / workers)
+        self._lock = threading.Condition()
+        self._jobs: Dict[str, Dict[str, JobState]] = {
+            kind: store.load(kind) if store else {} for kind in tasks
+        }
+        self._queued = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='karoloke-media'
+        )
+
+    def submit(self, kind: str, entry: CatalogEntry) -> bool:
+        """Schedule the ``kind`` job of ``entry`` unless already done.
+
+        Parameters
+        ----------
+        kind : str
+            Job kind, one of ``tasks``.
+        entry : CatalogEntry
+            Source file.
+
+        Returns
+        -------
+        bool
+            True if a job was scheduled.
+        """
+        return self.submit_many(kind, [entry]) == 1
+
+    def submit_many(self, kind: str, entries: Iterable[CatalogEntry]) -> int:
+        """Schedule the ``kind`` jobs of ``entries`` not done yet.
+
+        The new jobs are saved in one transaction, without holding the
+        queue lock, so a large catalog does not stall the running jobs.
+
+        Returns
+        -------
+        int
+            Number of jobs scheduled.
+        """
+        scheduled = []
+        stale = []
+        with self._lock:
+            if self._closed:
+                return 0
+            jobs = self._jobs[kind]
+            for entry in entries:
+                state = jobs.get(entry.path)
+                version = (entry.size, entry.mtime_ns)
+                if state is not None and state[:2] == version:
+                    # Done, failed or still to run: nothing new to schedule
+                    continue
+                if state is not None and state[3] is not None:
+                    # The source changed: its previous output is stale
+                    stale.append(state[3])
+                jobs[entry.path] = (*version, PENDING, None)
+                scheduled.append(entry)
+            self._queued += len(scheduled)
+        for output in stale:
+            _remove(output)
+        self._start(kind, scheduled)
+        return len(scheduled)
+
+    def _start(self, kind: str, entries: List[CatalogEntry]):
+        # Called without the lock, once the jobs are recorded as pending
+        if self.store and entries:
+            self.store.save_many(kind, entries, PENDING)
+        for index, entry in enumerate(entries):
+            try:
+                self._executor.submit(self._run, kind, entry)
+            except RuntimeError:
+                # Shut down meanwhile: the jobs are resumed on next start
+                with self._lock:
+                    self._queued -= len(entries) - index
+                    self._lock.notify_all()
+                return
+
+    def resume(self) -> int:
+        """Schedule again the jobs left unfinished by a previous run.
+
+        Returns
+        -------
+        int
+            Number of jobs scheduled.
+        """
+        unfinished = {}
+        with self._lock:
+            if self._closed:
+                return 0
+            for kind, jobs in self._jobs.items():
+                unfinished[kind] = [
+                    CatalogEntry(
+                        path, size, os.path.splitext(path)[1].lower(), mtime
+                    )
+                    for path, (size, mtime, status, _) in jobs.items()
+                    if status in (PENDING, RUNNING)
+                ]
+                for entry in unfinished[kind]:
+                    jobs[entry.path] = (
+                        entry.size,
+                        entry.mtime_ns,
+                        PENDING,
+                        None,
+                    )
+                    self._queued += 1
+        for kind, entries in unfinished.items():
+            self._start(kind, entries)
+        return sum(len(entries) for entries in unfinished.values())
+
+    def result(self, kind: str, entry: CatalogEntry) -> Optional[str]:
+        """Return the output of the ``kind`` job of ``entry``, once done."""
+        with self._lock:
+            state = self._jobs[kind].get(entry.path)
+        if state is None or state[:3] != (entry.size, entry.mtime_ns, DONE):
+            return None
+        if state[3] is None or not os.path.exists(state[3]):
+            return None
+        return state[3]
+
+    def outputs(self, kind: str) -> Dict[str, str]:
+        """Return ``{path: output}`` for the finished ``kind`` jobs."""
+        with self._lock:
+            return {
+                path: state[3]
+                for path, state in self._jobs[kind].items()
+                if state[2] == DONE and state[3] is not None
+            }
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """Return ``{kind: {status: count}}`` over every known job."""
+        with self._lock:
+            progress = {}
+            for kind, jobs in self._jobs.items():
+                counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+                for state in jobs.values():
+                    counts[state[2]] += 1
+                progress[kind] = counts
+            return progress
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every scheduled job has finished."""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._queued, timeout)
+
+    def shutdown(self):
+        """Stop scheduling jobs; running ones are left to finish."""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _set(self, kind, entry, status, output=None, error=None):
+        version = (entry.size, entry.mtime_ns)
+        with self._lock:
+            jobs = self._jobs[kind]
+            if jobs[entry.path][:2] != version:
+                # A newer version of the file was submitted meanwhile
+                return
+            jobs[entry.path] = (*version, status, output)
+        if self.store:
+            self.store.save(kind, entry, status, output, error)
+
+    def _run(self, kind: str, entry: CatalogEntry):
+        try:
+            with self._lock:
+                state = self._jobs[kind].get(entry.path)
+                # Superseded by a newer version of the file, or closed
+                if self._closed or state != (
+                    entry.size,
+                    entry.mtime_ns,
+                    PENDING,
+                    None,
+                ):
+                    return
+            self._set(kind, entry, RUNNING)
+            started = time.monotonic()
+            try:
+                output = self.tasks[kind](entry)
+            except Exception as e:
+                self._set(kind, entry, FAILED, error=str(e) or repr(e))
+            else:
+                self._set(kind, entry, DONE, output)
+            # Stay idle long enough to keep the average CPU use in budget
+            elapsed = time.monotonic() - started
+            if self.duty < 1.0:
+                time.sleep(elapsed * (1 - self.duty) / self.duty)
+        finally:
+            with self._lock:
+                self._queued -= 1
+                self._lock.notify_all()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def discard_output(part: str, reason: str):
+    """Remove the ``.part`` file of a failed task and report the failure.
+
+    Raises
+    ------
+    RuntimeError
+        Always, with ``reason``; the job is then marked failed instead of
+        keeping a truncated output.
+    """
+    _remove(part)
+    raise RuntimeError(reason)
+
+
+def replace_output(part: str, output: str) -> str:
+    """Move a finished ``.part`` file to ``output``.
+
+    Raises
+    ------
+    RuntimeError
+        If the task did not produce ``part``.
+    """
+    if not os.path.isfile(part) or os.path.getsize(part) == 0:
+        _remove(part)
+        raise RuntimeError(f'no output produced for {output}')
+    os.replace(part, output)
+    return output
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Return the shared job store, opened in the per-user data folder."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore(MEDIA_JOBS_DB)
+        return _store
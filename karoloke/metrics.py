@@ -0,0 +1,60 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe named counters, each keyed by an arbitrary label.
+
+    Examples
+    --------
+    >>> metrics = Metrics()
+    >>> metrics.increment('bytes_served', '1001', 4096)
+    >>> metrics.snapshot()['bytes_served']
+    {'1001': 4096}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Counter] = {}
+
+    def increment(self, name: str, key: str, amount: int = 1):
+        """Add ``amount`` to the ``key`` entry of the ``name`` counter.
+
+        Parameters
+        ----------
+        name : str
+            Counter name, e.g. ``'bytes_served'``.
+        key : str
+            Label inside the counter, e.g. a song number.
+        amount : int
+            Value added to the counter.
+        """
+        with self._lock:
+            self._counters.setdefault(name, Counter())[key] += amount
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Return a copy of every counter, largest entries first.
+
+        Returns
+        -------
+        dict
+            ``{name: {key: value}}``.
+        """
+        with self._lock:
+            return {
+                name: dict(counter.most_common())
+                for name, counter in self._counters.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the metrics shared by the whole application."""
+    return _metrics
@@ -0,0 +1,92 @@
+import socket
+import threading
+from typing import Optional
+
+from karoloke.settings import LOCAL_ADDRESS_REFRESH_INTERVAL
+
+
+def discover_local_ip() -> str:
+    """Look up the LAN address of this machine.
+
+    The host name is resolved first; when it only maps to a loopback
+    address, a UDP socket is "connected" to a public address to learn which
+    interface the system would route through (no packet is sent). This may
+    block on DNS, so it must not run on the request path.
+
+    Returns
+    -------
+    str
+        The local IP address, or ``'localhost'`` if none could be found.
+    """
+    try:
+        local_ip = socket.gethostbyname(socket.gethostname())
+    except OSError:
+        local_ip = 'localhost'
+    if local_ip.startswith('127.') or local_ip == 'localhost':
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # doesn't have to be reachable
+            s.connect(('8.8.8.8', 80))
+            local_ip = s.getsockname()[0]
+        except OSError:
+            pass
+        finally:
+            s.close()
+    return local_ip
+
+
+class LocalAddress:
+    """LAN address of the server, kept fresh by a background thread.
+
+    Reading :attr:`ip` never blocks: it returns the last address found
+    (``'localhost'`` until the first lookup completes).
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between two lookups.
+    """
+
+    def __init__(self, interval: float = LOCAL_ADDRESS_REFRESH_INTERVAL):
+        self.interval = interval
+        self.ip = 'localhost'
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> str:
+        """Look the address up now and return it."""
+        self.ip = discover_local_ip()
+        return self.ip
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Start the background refresh, if it is not running yet."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='karoloke-local-address', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_local_address = LocalAddress()
+
+
+def get_local_address() -> LocalAddress:
+    """Return the shared, background-refreshed LAN address."""
+    return _local_address
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+from karoloke.catalog import CatalogEntry
+from karoloke.container_sniffer import MP4_EXTENSIONS, mp4_index_span
+from karoloke.metrics import get_metrics
+from karoloke.settings import (
+    PREFETCH_DEPTH,
+    PREFETCH_HEAD_BYTES,
+    PREFETCH_RATE,
+)
+
+READ_CHUNK = 1024 * 1024
+# Warmed files remembered, so a queue change does not read them again
+REMEMBERED_FILES = 64
+
+
+class Prefetcher:
+    """Warm the OS page cache with the beginning of the next queued songs.
+
+    Whenever the queue changes, the first ``head_bytes`` of the next
+    ``depth`` songs are hinted with ``posix_fadvise(WILLNEED)`` (where
+    available) and read in the background, at most ``rate`` bytes per
+    second, so that a cold NAS disk is not in the way when the song starts
+    and the song being played is not starved. The ``moov`` index of MP4
+    files that keep it at the end is warmed too.
+
+    Parameters
+    ----------
+    resolve : callable
+        Maps a song number to its :class:`~karoloke.catalog.CatalogEntry`,
+        or None if the song is not available.
+    depth : int
+        Number of songs at the head of the queue to warm.
+    head_bytes : int
+        Bytes warmed at the beginning of each file.
+    rate : int
+        Read budget in bytes per second; 0 disables throttling.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], Optional[CatalogEntry]],
+        depth: int = PREFETCH_DEPTH,
+        head_bytes: int = PREFETCH_HEAD_BYTES,
+        rate: int = PREFETCH_RATE,
+    ):
+        self.resolve = resolve
+        self.depth = depth
+        self.head_bytes = head_bytes
+        self.rate = rate
+        self._cond = threading.Condition()
+        self._pending: List[str] = []
+        self._busy = False
+        self._warmed: OrderedDict = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, songs: Sequence[str]):
+        """Warm the first ``depth`` of ``songs`` in the background.
+
+        A newer call replaces songs that were not warmed yet, since only the
+        current head of the queue matters.
+
+        Parameters
+        ----------
+        songs : Sequence[str]
+            Queued song numbers, next one first.
+        """
+        if self.depth <= 0:
+            return
+        with self._cond:
+            self._pending = list(songs[: self.depth])
+            if not self._pending:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='karoloke-prefetch', daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every scheduled song has been warmed."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                song_num = self._pending.pop(0)
+                self._busy = True
+            try:
+                entry = self.resolve(song_num)
+                if entry is not None:
+                    self.warm(entry, song_num)
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def warm(self, entry: CatalogEntry, song_num: str = '') -> int:
+        """Bring the start (and MP4 index) of ``entry`` into the page cache.
+
+        Parameters
+        ----------
+        entry : CatalogEntry
+            File to warm.
+        song_num : str
+            Song number, used as the metric label.
+
+        Returns
+        -------
+        int
+            Number of bytes read; 0 if the file was warmed recently.
+        """
+        key = (entry.path, entry.size, entry.mtime_ns)
+        if key in self._warmed:
+            self._warmed.move_to_end(key)
+            return 0
+
+        read = 0
+        with open(entry.path, 'rb') as f:
+            spans = [(0, min(self.head_bytes, entry.size))]
+            if entry.ext in MP4_EXTENSIONS:
+                index = mp4_index_span(f, entry.size)
+                if index is not None:
+                    spans.append((index[0], min(index[1], self.head_bytes)))
+            for offset, length in spans:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(
+                        f.fileno(), offset, length, os.POSIX_FADV_WILLNEED
+                    )
+                read += self._read_span(f, offset, length)
+
+        self._warmed[key] = True
+        while len(self._warmed) > REMEMBERED_FILES:
+            self._warmed.popitem(last=False)
+        get_metrics().increment('prefetch_bytes', song_num, read)
+        return read
+
+    def _read_span(self, f, offset: int, length: int) -> int:
+        # Reading is what really warms network shares, where the fadvise
+        # hint may be ignored
+        f.seek(offset)
+        started = time.monotonic()
+        read = 0
+        while read < length:
+            data = f.read(min(READ_CHUNK, length - read))
+            if not data:
+                break
+            read += len(data)
+            if self.rate:
+                ahead = read / self.rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return read
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from karoloke.catalog import (
+    CatalogChanges,
+    CatalogEntry,
+    add_catalog_listener,
+    get_catalog,
+)
+from karoloke.media_jobs import (
+    MediaJobQueue,
+    discard_output,
+    get_job_store,
+    replace_output,
+    run_ffmpeg,
+)
+from karoloke.settings import (
+    PREVIEW_DIR,
+    PREVIEW_OFFSET,
+    PREVIEW_SECONDS,
+    PREVIEW_WIDTH,
+)
+
+POSTER = 'poster'
+CLIP = 'preview'
+
+
+def preview_key(entry: CatalogEntry) -> str:
+    """Return the cache key of the previews of ``entry``.
+
+    The key changes with the path and mtime of the video, so previews of a
+    replaced file are never served for the new one.
+    """
+    return hashlib.sha1(f'{entry.path}\0{entry.mtime_ns}'.encode()).hexdigest()
+
+
+class PreviewGenerator:
+    """Poster frames and short preview clips of the catalog videos.
+
+    Both are made with ``ffmpeg`` by a :class:`~karoloke.media_jobs.
+    MediaJobQueue`, so generation is throttled, survives restarts and
+    reports its progress. Outputs are small files in ``output_dir``, which
+    lets the song book show previews without reading the full videos.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the generated files.
+    ffmpeg : str or None
+        Path to the ``ffmpeg`` executable; None disables generation.
+    **kwargs
+        Passed to :class:`~karoloke.media_jobs.MediaJobQueue`.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = PREVIEW_DIR,
+        ffmpeg: Optional[str] = None,
+        **kwargs,
+    ):
+        self.output_dir = output_dir
+        self.ffmpeg = ffmpeg
+        os.makedirs(output_dir, exist_ok=True)
+        self.jobs = MediaJobQueue(
+            {POSTER: self.make_poster, CLIP: self.make_clip}, **kwargs
+        )
+
+    def schedule(self, entries: Iterable[CatalogEntry]) -> int:
+        """Generate the missing previews of ``entries`` in the background.
+
+        Returns
+        -------
+        int
+            Number of jobs scheduled.
+        """
+        if self.ffmpeg is None:
+            return 0
+        entries = [entry for entry in entries if entry.size > 0]
+        return self.jobs.submit_many(POSTER, entries) + self.jobs.submit_many(
+            CLIP, entries
+        )
+
+    def poster(self, entry: CatalogEntry) -> Optional[str]:
+        """Return the poster frame of ``entry``, once generated."""
+        return self.jobs.result(POSTER, entry)
+
+    def clip(self, entry: CatalogEntry) -> Optional[str]:
+        """Return the preview clip of ``entry``, once generated."""
+        return self.jobs.result(CLIP, entry)
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """Return ``{'poster': {status: count}, 'preview': {...}}``."""
+        return self.jobs.progress()
+
+    def _render(self, entry: CatalogEntry, ext: str, options: List[str]):
+        output = os.path.join(self.output_dir, preview_key(entry) + ext)
+        part = output + '.part'
+        # Short videos have nothing at PREVIEW_OFFSET: start at 0 instead
+        for offset in (PREVIEW_OFFSET, 0):
+            args = [self.ffmpeg, '-nostdin', '-v', 'error', '-y']
+            args += ['-ss', str(offset), '-i', entry.path, *options, part]
+            if run_ffmpeg(args) and os.path.isfile(part):
+                if os.path.getsize(part) > 0:
+                    return replace_output(part, output)
+        # Whatever a failed run left behind is partial
+        discard_output(part, f'ffmpeg failed to render {output}')
+
+    def make_poster(self, entry: CatalogEntry) -> str:
+        """Extract one frame of ``entry`` as a JPEG image."""
+        return self._render(
+            entry,
+            '.jpg',
+            [
+                '-frames:v',
+                '1',
+                '-vf',
+                f'scale={PREVIEW_WIDTH}:-2',
+                '-threads',
+                '1',
+                '-f',
+                'image2',
+                '-c:v',
+                'mjpeg',
+            ],
+        )
+
+    def make_clip(self, entry: CatalogEntry) -> str:
+        """Encode a short, low-bitrate MP4 excerpt of ``entry``."""
+        return self._render(
+            entry,
+            '.mp4',
+            [
+                '-t',
+                str(PREVIEW_SECONDS),
+                '-vf',
+                f'scale={PREVIEW_WIDTH}:-2',
+                '-c:v',
+                'libx264',
+                '-preset',
+                'veryfast',
+                '-b:v',
+                '250k',
+                '-c:a',
+                'aac',
+                '-b:a',
+                '48k',
+                '-threads',
+                '1',
+                '-movflags',
+                '+faststart',
+                '-f',
+                'mp4',
+            ],
+        )
+
+
+_generator: Optional[PreviewGenerator] = None
+_generator_lock = threading.Lock()
+# Set by generate_previews(): previews are opt-in
+_previews: Optional[PreviewGenerator] = None
+
+
+def get_preview_generator() -> PreviewGenerator:
+    """Return the shared preview generator.
+
+    Jobs left unfinished by the previous run are resumed on first use.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = PreviewGenerator(
+                ffmpeg=shutil.which('ffmpeg'), store=get_job_store()
+            )
+            if _generator.ffmpeg is not None:
+                _generator.jobs.resume()
+        return _generator
+
+
+def get_previews() -> Optional[PreviewGenerator]:
+    """Return the preview generator, or None if previews are not enabled."""
+    return _previews
+
+
+def generate_previews(video_dir: str) -> bool:
+    """Keep the previews of every video in ``video_dir`` up to date.
+
+    Existing videos are scheduled from a background thread, and new or
+    changed ones whenever a catalog changes.
+
+    Returns
+    -------
+    bool
+        False if ffmpeg is not installed.
+    """
+    global _previews
+    generator = get_preview_generator()
+    if generator.ffmpeg is None:
+        return False
+    _previews = generator
+    changes = CatalogChanges()
+    # Also covers a video directory chosen later in the settings, whose
+    # catalog notifies once built
+    add_catalog_listener(lambda catalog: generator.schedule(changes(catalog)))
+    threading.Thread(
+        target=lambda: generator.schedule(changes(get_catalog(video_dir))),
+        name='karoloke-previews',
+        daemon=True,
+    ).start()
+    return True
@@ -0,0 +1,156 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from karoloke.catalog import CatalogEntry
+from karoloke.catalog_store import CatalogStore, get_catalog_store
+from karoloke.settings import PROBE_BATCH_SIZE, PROBE_WORKERS
+from karoloke.utils import is_playable
+
+
+class ProbeCache:
+    """Cache of playability probe results keyed by (path, size, mtime).
+
+    Cache misses are probed on a bounded thread pool (``ffprobe`` runs in a
+    subprocess, so threads are enough) and never block the caller: until
+    the result is known, :meth:`status` reports the file as pending.
+    Finished probes are fed back in batches, both to the in-memory cache
+    and to the catalog store when one is attached.
+
+    Parameters
+    ----------
+    root : str
+        Catalog root directory the probed files belong to.
+    store : CatalogStore, optional
+        Persistent store used to restore and save probe results.
+    max_workers : int
+        Maximum number of probes running at the same time.
+    batch_size : int
+        Number of finished probes applied together.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        store: Optional[CatalogStore] = None,
+        max_workers: int = PROBE_WORKERS,
+        batch_size: int = PROBE_BATCH_SIZE,
+    ):
+        self.root = root
+        self.store = store
+        self.batch_size = batch_size
+        # Resolve ffprobe once instead of on every probe
+        self.ffprobe = shutil.which('ffprobe')
+        self.version = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._results: Dict[str, Tuple[int, int, bool]] = (
+            store.load_probes(root) if store else {}
+        )
+        self._in_flight: Dict[str, Tuple[int, int]] = {}
+        self._batch: List[Tuple[str, int, int, bool]] = []
+        self._running = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='karoloke-probe'
+        )
+
+    def status(self, entry: CatalogEntry) -> Optional[bool]:
+        """Return the cached probe result of ``entry``.
+
+        Parameters
+        ----------
+        entry : CatalogEntry
+            Catalog entry to check.
+
+        Returns
+        -------
+        bool or None
+            True or False once the file has been probed, None while the
+            probe is pending. A miss schedules a background probe.
+        """
+        key = (entry.size, entry.mtime_ns)
+        with self._lock:
+            cached = self._results.get(entry.path)
+            if cached is not None and cached[:2] == key:
+                return cached[2]
+            if self._in_flight.get(entry.path) == key:
+                return None
+            self._in_flight[entry.path] = key
+            self._running += 1
+        self._executor.submit(self._probe, entry.path, *key)
+        return None
+
+    def pending(self) -> int:
+        """Return the number of probes scheduled or running."""
+        with self._lock:
+            return len(self._in_flight)
+
+    def _probe(self, path: str, size: int, mtime_ns: int):
+        try:
+            ok = is_playable(path, ffprobe=self.ffprobe)
+        except Exception:
+            ok = False
+        with self._lock:
+            self._batch.append((path, size, mtime_ns, ok))
+            self._running -= 1
+            # Flush a full batch, or whatever is left once the pool drains
+            if len(self._batch) < self.batch_size and self._running:
+                return
+            batch, self._batch = self._batch, []
+        if self.store:
+            self.store.save_probes(batch)
+        with self._lock:
+            for b_path, b_size, b_mtime, b_ok in batch:
+                self._results[b_path] = (b_size, b_mtime, b_ok)
+                if self._in_flight.get(b_path) == (b_size, b_mtime):
+                    del self._in_flight[b_path]
+            self.version += 1
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every scheduled probe has finished.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum number of seconds to wait.
+
+        Returns
+        -------
+        bool
+            True if no probe is pending anymore.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_caches: Dict[str, ProbeCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_probe_cache(video_dir: str) -> ProbeCache:
+    """Return the shared probe cache for ``video_dir``.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory containing the video files.
+
+    Returns
+    -------
+    ProbeCache
+        The probe cache shared by every caller using the same directory.
+    """
+    key = os.path.abspath(str(video_dir))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ProbeCache(key, store=get_catalog_store())
+            _caches[key] = cache
+        return cache
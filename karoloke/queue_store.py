@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+
+class SongQueue:
+    """Song queue shared by every client of the server.
+
+    Songs are kept in a deque (cheap removal of the song that just played)
+    plus a set for O(1) duplicate checks. Every change bumps
+    :attr:`version`, so clients can tell whether their copy is stale
+    without comparing the whole list. Listeners registered with
+    :meth:`add_listener` are called after each change, outside the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._songs: deque = deque()
+        self._members: set = set()
+        self.current_song: Optional[str] = None
+        self.version = 0
+        self._listeners: List[Callable[['SongQueue', str], None]] = []
+
+    def add_listener(self, callback: Callable[['SongQueue', str], None]):
+        """Call ``callback(queue, change)`` after every change.
+
+        ``change`` is ``'queue'`` when songs were added or removed and
+        ``'now_playing'`` when the current song changed.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, *changes: str):
+        for change in changes:
+            for callback in list(self._listeners):
+                callback(self, change)
+
+    def __contains__(self, song_num: str) -> bool:
+        return song_num in self._members
+
+    def __len__(self) -> int:
+        return len(self._songs)
+
+    def add(self, song_num: str) -> bool:
+        """Append a song unless it is already queued.
+
+        Parameters
+        ----------
+        song_num : str
+            Song number to queue.
+
+        Returns
+        -------
+        bool
+            True if the song was added, False if it was a duplicate.
+        """
+        with self._lock:
+            if song_num in self._members:
+                return False
+            self._songs.append(song_num)
+            self._members.add(song_num)
+            self.version += 1
+        self._notify('queue')
+        return True
+
+    def songs(self) -> List[str]:
+        """Return a copy of the queued songs, next one first."""
+        with self._lock:
+            return list(self._songs)
+
+    def first(self) -> Optional[str]:
+        """Return the next song to play, or None if the queue is empty."""
+        with self._lock:
+            return self._songs[0] if self._songs else None
+
+    def play(self, song_num: str):
+        """Mark ``song_num`` as the song being played."""
+        with self._lock:
+            if self.current_song == song_num:
+                return
+            self.current_song = song_num
+            self.version += 1
+        self._notify('now_playing')
+
+    def advance(self) -> Optional[str]:
+        """Drop the song being played and return the next one.
+
+        Returns
+        -------
+        str or None
+            The new first song of the queue, or None if it is empty.
+        """
+        with self._lock:
+            current = self.current_song
+            changed = current is not None and current in self._members
+            if changed:
+                if self._songs[0] == current:
+                    self._songs.popleft()
+                else:
+                    self._songs.remove(current)
+                self._members.discard(current)
+                self.version += 1
+            upcoming = self._songs[0] if self._songs else None
+        if changed:
+            self._notify('queue')
+        return upcoming
+
+    def clear(self):
+        with self._lock:
+            self._songs.clear()
+            self._members.clear()
+            self.current_song = None
+            self.version += 1
+        self._notify('queue', 'now_playing')
+
+
+_queue = SongQueue()
+
+
+def get_song_queue() -> SongQueue:
+    """Return the queue shared by every client (phones and the TV)."""
+    return _queue
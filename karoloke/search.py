@@ -0,0 +1,564 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from karoloke.utils import file_signature, load_playlist
+
+SEARCH_FIELDS = ('artist', 'title', 'part', 'filename')
+_TOKEN_SPLIT = re.compile(r'[\W_]+')
+# Row ids of prefixes up to this length are precomputed
+SHORT_PREFIX = 2
+# Above this many candidates, tokens are intersected instead of checked row
+# by row
+ROW_CHECK_LIMIT = 2000
+# Fuzzy candidates scored per query; bounds the latency of common words
+FUZZY_CANDIDATE_LIMIT = 5000
+
+
+def normalize_text(text) -> str:
+    """Fold case and strip accents so that "CANÇÃO" matches "cancao".
+
+    Parameters
+    ----------
+    text : Any
+        Text to normalize. None is treated as an empty string.
+
+    Returns
+    -------
+    str
+        Lower-case ASCII-folded text.
+    """
+    if text is None:
+        return ''
+    text = str(text)
+    if text.isascii():
+        return text.casefold()
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold()
+
+
+def tokenize(text) -> List[str]:
+    """Split normalized text into alphanumeric tokens.
+
+    Parameters
+    ----------
+    text : Any
+        Text to tokenize.
+
+    Returns
+    -------
+    list[str]
+        Tokens, in order of appearance.
+    """
+    return [t for t in _TOKEN_SPLIT.split(normalize_text(text)) if t]
+
+
+class SearchIndex:
+    """Inverted index over the searchable fields of playlist rows.
+
+    Every token of ``artist``, ``title``, ``part`` and ``filename`` is
+    mapped to the sorted ids of the rows containing it. The vocabulary is
+    kept sorted so that prefix queries resolve to a contiguous range found
+    with ``bisect``. A query matches a row when every query token is a
+    prefix of some token of the row.
+
+    Parameters
+    ----------
+    rows : Sequence[dict]
+        Playlist rows, as loaded from ``playlist.json``.
+    """
+
+    def __init__(self, rows: Sequence[dict]):
+        self.rows = list(rows)
+        postings: Dict[str, List[int]] = {}
+        self._row_tokens: List[frozenset] = []
+        # Artists and parts repeat a lot: tokenize each distinct value once
+        seen_values: Dict[str, List[str]] = {}
+        for row_id, row in enumerate(self.rows):
+            tokens = set()
+            for field in SEARCH_FIELDS:
+                value = str(row.get(field) or '')
+                if value not in seen_values:
+                    seen_values[value] = tokenize(value)
+                tokens.update(seen_values[value])
+            self._row_tokens.append(frozenset(tokens))
+            for token in tokens:
+                postings.setdefault(token, []).append(row_id)
+        # Very short prefixes match a large part of the vocabulary, so their
+        # row lists are precomputed
+        short: Dict[str, set] = {}
+        for token, row_ids in postings.items():
+            for n in range(1, min(len(token), SHORT_PREFIX) + 1):
+                short.setdefault(token[:n], set()).update(row_ids)
+        self._postings = postings
+        self._short_prefixes = {p: sorted(ids) for p, ids in short.items()}
+        self._vocabulary = sorted(postings)
+
+    def _prefix_range(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def _row_matches(self, row_id: int, prefix: str) -> bool:
+        return any(t.startswith(prefix) for t in self._row_tokens[row_id])
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = 50,
+        accept: Optional[Callable[[dict], bool]] = None,
+    ) -> List[dict]:
+        """Return the rows matching every token of ``query``.
+
+        Parameters
+        ----------
+        query : str
+            Free text query; accents and case are ignored and the last
+            characters of each word may be omitted (prefix matching).
+        limit : int, optional
+            Maximum number of rows returned. None returns every match.
+        accept : callable, optional
+            Extra filter applied to matching rows before the limit.
+
+        Returns
+        -------
+        list[dict]
+            Matching rows, in playlist order.
+        """
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+
+        # Resolve every token to the sorted ids of the rows it prefixes,
+        # then intersect starting from the smallest list
+        candidate_lists = sorted(
+            (self._candidates(token) for token in tokens), key=len
+        )
+        candidates = candidate_lists[0]
+        if len(candidate_lists) > 1 and len(candidates) > ROW_CHECK_LIMIT:
+            matching = set(candidates)
+            for row_ids in candidate_lists[1:]:
+                matching.intersection_update(row_ids)
+            candidates = sorted(matching)
+            tokens = []
+
+        # Few candidates left: check the other tokens against each row
+        results = []
+        for row_id in candidates:
+            if not all(self._row_matches(row_id, p) for p in tokens):
+                continue
+            row = self.rows[row_id]
+            if accept is None or accept(row):
+                results.append(row)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def _candidates(self, prefix: str) -> List[int]:
+        if len(prefix) <= SHORT_PREFIX:
+            return self._short_prefixes.get(prefix, [])
+        vocabulary = self._prefix_range(prefix)
+        if len(vocabulary) == 1:
+            return self._postings[vocabulary[0]]
+        return sorted(
+            {
+                row_id
+                for token in vocabulary
+                for row_id in self._postings[token]
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+_indexes: dict = {}
+_indexes_lock = threading.Lock()
+# Builds running in the background, by index kind and playlist path
+_builds: Dict[Tuple[str, str], threading.Thread] = {}
+
+
+def get_search_index(playlist_path: str) -> SearchIndex:
+    """Return the search index of a playlist file, rebuilt when it changes.
+
+    A changed file is indexed again in the background while searches keep
+    using the previous index; only a first build is waited for (see
+    :func:`warm_search_indexes`).
+
+    Parameters
+    ----------
+    playlist_path : str
+        Path to the playlist JSON file.
+
+    Returns
+    -------
+    SearchIndex
+        Index of the current version of the file, or of the previous one
+        while it is being rebuilt.
+    """
+    return _get_index('search', _indexes, playlist_path, _build_search_index)
+
+
+def _build_search_index(
+    rows: Sequence[dict], previous: Optional[SearchIndex]
+) -> SearchIndex:
+    return SearchIndex(rows)
+
+
+def trigrams(text) -> set:
+    """Return the character trigrams of the compacted, normalized text.
+
+    Spaces and punctuation are dropped before the trigrams are taken, so
+    "10cc" and "10 cc" yield the same set. The text is padded so that the
+    first and last characters also start and end a trigram.
+
+    Parameters
+    ----------
+    text : Any
+        Text to split.
+
+    Returns
+    -------
+    set[str]
+        Trigrams of the text; empty if the text has no alphanumeric
+        characters.
+    """
+    compact = ''.join(tokenize(text))
+    if not compact:
+        return set()
+    padded = f'  {compact} '
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _row_key(row: dict) -> tuple:
+    return tuple(str(row.get(field) or '') for field in SEARCH_FIELDS)
+
+
+class FuzzyIndex:
+    """Typo-tolerant matcher over playlist rows using a trigram index.
+
+    Each field of a row is split into trigrams (see :func:`trigrams`) and
+    every trigram maps to the set of rows containing it. A row matches a
+    query when the share of query trigrams found in one of its fields, or in
+    the whole row, reaches ``min_similarity``.
+
+    Latency is bounded by prefix filtering rather than a linear scan: a row
+    sharing at least ``t`` of the query's ``n`` trigrams must contain one of
+    its ``n - t + 1`` rarest trigrams, so only the (short) posting lists of
+    those trigrams are read to collect candidates.
+
+    Parameters
+    ----------
+    rows : Sequence[dict]
+        Playlist rows, as loaded from ``playlist.json``.
+    min_similarity : float
+        Minimum share of query trigrams a row must contain to match.
+    """
+
+    def __init__(self, rows: Sequence[dict], min_similarity: float = 0.6):
+        self.min_similarity = min_similarity
+        self._postings: Dict[str, set] = {}
+        self._fields: Dict[int, List[frozenset]] = {}
+        self._rows: Dict[int, dict] = {}
+        self._ids: Dict[tuple, List[int]] = {}
+        self._position: Dict[int, int] = {}
+        self._next_id = 0
+        # Posting lists created by this index, as opposed to shared with
+        # the index it was copied from (see updated())
+        self._owned: set = set()
+        self.update(rows)
+
+    def _posting(self, gram: str) -> set:
+        # Copy on write: never modify a posting list a copy still reads
+        posting = self._postings.get(gram)
+        if gram not in self._owned:
+            posting = set(posting or ())
+            self._postings[gram] = posting
+            self._owned.add(gram)
+        return posting
+
+    def _add(self, row: dict, seen_values: Dict[str, frozenset]) -> int:
+        row_id = self._next_id
+        self._next_id += 1
+        fields = []
+        for field in SEARCH_FIELDS:
+            value = str(row.get(field) or '')
+            if value not in seen_values:
+                seen_values[value] = frozenset(trigrams(value))
+            fields.append(seen_values[value])
+        # Queries mixing artist and title are matched against the whole row
+        fields.append(frozenset().union(*fields))
+        self._rows[row_id] = row
+        self._fields[row_id] = fields
+        for gram in fields[-1]:
+            self._posting(gram).add(row_id)
+        return row_id
+
+    def _remove(self, row_id: int):
+        for gram in self._fields.pop(row_id)[-1]:
+            if gram not in self._postings:
+                continue
+            posting = self._posting(gram)
+            posting.discard(row_id)
+            if not posting:
+                del self._postings[gram]
+                self._owned.discard(gram)
+        del self._rows[row_id]
+
+    def update(self, rows: Sequence[dict]) -> Tuple[int, int]:
+        """Incrementally bring the index in line with ``rows``.
+
+        Rows are matched by content, so only added and removed rows touch
+        the posting lists; unchanged rows are kept as they are. The index
+        is modified in place: use :meth:`updated` while it is searched.
+
+        Parameters
+        ----------
+        rows : Sequence[dict]
+            New version of the playlist.
+
+        Returns
+        -------
+        tuple[int, int]
+            Number of rows added and removed.
+        """
+        available = {key: list(ids) for key, ids in self._ids.items()}
+        ids: Dict[tuple, List[int]] = {}
+        position: Dict[int, int] = {}
+        seen_values: Dict[str, frozenset] = {}
+        added = 0
+        for pos, row in enumerate(rows):
+            key = _row_key(row)
+            reusable = available.get(key)
+            if reusable:
+                row_id = reusable.pop(0)
+                self._rows[row_id] = row
+            else:
+                row_id = self._add(row, seen_values)
+                added += 1
+            ids.setdefault(key, []).append(row_id)
+            position[row_id] = pos
+
+        removed = 0
+        for leftovers in available.values():
+            for row_id in leftovers:
+                self._remove(row_id)
+                removed += 1
+        self._ids = ids
+        self._position = position
+        return added, removed
+
+    def updated(self, rows: Sequence[dict]) -> 'FuzzyIndex':
+        """Return a copy of the index brought in line with ``rows``.
+
+        This index is left untouched, so searches running on other threads
+        are not affected; posting lists of unchanged trigrams are shared
+        with the copy.
+        """
+        index = FuzzyIndex.__new__(FuzzyIndex)
+        index.min_similarity = self.min_similarity
+        index._postings = dict(self._postings)
+        index._fields = dict(self._fields)
+        index._rows = dict(self._rows)
+        index._ids = self._ids
+        index._position = self._position
+        index._next_id = self._next_id
+        index._owned = set()
+        index.update(rows)
+        return index
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = 50,
+        accept: Optional[Callable[[dict], bool]] = None,
+    ) -> List[dict]:
+        """Return the rows most similar to ``query``.
+
+        Parameters
+        ----------
+        query : str
+            Free text query, possibly misspelled.
+        limit : int, optional
+            Maximum number of rows returned. None returns every match.
+        accept : callable, optional
+            Extra filter applied to matching rows before the limit.
+
+        Returns
+        -------
+        list[dict]
+            Matching rows, best match first, then in playlist order.
+        """
+        wanted = trigrams(query)
+        if not wanted:
+            return []
+        needed = max(1, math.ceil(self.min_similarity * len(wanted)))
+
+        # Prefix filtering: candidates come from the rarest trigrams only
+        by_rarity = sorted(
+            wanted, key=lambda gram: len(self._postings.get(gram, ()))
+        )
+        candidates = set()
+        for gram in by_rarity[: len(wanted) - needed + 1]:
+            if len(candidates) >= FUZZY_CANDIDATE_LIMIT:
+                # Common words: rows holding the rarest trigrams are kept,
+                # which include every row containing the whole query
+                break
+            candidates.update(self._postings.get(gram, ()))
+
+        scored = []
+        for row_id in candidates:
+            best = 0.0
+            for field in self._fields[row_id]:
+                shared = len(wanted & field)
+                if shared < needed:
+                    continue
+                # Share of the query found, ties broken by field overlap
+                score = shared / len(wanted) + shared / len(wanted | field)
+                best = max(best, score)
+            if best:
+                scored.append((-best, self._position[row_id], row_id))
+        scored.sort()
+
+        results = []
+        for _, _, row_id in scored:
+            row = self._rows[row_id]
+            if accept is None or accept(row):
+                results.append(row)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+_fuzzy_indexes: dict = {}
+
+
+def get_fuzzy_index(playlist_path: str) -> FuzzyIndex:
+    """Return the fuzzy index of a playlist file, updated when it changes.
+
+    Like :func:`get_search_index`, a changed file is applied in the
+    background while searches keep using the previous index; it is applied
+    as an incremental update of a copy of that index, which then replaces
+    it.
+
+    Parameters
+    ----------
+    playlist_path : str
+        Path to the playlist JSON file.
+
+    Returns
+    -------
+    FuzzyIndex
+        Index matching the current version of the file, or the previous one
+        while it is being updated.
+    """
+    return _get_index(
+        'fuzzy', _fuzzy_indexes, playlist_path, _update_fuzzy_index
+    )
+
+
+def _update_fuzzy_index(
+    rows: Sequence[dict], previous: Optional[FuzzyIndex]
+) -> FuzzyIndex:
+    if previous is None:
+        return FuzzyIndex(rows)
+    # Searches still running on the previous index are unaffected
+    return previous.updated(rows)
+
+
+_INDEX_KINDS = (
+    ('search', _indexes, _build_search_index),
+    ('fuzzy', _fuzzy_indexes, _update_fuzzy_index),
+)
+
+
+def warm_search_indexes(playlist_path: str):
+    """Start building the search and fuzzy indexes of a playlist.
+
+    Building takes seconds on large playlists; called at startup, the first
+    searches do not have to wait for it.
+
+    Parameters
+    ----------
+    playlist_path : str
+        Path to the playlist JSON file.
+    """
+    signature = file_signature(playlist_path)
+    with _indexes_lock:
+        for kind, indexes, build in _INDEX_KINDS:
+            cached = indexes.get(playlist_path)
+            if cached is None or cached[0] != signature:
+                _start_build(kind, indexes, playlist_path, build)
+
+
+def wait_for_search_indexes(timeout: Optional[float] = None) -> bool:
+    """Block until the index builds running in the background are done."""
+    with _indexes_lock:
+        threads = list(_builds.values())
+    for thread in threads:
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+    return True
+
+
+def _get_index(
+    kind: str, indexes: dict, playlist_path: str, build: Callable
+) -> object:
+    signature = file_signature(playlist_path)
+    with _indexes_lock:
+        cached = indexes.get(playlist_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        thread = _start_build(kind, indexes, playlist_path, build)
+    if cached is not None:
+        return cached[1]
+    # Nothing to serve yet: wait for the first build, without starting a
+    # second one for concurrent searches
+    thread.join()
+    with _indexes_lock:
+        cached = indexes.get(playlist_path)
+    if cached is None:
+        # The build failed: raise its error in this request
+        return build(load_playlist(playlist_path), None)
+    return cached[1]
+
+
+def _start_build(
+    kind: str, indexes: dict, playlist_path: str, build: Callable
+) -> threading.Thread:
+    # Called with _indexes_lock held; one build at a time per index
+    thread = _builds.get((kind, playlist_path))
+    if thread is None:
+        thread = threading.Thread(
+            target=_run_build,
+            args=(kind, indexes, playlist_path, build),
+            name=f'karoloke-{kind}-index',
+            daemon=True,
+        )
+        _builds[(kind, playlist_path)] = thread
+        thread.start()
+    return thread
+
+
+def _run_build(kind: str, indexes: dict, playlist_path: str, build: Callable):
+    try:
+        # Read before the rows: a change made meanwhile is picked up by the
+        # next search
+        signature = file_signature(playlist_path)
+        rows = load_playlist(playlist_path)
+        with _indexes_lock:
+            cached = indexes.get(playlist_path)
+        index = build(rows, None if cached is None else cached[1])
+        with _indexes_lock:
+            indexes[playlist_path] = (signature, index)
+    finally:
+        with _indexes_lock:
+            del _builds[(kind, playlist_path)]
@@ -9,3 +9,129 @@ VIDEO_DIR = os.path.join(os.path.dirname(__file__), 'videos')
 PLAYER_TEMPLATE = 'player.html'
 VIDEO_PATH_SETUP_TEMPLATE = 'video_path_setup.html'
 SETTINGS_TEMPLATE = 'settings.html'
+
+# Per-user data folder (outlives restarts of the PyInstaller executable)
+CACHE_DIR = os.environ.get(
+    'KAROLOKE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.karoloke')
+)
+CATALOG_DB = os.path.join(CACHE_DIR, 'catalog.sqlite3')
+
+# Catalog watcher backend: 'auto' (inotify when available, except on network
+# shares), 'inotify' or 'poll'
+CATALOG_WATCHER = 'auto'
+# Seconds between two directory polls when inotify is not available
+CATALOG_POLL_INTERVAL = 2.0
+
+# Number of ffprobe checks running in parallel
+PROBE_WORKERS = min(4, os.cpu_count() or 1)
+# Number of finished probes applied to the cache (and database) at once
+PROBE_BATCH_SIZE = 50
+
+# Video validation: 'full' runs ffprobe after the container header check,
+# 'fast' trusts the header check alone
+VALIDATION_MODE = 'full'
+
+# Seconds browsers may reuse a video without revalidating it
+VIDEO_MAX_AGE = 3600
+# Wallpapers rarely change: let the TV browser keep them for a week
+BACKGROUND_MAX_AGE = 7 * 24 * 3600
+# Read size used when a video range is streamed without a server file wrapper
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Seconds between two lookups of the LAN address shown in QR codes
+LOCAL_ADDRESS_REFRESH_INTERVAL = 60.0
+
+# Production server (``karoloke --production`` or KAROLOKE_PRODUCTION=1)
+SERVER_PRODUCTION = os.environ.get('KAROLOKE_PRODUCTION', '') == '1'
+# Asyncio server (``karoloke --asgi`` or KAROLOKE_ASGI=1, needs uvicorn)
+SERVER_ASGI = os.environ.get('KAROLOKE_ASGI', '') == '1'
+# Requests handled at the same time
+SERVER_THREADS = 16
+# Open connections accepted before new clients have to wait
+SERVER_CONNECTION_LIMIT = 200
+# Seconds an idle (keep-alive) or stalled connection is kept open
+SERVER_CHANNEL_TIMEOUT = 60
+
+# Seconds between two keep-alive comments on idle /events streams
+EVENTS_HEARTBEAT = 15.0
+# /events streams open at the same time under the thread-per-request
+# servers, where each one holds a thread (the ASGI server has no limit);
+# further pages poll /get_queue instead
+EVENTS_WSGI_STREAMS = 2
+
+# Page-cache prewarming of the next queued songs
+PREFETCH_DEPTH = 2
+# Bytes read ahead at the start of each of those songs
+PREFETCH_HEAD_BYTES = 32 * 1024 * 1024
+# Read budget of the prefetcher in bytes per second (0: unlimited)
+PREFETCH_RATE = 32 * 1024 * 1024
+
+# Local copy of queued videos, for a VIDEO_DIR on a slow network mount
+# (``karoloke --video-cache DIR`` or KAROLOKE_VIDEO_CACHE_DIR; empty: off)
+VIDEO_CACHE_DIR = os.environ.get('KAROLOKE_VIDEO_CACHE_DIR', '')
+# Size budget of that cache; least recently played copies are evicted
+VIDEO_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+# Queued songs copied ahead into the cache
+VIDEO_CACHE_DEPTH = 3
+
+# Background media jobs (ffmpeg): state kept across restarts
+MEDIA_JOBS_DB = os.path.join(CACHE_DIR, 'jobs.sqlite3')
+# Jobs running at the same time
+MEDIA_JOB_WORKERS = 1
+# Fraction of the CPUs the media jobs may use on average
+MEDIA_JOB_CPU_SHARE = 0.25
+
+# Poster frames and short preview clips of the catalog videos
+# (``karoloke --previews`` or KAROLOKE_PREVIEWS=1; needs ffmpeg)
+PREVIEWS_ENABLED = os.environ.get('KAROLOKE_PREVIEWS', '') == '1'
+PREVIEW_DIR = os.path.join(CACHE_DIR, 'previews')
+# Position of the poster frame and start of the clip, in seconds
+PREVIEW_OFFSET = 30
+# Length of the preview clips, in seconds
+PREVIEW_SECONDS = 8
+# Width of posters and clips, in pixels
+PREVIEW_WIDTH = 320
+
+# Browser-friendly MP4 renditions of videos browsers cannot play
+# (``karoloke --transcode`` or KAROLOKE_TRANSCODE=1; needs ffmpeg)
+TRANSCODE_ENABLED = os.environ.get('KAROLOKE_TRANSCODE', '') == '1'
+TRANSCODE_DIR = os.path.join(CACHE_DIR, 'renditions')
+# Source formats converted, in addition to VIDEO_FORMATS files that fail to
+# decode in browsers
+TRANSCODE_FORMATS = (
+    '.avi',
+    '.mkv',
+    '.mov',
+    '.m4v',
+    '.mpg',
+    '.mpeg',
+    '.wmv',
+    '.flv',
+    '.vob',
+    '.ts',
+)
+# Transcoding jobs running at the same time
+TRANSCODE_WORKERS = 1
+# /video/<RENDITION_PREFIX>/<name> serves a file of TRANSCODE_DIR
+RENDITION_PREFIX = '.renditions'
+
+# Fast-start copies of MP4s that keep their index (moov) after the media
+# data (``karoloke --faststart`` or KAROLOKE_FASTSTART=1; needs ffmpeg).
+# They are written next to the transcoded renditions.
+FASTSTART_ENABLED = os.environ.get('KAROLOKE_FASTSTART', '') == '1'
+# Time-to-first-frame reports above this (ms) are discarded as bogus
+TTFF_MAX_MS = 10 * 60 * 1000
+
+# Multi-bitrate HLS copies of the queued songs, for players on weak Wi-Fi
+# (``karoloke --hls`` or KAROLOKE_HLS=1; needs ffmpeg). Browsers without
+# native HLS keep playing the original file.
+HLS_ENABLED = os.environ.get('KAROLOKE_HLS', '') == '1'
+HLS_DIR = os.path.join(CACHE_DIR, 'hls')
+# Size budget of the packages; least recently played ones are evicted
+HLS_MAX_BYTES = 5 * 1024 * 1024 * 1024
+# Queued songs packaged ahead
+HLS_DEPTH = 2
+# (height, video kbit/s, audio kbit/s) of each variant
+HLS_VARIANTS = ((360, 800, 96), (720, 2500, 128))
+# Target segment duration, in seconds
+HLS_SEGMENT_SECONDS = 4
@@ -1,10 +1,38 @@
+import argparse
 import os
 import sys
 import threading
 import webbrowser
 
-from karoloke.jukebox_router import app
-from karoloke.settings import BACKGROUND_DIR, VIDEO_DIR
+from waitress import serve
+
+from karoloke.asgi import create_asgi_app
+from karoloke.catalog_store import open_catalog_store
+from karoloke.catalog_watcher import watch_catalog
+from karoloke.faststart import start_faststart
+from karoloke.hls import open_hls_packager
+from karoloke.jukebox_router import app, playlist_path
+from karoloke.network import get_local_address
+from karoloke.previews import generate_previews
+from karoloke.search import warm_search_indexes
+from karoloke.settings import (
+    BACKGROUND_DIR,
+    CATALOG_DB,
+    FASTSTART_ENABLED,
+    HLS_ENABLED,
+    PREVIEWS_ENABLED,
+    SERVER_ASGI,
+    SERVER_CHANNEL_TIMEOUT,
+    SERVER_CONNECTION_LIMIT,
+    SERVER_PRODUCTION,
+    SERVER_THREADS,
+    TRANSCODE_ENABLED,
+    TRANSCODE_WORKERS,
+    VIDEO_CACHE_DIR,
+    VIDEO_DIR,
+)
+from karoloke.transcoder import start_transcoding
+from karoloke.video_cache import open_video_cache
 
 
 def open_browser():
@@ -55,12 +83,157 @@ def open_browser():
             print('=' * 60 + '\n')
 
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parse the command line options of the karoloke server.
+
+    Unknown arguments are ignored, so that wrappers (e.g. the PyInstaller
+    bootloader or a test runner) can pass their own options through.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to ``sys.argv``.
+
+    Returns:
+        argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(
+        prog='karoloke', description='Start the Karoloke karaoke server.'
+    )
+    parser.add_argument(
+        '--production',
+        action='store_true',
+        default=SERVER_PRODUCTION,
+        help='serve with the multi-threaded waitress server, debug off',
+    )
+    parser.add_argument(
+        '--asgi',
+        action='store_true',
+        default=SERVER_ASGI,
+        help='serve with the asyncio uvicorn server, which keeps many idle '
+        'phone connections cheap (needs uvicorn), debug off',
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=SERVER_THREADS,
+        help='requests handled at the same time (production and asgi)',
+    )
+    parser.add_argument(
+        '--connection-limit',
+        type=int,
+        default=SERVER_CONNECTION_LIMIT,
+        help='maximum number of open connections (production only)',
+    )
+    parser.add_argument(
+        '--channel-timeout',
+        type=int,
+        default=SERVER_CHANNEL_TIMEOUT,
+        help='seconds before an idle keep-alive or stalled connection is '
+        'closed (production and asgi)',
+    )
+    parser.add_argument(
+        '--video-cache',
+        metavar='DIR',
+        default=VIDEO_CACHE_DIR,
+        help='local folder (e.g. on an SSD) where queued songs are copied '
+        'ahead when the video folder is on a slow network share',
+    )
+    parser.add_argument(
+        '--previews',
+        action='store_true',
+        default=PREVIEWS_ENABLED,
+        help='generate a poster frame and a short preview clip of every '
+        'song for the song book, at low priority (needs ffmpeg)',
+    )
+    parser.add_argument(
+        '--transcode',
+        action='store_true',
+        default=TRANSCODE_ENABLED,
+        help='convert AVI, MKV and other videos browsers cannot play into '
+        'cached MP4 copies in the background (needs ffmpeg)',
+    )
+    parser.add_argument(
+        '--transcode-jobs',
+        type=int,
+        default=TRANSCODE_WORKERS,
+        help='videos converted at the same time',
+    )
+    parser.add_argument(
+        '--faststart',
+        action='store_true',
+        default=FASTSTART_ENABLED,
+        help='make fast-start copies of MP4s whose index is stored at the '
+        'end, so they start playing at once (needs ffmpeg)',
+    )
+    parser.add_argument(
+        '--hls',
+        action='store_true',
+        default=HLS_ENABLED,
+        help='package the next queued songs as multi-bitrate HLS, so '
+        'players on weak Wi-Fi can lower the quality (needs ffmpeg)',
+    )
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+def serve_asgi(args: argparse.Namespace):
+    """
+    Serve the app with uvicorn through the ASGI bridge.
+
+    Args:
+        args (argparse.Namespace): Options returned by ``parse_args``.
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The --asgi mode needs uvicorn: pip install 'karoloke[asgi]'")
+    uvicorn.run(
+        create_asgi_app(app, max_workers=args.threads),
+        host='0.0.0.0',
+        port=5000,
+        timeout_keep_alive=args.channel_timeout,
+        log_level='warning',
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
     # Ensure video and backgrounds folders exist
     os.makedirs(BACKGROUND_DIR, exist_ok=True)
     os.makedirs(VIDEO_DIR, exist_ok=True)
+    # Restore the video catalog from disk and keep it in sync while running
+    open_catalog_store(CATALOG_DB)
+    watch_catalog(VIDEO_DIR)
+    if args.previews:
+        # Poster frames and preview clips for the song book (needs ffmpeg)
+        generate_previews(VIDEO_DIR)
+    if args.transcode:
+        start_transcoding(VIDEO_DIR, args.transcode_jobs)
+    if args.faststart:
+        start_faststart(VIDEO_DIR)
+    if args.hls:
+        open_hls_packager()
+    if args.video_cache:
+        open_video_cache(args.video_cache)
+    # Resolve the LAN address for QR codes off the request path
+    get_local_address().start()
+    # Index the song book before the first search
+    warm_search_indexes(playlist_path)
     threading.Timer(1.0, open_browser).start()
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    if args.asgi:
+        serve_asgi(args)
+    elif args.production:
+        # Thread pool with keep-alive; Flask debug mode stays off
+        serve(
+            app,
+            host='0.0.0.0',
+            port=5000,
+            threads=args.threads,
+            connection_limit=args.connection_limit,
+            channel_timeout=args.channel_timeout,
+        )
+    else:
+        app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
 
 
 if __name__ == '__main__':
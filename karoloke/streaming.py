@@ -0,0 +1,261 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+from flask import Response, current_app, request
+from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+
+from karoloke.metrics import get_metrics
+from karoloke.settings import STREAM_CHUNK_SIZE, VIDEO_MAX_AGE
+
+
+class FileRange:
+    """Iterable over ``length`` bytes of a file, starting at its position.
+
+    Used when the WSGI server does not provide ``wsgi.file_wrapper``; the
+    file is closed together with the response.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        File opened in binary mode and positioned at the first byte.
+    length : int
+        Number of bytes to yield.
+    chunk_size : int
+        Size of each read.
+    """
+
+    def __init__(
+        self, f: BinaryIO, length: int, chunk_size: int = STREAM_CHUNK_SIZE
+    ):
+        self.file = f
+        self.remaining = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        while self.remaining > 0:
+            data = self.file.read(min(self.chunk_size, self.remaining))
+            if not data:
+                break
+            self.remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+class CountingFile:
+    """File handed to the server that counts the bytes it sends.
+
+    The bytes read are added to the ``bytes_served`` metric of ``song``, up
+    to ``length`` bytes, so a client that disconnects early only counts
+    what was sent to it. Bytes read again after a seek back (servers that
+    peek at the file before sending it) are counted once. Servers sending
+    the file with ``sendfile`` (through :meth:`fileno`) do not read it: the
+    whole span is counted for them.
+
+    ``on_sent`` is called with each number of bytes counted, e.g. so the
+    :class:`~karoloke.video_cache.VideoCache` counts the bytes it saved.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        File opened in binary mode and positioned at the first byte.
+    length : int
+        Number of bytes in the response.
+    song : str
+        Song the bytes are counted for.
+    on_sent : callable, optional
+        Called with the number of bytes as they are counted.
+    """
+
+    def __init__(
+        self,
+        f: BinaryIO,
+        length: int,
+        song: str,
+        on_sent: Optional[Callable[[int], None]] = None,
+    ):
+        self.file = f
+        self.song = song
+        self.on_sent = on_sent
+        # Furthest position counted so far, and end of the response
+        self._counted = f.tell()
+        self._end = self._counted + length
+        self._read = False
+        self._sendfile = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self._read = True
+        self._count_to(self.file.tell())
+        return data
+
+    def _count_to(self, position: int):
+        position = min(position, self._end)
+        if position > self._counted:
+            sent = position - self._counted
+            get_metrics().increment('bytes_served', self.song, sent)
+            if self.on_sent is not None:
+                self.on_sent(sent)
+            self._counted = position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def fileno(self) -> int:
+        self._sendfile = True
+        return self.file.fileno()
+
+    def close(self):
+        if self._sendfile and not self._read:
+            self._count_to(self._end)
+        self.file.close()
+
+
+def video_mimetype(filename: str) -> str:
+    """Return the ``Content-Type`` of a video file, from its extension."""
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Return a strong validator that changes whenever the file changes."""
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+
+def _if_range_matches(etag: str, mtime: datetime) -> bool:
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        # No If-Range header: the range always applies
+        return 'If-Range' not in request.headers
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date == mtime
+
+
+def _requested_span(
+    size: int, etag: str, mtime: datetime
+) -> Tuple[Optional[Tuple[int, int]], bool]:
+    """Return ``((start, stop), satisfiable)`` for the Range header."""
+    ranges = request.range
+    if ranges is None or ranges.units != 'bytes':
+        return None, True
+    if len(ranges.ranges) != 1 or not _if_range_matches(etag, mtime):
+        # Multipart ranges are not supported: send the whole file
+        return None, True
+    span = ranges.range_for_length(size)
+    return span, span is not None
+
+
+def send_video(
+    directory: str,
+    filename: str,
+    max_age: int = VIDEO_MAX_AGE,
+    source: Optional[str] = None,
+    song: Optional[str] = None,
+    on_sent: Optional[Callable[[int], None]] = None,
+) -> Response:
+    """Stream a file with Range, If-Range and conditional GET support.
+
+    Responses carry a strong ETag (size and mtime), ``Last-Modified``,
+    ``Accept-Ranges`` and a public ``Cache-Control``, so browsers can
+    revalidate with a 304 and resume or seek with a 206.
+
+    When the WSGI server provides ``wsgi.file_wrapper`` the file is handed
+    to it positioned at the first requested byte, with ``Content-Length``
+    bounding the transfer (PEP 3333); servers such as gunicorn then send it
+    with ``sendfile`` without copying it through Python. The bytes sent are
+    recorded per song in the ``bytes_served`` metric as the server reads
+    them (see :class:`CountingFile`).
+
+    Parameters
+    ----------
+    directory : str
+        Directory the file must be inside.
+    filename : str
+        Path of the file relative to ``directory``.
+    max_age : int
+        ``Cache-Control`` max-age, in seconds.
+    source : str, optional
+        Local copy to read instead of the file, e.g. from the
+        :class:`~karoloke.video_cache.VideoCache`. It has the same size and
+        mtime, hence the same validators.
+    song : str, optional
+        Song the ``requests`` and ``bytes_served`` metrics are counted for;
+        by default, the file name without its extension.
+    on_sent : callable, optional
+        Called with the number of bytes as they are sent (see
+        :class:`CountingFile`).
+
+    Returns
+    -------
+    Response
+        200, 206, 304 or 416 response.
+
+    Raises
+    ------
+    NotFound
+        If the file does not exist or is outside ``directory``.
+    """
+    path = safe_join(directory, filename)
+    if path is None:
+        raise NotFound()
+    if source is not None:
+        path = source
+    if not os.path.isfile(path):
+        raise NotFound()
+    stat = os.stat(path)
+    size = stat.st_size
+    # HTTP dates have a one second resolution
+    mtime = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    etag = file_etag(stat)
+
+    response = current_app.response_class(
+        mimetype=video_mimetype(filename),
+        direct_passthrough=True,
+    )
+    response.set_etag(etag)
+    response.last_modified = mtime
+    response.accept_ranges = 'bytes'
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+
+    if song is None:
+        song = os.path.splitext(os.path.basename(filename))[0]
+    metrics = get_metrics()
+    metrics.increment('requests', song)
+
+    if not is_resource_modified(
+        request.environ, etag=etag, last_modified=mtime, ignore_if_range=True
+    ):
+        response.status_code = 304
+        return response
+
+    span, satisfiable = _requested_span(size, etag, mtime)
+    if not satisfiable:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    start, stop = span if span else (0, size)
+    length = stop - start
+    if span:
+        response.status_code = 206
+        response.content_range = f'bytes {start}-{stop - 1}/{size}'
+
+    response.content_length = length
+    if request.method != 'HEAD':
+        f = open(path, 'rb')
+        f.seek(start)
+        f = CountingFile(f, length, song, on_sent)
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            response.response = file_wrapper(f, STREAM_CHUNK_SIZE)
+        else:
+            response.response = FileRange(f, length)
+    return response
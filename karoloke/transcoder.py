@@ -0,0 +1,344 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from karoloke.catalog import (
+    CatalogEntry,
+    get_catalog,
+    register_rendition,
+)
+from karoloke.media_jobs import (
+    MediaJobQueue,
+    discard_output,
+    get_job_store,
+    replace_output,
+    run_ffmpeg,
+)
+from karoloke.settings import (
+    TRANSCODE_DIR,
+    TRANSCODE_FORMATS,
+    TRANSCODE_WORKERS,
+    VIDEO_FORMATS,
+)
+
+TRANSCODE = 'transcode'
+# Codecs every HTML5 browser decodes
+BROWSER_VIDEO_CODECS = {'h264', 'vp8', 'vp9', 'av1'}
+BROWSER_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'vorbis'}
+# H.264 profiles outside these (High 10, 4:2:2, 4:4:4) fail in browsers
+BROWSER_H264_PROFILES = {'Baseline', 'Constrained Baseline', 'Main', 'High'}
+
+
+def probe_streams(path: str, ffprobe: str) -> Optional[Dict[str, dict]]:
+    """Return the first video and audio streams of ``path``.
+
+    Parameters
+    ----------
+    path : str
+        Video file.
+    ffprobe : str
+        Path to the ``ffprobe`` executable.
+
+    Returns
+    -------
+    dict or None
+        ``{'video': {...}, 'audio': {...}}`` with the ``codec_name``,
+        ``profile`` and ``pix_fmt`` reported by ffprobe (missing streams are
+        empty dicts), or None if the file cannot be read.
+    """
+    try:
+        result = subprocess.run(
+            [
+                ffprobe,
+                '-v',
+                'error',
+                '-show_entries',
+                'stream=codec_type,codec_name,profile,pix_fmt',
+                '-of',
+                'json',
+                path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+            check=False,
+        )
+        streams = json.loads(result.stdout or b'{}').get('streams', [])
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    if result.returncode != 0:
+        return None
+    found: Dict[str, dict] = {'video': {}, 'audio': {}}
+    for stream in streams:
+        kind = stream.get('codec_type')
+        if kind in found and not found[kind]:
+            found[kind] = stream
+    return found
+
+
+def browser_compatible(streams: Dict[str, dict]) -> Dict[str, bool]:
+    """Tell which streams browsers can decode as they are.
+
+    Returns
+    -------
+    dict
+        ``{'video': bool, 'audio': bool}``; a missing stream counts as
+        compatible.
+    """
+    video = streams['video']
+    audio = streams['audio']
+    video_ok = not video or (
+        video.get('codec_name') in BROWSER_VIDEO_CODECS
+        and video.get('pix_fmt', 'yuv420p') == 'yuv420p'
+        and (
+            video.get('codec_name') != 'h264'
+            or video.get('profile') in BROWSER_H264_PROFILES
+        )
+    )
+    audio_ok = not audio or audio.get('codec_name') in BROWSER_AUDIO_CODECS
+    return {'video': video_ok, 'audio': audio_ok}
+
+
+class Transcoder:
+    """Convert videos browsers cannot play into cached MP4 renditions.
+
+    Candidates are files in ``TRANSCODE_FORMATS`` (AVI, MKV...), which the
+    catalog ignores, and catalog files whose codecs browsers fail to decode
+    (e.g. H.264 High 10). Each one is checked with ``ffprobe``; streams
+    that are already browser-friendly are copied, the others re-encoded to
+    H.264 (yuv420p) and AAC, and the MP4 is written with its index first.
+
+    Jobs run on a :class:`~karoloke.media_jobs.MediaJobQueue`, whose state
+    persists across restarts. A finished rendition is registered in the
+    catalog (see :func:`~karoloke.catalog.register_rendition`), so the song
+    resolves to it everywhere, ``get_video_file`` included.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the video library.
+    output_dir : str
+        Directory of the renditions.
+    ffmpeg, ffprobe : str or None
+        Paths to the executables; None disables transcoding.
+    workers : int
+        Transcoding jobs running at the same time.
+    **kwargs
+        Passed to :class:`~karoloke.media_jobs.MediaJobQueue`.
+    """
+
+    def __init__(
+        self,
+        video_dir: str,
+        output_dir: str = TRANSCODE_DIR,
+        ffmpeg: Optional[str] = None,
+        ffprobe: Optional[str] = None,
+        workers: int = TRANSCODE_WORKERS,
+        **kwargs,
+    ):
+        self.video_dir = os.path.abspath(str(video_dir))
+        self.output_dir = output_dir
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        os.makedirs(output_dir, exist_ok=True)
+        self.jobs = MediaJobQueue(
+            {TRANSCODE: self.transcode}, workers=workers, **kwargs
+        )
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None and self.ffprobe is not None
+
+    def sources(self) -> Iterator[CatalogEntry]:
+        """Iterate over the files in ``TRANSCODE_FORMATS`` of the library."""
+        formats = tuple(ext.lower() for ext in TRANSCODE_FORMATS)
+        for dirpath, _, filenames in os.walk(self.video_dir):
+            for name in sorted(filenames):
+                ext = os.path.splitext(name)[1].lower()
+                if ext not in formats:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_size > 0:
+                    yield CatalogEntry(
+                        path, stat.st_size, ext, stat.st_mtime_ns
+                    )
+
+    def scan(self) -> int:
+        """Schedule every candidate of the library and register the
+        renditions already made.
+
+        Returns
+        -------
+        int
+            Number of jobs scheduled.
+        """
+        if not self.available:
+            return 0
+        catalog = get_catalog(self.video_dir)
+        # A song already available in a browser format needs no conversion
+        candidates: List[CatalogEntry] = [
+            entry
+            for entry in self.sources()
+            if self._unavailable(catalog, entry)
+        ]
+        candidates += [
+            entry
+            for entry in catalog.entries()
+            if entry.size > 0 and not catalog.is_rendition(entry)
+        ]
+        pending = []
+        for entry in candidates:
+            output = self.jobs.result(TRANSCODE, entry)
+            if output is not None:
+                self._register(entry, output)
+            else:
+                pending.append(entry)
+        return self.jobs.submit_many(TRANSCODE, pending)
+
+    @staticmethod
+    def _unavailable(catalog, entry: CatalogEntry) -> bool:
+        song_num = os.path.splitext(os.path.basename(entry.path))[0]
+        current = catalog.lookup(song_num)
+        return current is None or catalog.is_rendition(current)
+
+    def _register(self, source: CatalogEntry, output: str):
+        stat = os.stat(output)
+        rendition = CatalogEntry(
+            output, stat.st_size, '.mp4', stat.st_mtime_ns
+        )
+        song_num = os.path.splitext(os.path.basename(source.path))[0]
+        register_rendition(self.video_dir, song_num, rendition)
+
+    def rendition_path(self, entry: CatalogEntry) -> str:
+        """Return where the rendition of ``entry`` is written."""
+        song_num = os.path.splitext(os.path.basename(entry.path))[0]
+        key = f'{entry.path}\0{entry.size}\0{entry.mtime_ns}'.encode()
+        digest = hashlib.sha1(key).hexdigest()[:12]
+        return os.path.join(self.output_dir, f'{song_num}-{digest}.mp4')
+
+    def command(
+        self, entry: CatalogEntry, streams: Dict[str, dict], part: str
+    ) -> List[str]:
+        """Return the ffmpeg command line converting ``entry``."""
+        compatible = browser_compatible(streams)
+        args = [self.ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', entry.path]
+        args += ['-map', '0:v:0?', '-map', '0:a:0?']
+        if compatible['video']:
+            args += ['-c:v', 'copy']
+        else:
+            args += [
+                '-c:v',
+                'libx264',
+                '-profile:v',
+                'high',
+                '-pix_fmt',
+                'yuv420p',
+                '-preset',
+                'veryfast',
+                '-crf',
+                '21',
+            ]
+        if compatible['audio']:
+            args += ['-c:a', 'copy']
+        else:
+            args += ['-c:a', 'aac', '-b:a', '160k']
+        args += ['-threads', '1', '-movflags', '+faststart', '-f', 'mp4', part]
+        return args
+
+    def transcode(self, entry: CatalogEntry) -> Optional[str]:
+        """Convert ``entry`` if browsers cannot play it.
+
+        Returns
+        -------
+        str or None
+            Path of the rendition, or None if the file plays as it is.
+
+        Raises
+        ------
+        RuntimeError
+            If the file cannot be read or ffmpeg fails.
+        """
+        streams = probe_streams(entry.path, self.ffprobe)
+        if streams is None or not streams['video']:
+            raise RuntimeError(f'no video stream in {entry.path}')
+        compatible = browser_compatible(streams)
+        if entry.ext in VIDEO_FORMATS and all(compatible.values()):
+            return None
+        output = self.rendition_path(entry)
+        part = output + '.part'
+        # Whole songs are long: allow up to an hour per file
+        if not run_ffmpeg(self.command(entry, streams, part), timeout=3600):
+            discard_output(part, f'ffmpeg failed to convert {entry.path}')
+        replace_output(part, output)
+        self._register(entry, output)
+        return output
+
+
+_transcoders: Dict[str, Transcoder] = {}
+_transcoders_lock = threading.Lock()
+
+
+def get_transcoder(
+    video_dir: str, workers: int = TRANSCODE_WORKERS
+) -> Transcoder:
+    """Return the shared transcoder of ``video_dir``.
+
+    Jobs left unfinished by the previous run are resumed on first use.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the video library.
+    workers : int
+        Transcoding jobs running at the same time, used when the
+        transcoder is created.
+    """
+    key = os.path.abspath(str(video_dir))
+    with _transcoders_lock:
+        transcoder = _transcoders.get(key)
+        if transcoder is None:
+            transcoder = Transcoder(
+                key,
+                ffmpeg=shutil.which('ffmpeg'),
+                ffprobe=shutil.which('ffprobe'),
+                workers=workers,
+                store=get_job_store(),
+            )
+            if transcoder.available:
+                transcoder.jobs.resume()
+            _transcoders[key] = transcoder
+        return transcoder
+
+
+def start_transcoding(
+    video_dir: str, workers: int = TRANSCODE_WORKERS
+) -> bool:
+    """Scan ``video_dir`` for videos to convert, in a background thread.
+
+    Parameters
+    ----------
+    video_dir : str
+        Root directory of the video library.
+    workers : int
+        Transcoding jobs running at the same time.
+
+    Returns
+    -------
+    bool
+        False if ffmpeg or ffprobe is not installed.
+    """
+    transcoder = get_transcoder(video_dir, workers)
+    if not transcoder.available:
+        return False
+    threading.Thread(
+        target=transcoder.scan, name='karoloke-transcode-scan', daemon=True
+    ).start()
+    return True
@@ -1,8 +1,42 @@
+import json
 import os
 import shutil
 import subprocess
+import threading
+from typing import Iterator, Optional, Tuple
 
-from karoloke.settings import VIDEO_FORMATS
+from karoloke.container_sniffer import sniff_container
+from karoloke.settings import VALIDATION_MODE, VIDEO_FORMATS
+
+
+def iter_playlist(root_dir: str) -> Iterator[str]:
+    """
+    Lazily yield the video files found in the root directory and its subdirectories.
+
+    Note:
+        Only files with an extension listed in ``VIDEO_FORMATS`` are yielded and
+        each file name (basename, including the extension) is yielded at most once:
+        when the same name exists in several folders, only the first one found is
+        kept. Duplicate detection uses a set, so the walk stays linear.
+
+    Args:
+        root_dir (str): The root directory to search for video files.
+
+    Yields:
+        str: Path to each video file.
+    """
+    seen = set()
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            # Check for common HTML5 video extensions
+            if not filename.lower().endswith(VIDEO_FORMATS):
+                continue
+
+            # Skip if a file with the same name was already yielded
+            if filename in seen:
+                continue
+            seen.add(filename)
+            yield os.path.join(dirpath, filename)
 
 
 def collect_playlist(root_dir: str) -> list:
@@ -10,9 +44,11 @@ def collect_playlist(root_dir: str) -> list:
     Collects all video files from the specified root directory and its subdirectories.
 
     Note:
-        This function searches for files with the '.mp4' extension and it is not
-        allowed to have duplicate filenames in the list. If a file with the same name
-        already exists in the list, it will be skipped.
+        This function searches for files with the extensions listed in
+        ``VIDEO_FORMATS`` and it is not allowed to have duplicate filenames in the
+        list. If a file with the same name already exists in the list, it will be
+        skipped. Use ``iter_playlist`` to stream or count the files without
+        building the list.
 
     Args:
         root_dir (str): The root directory to search for video files.
@@ -20,33 +56,99 @@ def collect_playlist(root_dir: str) -> list:
     Returns:
         list: A list of paths to video files.
     """
-    video_files = []
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            # Skip if the file is already in the list
-            if filename in video_files:
-                continue
+    return list(iter_playlist(root_dir))
 
-            # Check for common HTML5 video extensions
-            if filename.lower().endswith(VIDEO_FORMATS):
-                video_files.append(os.path.join(dirpath, filename))
 
-    return video_files
+_UNSET = object()
+
+_playlist_cache: dict = {}
+_playlist_cache_lock = threading.Lock()
 
 
-def is_playable(path: str) -> bool:
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Return a cheap change marker for a file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    Returns
+    -------
+    tuple[int, int] or None
+        ``(mtime_ns, size)`` of the file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_playlist(path: str) -> list:
+    """
+    Load the playlist JSON file, parsing it again only when it changes.
+
+    The parsed list is memoized per path and reused as long as the file
+    mtime and size are unchanged, so a request only pays for one ``stat``.
+    The returned list is shared between callers and must not be modified.
+
+    Parameters
+    ----------
+    path : str
+        Path to the playlist JSON file.
+
+    Returns
+    -------
+    list
+        Playlist rows, or an empty list if the file is missing or invalid.
+    """
+    signature = file_signature(path)
+    with _playlist_cache_lock:
+        cached = _playlist_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    data = []
+    if signature is not None:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = []
+
+    with _playlist_cache_lock:
+        _playlist_cache[path] = (signature, data)
+    return data
+
+
+def is_playable(
+    path: str, ffprobe=_UNSET, mode: str = VALIDATION_MODE
+) -> bool:
     """
     Perform a lightweight check that a video file is likely playable by the browser.
 
-    The validation follows two steps:
+    The validation follows three steps:
     1. Basic file checks: existence and file size > 0.
-    2. Optional ffprobe probe: if `ffprobe` is available in PATH, run a quick
+    2. Container sniffing: the first and last few KB of MP4, WebM and Ogg
+       files are checked for a sane header, which rejects truncated and
+       zero-filled files without spawning a subprocess.
+    3. Optional ffprobe probe: if `ffprobe` is available in PATH, run a quick
        probe and ensure it returns success; otherwise, fall back to the basic check.
+       This step is skipped in ``'fast'`` validation mode.
 
     Parameters
     ----------
     path : str
         Absolute path to the video file to validate.
+    ffprobe : str or None, optional
+        Path to the ``ffprobe`` executable, or None if it is not available.
+        When omitted, it is looked up in PATH on every call; callers probing
+        many files should resolve it once and pass it in.
+    mode : str, optional
+        ``'full'`` (sniffing then ffprobe) or ``'fast'`` (sniffing only).
+        Defaults to ``VALIDATION_MODE`` from the settings.
 
     Returns
     -------
@@ -62,14 +164,22 @@ def is_playable(path: str) -> bool:
     except OSError:
         return False
 
+    # Reserve ffprobe for files whose container header looks sane
+    if sniff_container(path) is False:
+        return False
+    if mode == 'fast':
+        return True
+
+    if ffprobe is _UNSET:
+        ffprobe = shutil.which('ffprobe')
     # If ffprobe is not available, accept based on size check
-    if shutil.which('ffprobe') is None:
+    if ffprobe is None:
         return True
 
     try:
         result = subprocess.run(
             [
-                'ffprobe',
+                ffprobe,
                 '-v',
                 'error',
                 '-select_streams',
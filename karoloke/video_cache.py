@@ -0,0 +1,263 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from karoloke.catalog import CatalogEntry
+from karoloke.settings import VIDEO_CACHE_MAX_BYTES
+
+PART_SUFFIX = '.part'
+
+
+def cache_name(entry: CatalogEntry) -> str:
+    """Return the file name of the cached copy of ``entry``.
+
+    The name depends on the origin path, size and mtime, so a song replaced
+    on the origin never matches the copy of its previous version.
+    """
+    key = f'{entry.path}\0{entry.size}\0{entry.mtime_ns}'.encode()
+    return hashlib.sha1(key).hexdigest() + entry.ext
+
+
+class VideoCache:
+    """Local copy of queued videos, for origins on slow network mounts.
+
+    Songs are copied in the background to a ``.part`` file, checked against
+    the origin (same size, origin unchanged during the copy) and only then
+    renamed to their final name, so a cached file is always complete. The
+    copy keeps the origin mtime, hence the same ETag and Last-Modified
+    validators whichever file is served.
+
+    The cache holds at most ``max_bytes``; the least recently used copies
+    are evicted first.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cached copies, ideally on a local SSD.
+    max_bytes : int
+        Size budget of the cache.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = VIDEO_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Condition()
+        self._files: OrderedDict = OrderedDict()
+        self._used = 0
+        self._pending: List[CatalogEntry] = []
+        self._copying: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(PART_SUFFIX):
+                # Copy interrupted by a previous shutdown
+                self._unlink(entry.path)
+                continue
+            stat = entry.stat()
+            # ctime is the rename time, i.e. when the copy was completed
+            found.append((stat.st_ctime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._files[name] = size
+            self._used += size
+        # The budget may have been lowered since the copies were made
+        self._reserve(0)
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            # e.g. still open by a response on Windows
+            return False
+
+    def lookup(self, entry: CatalogEntry) -> Optional[str]:
+        """Return the path of the complete copy of ``entry``, if cached.
+
+        Parameters
+        ----------
+        entry : CatalogEntry
+            Origin file, as indexed by the catalog.
+
+        Returns
+        -------
+        str or None
+            Path of the cached copy, or None on a miss.
+        """
+        name = cache_name(entry)
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            size = self._files.get(name)
+            if size is not None:
+                try:
+                    valid = os.path.getsize(path) == entry.size
+                except OSError:
+                    valid = False
+                if valid:
+                    self._files.move_to_end(name)
+                    self.hits += 1
+                    return path
+                self._forget(name)
+            self.misses += 1
+            return None
+
+    def record_served(self, nbytes: int):
+        """Count ``nbytes`` sent from the cache instead of the origin."""
+        with self._lock:
+            self.bytes_saved += nbytes
+
+    def _forget(self, name: str):
+        size = self._files.pop(name, None)
+        if size is not None:
+            self._used -= size
+
+    def _reserve(self, size: int) -> bool:
+        # Called with the lock held
+        if size > self.max_bytes:
+            return False
+        for name in list(self._files):
+            if self._used + size <= self.max_bytes:
+                break
+            if self._unlink(os.path.join(self.cache_dir, name)):
+                self._forget(name)
+        return self._used + size <= self.max_bytes
+
+    def schedule(self, entries: Sequence[CatalogEntry]):
+        """Copy ``entries`` into the cache in the background.
+
+        Parameters
+        ----------
+        entries : Sequence[CatalogEntry]
+            Origin files, in the order they will be played.
+        """
+        with self._lock:
+            self._pending = [
+                entry
+                for entry in entries
+                if cache_name(entry) not in self._files
+            ]
+            if not self._pending:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='karoloke-video-cache', daemon=True
+                )
+                self._thread.start()
+            self._lock.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every scheduled copy is finished."""
+        with self._lock:
+            return self._lock.wait_for(
+                lambda: not self._pending and self._copying is None, timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._pending)
+                entry = self._pending.pop(0)
+                name = cache_name(entry)
+                if name in self._files or not self._reserve(entry.size):
+                    continue
+                self._copying = name
+            try:
+                if self.copy(entry):
+                    with self._lock:
+                        self._files[name] = entry.size
+                        self._used += entry.size
+            finally:
+                with self._lock:
+                    self._copying = None
+                    self._lock.notify_all()
+
+    def copy(self, entry: CatalogEntry) -> bool:
+        """Copy ``entry`` to the cache and check the result.
+
+        Returns
+        -------
+        bool
+            True if a complete copy is in place.
+        """
+        target = os.path.join(self.cache_dir, cache_name(entry))
+        part = target + PART_SUFFIX
+        try:
+            shutil.copyfile(entry.path, part)
+            # Keep the origin mtime: same validators for both copies
+            os.utime(part, ns=(entry.mtime_ns, entry.mtime_ns))
+            origin = os.stat(entry.path)
+            complete = (
+                os.path.getsize(part) == entry.size
+                and origin.st_size == entry.size
+                and origin.st_mtime_ns == entry.mtime_ns
+            )
+            if complete:
+                os.replace(part, target)
+                return True
+        except OSError:
+            pass
+        self._unlink(part)
+        return False
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit ratio, bytes saved and occupancy of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'used_bytes': self._used,
+                'max_bytes': self.max_bytes,
+                'files': len(self._files),
+            }
+
+
+_cache: Optional[VideoCache] = None
+
+
+def open_video_cache(
+    cache_dir: str, max_bytes: int = VIDEO_CACHE_MAX_BYTES
+) -> VideoCache:
+    """Enable the local video cache in ``cache_dir``.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cached copies.
+    max_bytes : int
+        Size budget of the cache.
+
+    Returns
+    -------
+    VideoCache
+        The shared cache.
+    """
+    global _cache
+    if _cache is None or _cache.cache_dir != cache_dir:
+        _cache = VideoCache(cache_dir, max_bytes)
+    return _cache
+
+
+def get_video_cache() -> Optional[VideoCache]:
+    """Return the shared video cache, or None if it is disabled."""
+    return _cache
+
+
+def close_video_cache():
+    """Disable the video cache (the copies are kept on disk)."""
+    global _cache
+    _cache = None
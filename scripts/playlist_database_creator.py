@@ -1,6 +1,8 @@
+import argparse
 import json
 import os
-import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
@@ -9,6 +11,7 @@ import pandas as pd
 import tabula
 from rich import print
 from rich.console import Console
+from rich.table import Table
 
 # Output paths
 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -52,16 +55,7 @@ def sanitize_filename(val: str) -> str:
     return s
 
 
-def extract_page_tables(pdf_path: str, page: int) -> list[dict]:
-    try:
-        dfs = tabula.read_pdf(
-            pdf_path, pages=page, multiple_tables=True, lattice=True
-        )
-    except Exception:
-        dfs = tabula.read_pdf(
-            pdf_path, pages=page, multiple_tables=True, stream=True
-        )
-
+def tables_to_items(dfs) -> list[dict]:
     items: list[dict] = []
     for df in dfs or []:
         if not isinstance(df, pd.DataFrame) or df.empty:
@@ -99,14 +93,136 @@ def extract_page_tables(pdf_path: str, page: int) -> list[dict]:
     return items
 
 
+def extract_page_tables(pdf_path: str, page: int) -> list[dict]:
+    try:
+        dfs = tabula.read_pdf(
+            pdf_path, pages=page, multiple_tables=True, lattice=True
+        )
+    except Exception:
+        dfs = tabula.read_pdf(
+            pdf_path, pages=page, multiple_tables=True, stream=True
+        )
+    return tables_to_items(dfs)
+
+
+def extract_page_tables_pymupdf(pdf_path: str, page: int) -> list[dict]:
+    # Same column mapping as tabula, without a JVM: ruled tables first,
+    # then columns inferred from word positions (like tabula's stream mode)
+    dfs = []
+    with fitz.open(pdf_path) as doc:
+        numbers = range(doc.page_count) if page == 'all' else [page - 1]
+        for number in numbers:
+            pdf_page = doc[number]
+            tables = pdf_page.find_tables(strategy='lines').tables
+            if not tables:
+                tables = pdf_page.find_tables(strategy='text').tables
+            dfs.extend(table.to_pandas() for table in tables)
+    return tables_to_items(dfs)
+
+
+# Extraction engines: (pdf_path, page number or 'all') -> playlist items
+ENGINES = {
+    'tabula': extract_page_tables,
+    'pymupdf': extract_page_tables_pymupdf,
+}
+
+
+def extract_pages(
+    pdf_path: str, total_pages: int, workers: int, engine: str = 'tabula'
+) -> list[dict]:
+    # Each worker process keeps its JVM (tabula's jpype backend, from the
+    # tabula-py[jpype] extra) across the pages it reads, so the JVM starts
+    # once per worker, not once per page
+    results: dict[int, list[dict]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(ENGINES[engine], pdf_path, page): page
+            for page in range(1, total_pages + 1)
+        }
+        for future in as_completed(futures):
+            page = futures[future]
+            results[page] = future.result()
+            print(
+                f'[cyan]Page {page}/{total_pages}[/] '
+                f'({len(results)} done, {len(results[page])} items)'
+            )
+    # Pages finish out of order: merge them back in page order
+    items: list[dict] = []
+    for page in range(1, total_pages + 1):
+        items.extend(results[page])
+    return items
+
+
+def extract(
+    pdf_path: str, total_pages, workers: int, engine: str
+) -> list[dict]:
+    extract_page = ENGINES[engine]
+    items: list[dict] = []
+    if total_pages and workers > 1:
+        print(
+            f'[bold]Extracting {total_pages} pages with {workers} workers[/]'
+        )
+        items = extract_pages(pdf_path, total_pages, workers, engine)
+    elif total_pages:
+        for page in range(1, total_pages + 1):
+            print(f'[cyan]Page {page}/{total_pages}[/]')
+            page_items = extract_page(pdf_path, page)
+            items.extend(page_items)
+    else:
+        print('[yellow]Could not determine page count; reading all pages[/]')
+        items = extract_page(pdf_path, 'all')
+    return items
+
+
+def benchmark(pdf_path: str, total_pages, workers: int):
+    # Run every engine on the same PDF; agreement is measured against the
+    # first engine (tabula, the reference output)
+    timings = {}
+    outputs = {}
+    for engine in ENGINES:
+        print(f'[bold]Benchmarking {engine}[/]')
+        start = time.perf_counter()
+        outputs[engine] = extract(pdf_path, total_pages, workers, engine)
+        timings[engine] = time.perf_counter() - start
+
+    reference_engine = next(iter(ENGINES))
+    reference = {
+        (item['filename'], item['title']) for item in outputs[reference_engine]
+    }
+    table = Table(title=f'Extraction engines on {Path(pdf_path).name}')
+    table.add_column('Engine')
+    table.add_column('Seconds', justify='right')
+    table.add_column('Pages/s', justify='right')
+    table.add_column('Items', justify='right')
+    table.add_column(f'Same as {reference_engine}', justify='right')
+    for engine, items in outputs.items():
+        found = {(item['filename'], item['title']) for item in items}
+        seconds = timings[engine]
+        rate = f'{total_pages / seconds:.1f}' if total_pages else '-'
+        table.add_row(
+            engine,
+            f'{seconds:.1f}',
+            rate,
+            str(len(items)),
+            f'{len(found & reference)}/{len(reference)}',
+        )
+    Console().print(table)
+
+
 def save_json(data: list[dict], path: Path):
     path.parent.mkdir(parents=True, exist_ok=True)
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
 
-def main(pdf_path: str):
-    print('[bold]Starting Tabula-based playlist extraction[/]')
+def main(
+    pdf_path: str,
+    workers: int = 1,
+    engine: str = 'tabula',
+    compare: bool = False,
+):
+    if not compare:
+        print(f'[bold]Starting {engine} playlist extraction[/]')
     # Count pages for progress output
     try:
         doc = fitz.open(pdf_path)
@@ -115,15 +231,10 @@ def main(pdf_path: str):
     except Exception:
         total_pages = None
 
-    items: list[dict] = []
-    if total_pages:
-        for page in range(1, total_pages + 1):
-            print(f'[cyan]Page {page}/{total_pages}[/]')
-            page_items = extract_page_tables(pdf_path, page)
-            items.extend(page_items)
-    else:
-        print('[yellow]Could not determine page count; reading all pages[/]')
-        items = extract_page_tables(pdf_path, 'all')
+    if compare:
+        benchmark(pdf_path, total_pages, workers)
+        return
+    items = extract(pdf_path, total_pages, workers, engine)
 
     print(f'[green]Extracted[/] {len(items)} items from PDF tables')
     save_json(items, FINAL_OUTPUT)
@@ -133,8 +244,28 @@ def main(pdf_path: str):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Usage: python playlist_database_creator.py <pdf_path>')
-        sys.exit(1)
-    pdf_path = sys.argv[1]
-    main(pdf_path)
+    parser = argparse.ArgumentParser(
+        description='Build the karoloke playlist from a PDF song book.'
+    )
+    parser.add_argument('pdf_path', help='PDF song book')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help='pages extracted at the same time, each worker running its '
+        'own JVM with tabula (1: one page after the other)',
+    )
+    parser.add_argument(
+        '--engine',
+        choices=sorted(ENGINES),
+        default='tabula',
+        help='table extraction engine: tabula (Java) or pymupdf (no JVM)',
+    )
+    parser.add_argument(
+        '--benchmark',
+        action='store_true',
+        help='time every engine on the PDF and compare their items, '
+        'without writing the playlist',
+    )
+    args = parser.parse_args()
+    main(args.pdf_path, max(1, args.workers), args.engine, args.benchmark)
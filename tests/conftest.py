@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+from tests.helpers import build_mp4
+
+# Keep the per-user cache (catalog database, etc.) out of the home folder
+os.environ.setdefault(
+    'KAROLOKE_CACHE_DIR', tempfile.mkdtemp(prefix='karoloke-tests-')
+)
+
+
+@pytest.fixture
+def mp4_bytes():
+    return build_mp4()
+
+
+@pytest.fixture(autouse=True)
+def empty_song_queue():
+    """Start every test with an empty shared song queue."""
+    from karoloke.queue_store import get_song_queue
+
+    get_song_queue().clear()
+    yield
+    get_song_queue().clear()
@@ -0,0 +1,99 @@
+"""Helpers shared by several test modules."""
+
+import asyncio
+import os
+import struct
+
+from werkzeug.http import HTTP_STATUS_CODES
+
+
+def build_mp4(payload: bytes = b'\x01' * 32) -> bytes:
+    """Return the bytes of a tiny MP4 with a valid top-level atom chain."""
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+    moov = struct.pack('>I4s', 16, b'moov') + struct.pack('>I4s', 8, b'mvhd')
+    mdat = struct.pack('>I4s', 8 + len(payload), b'mdat') + payload
+    return ftyp + moov + mdat
+
+
+def fake_hls_ffmpeg(args, timeout=None) -> bool:
+    """Stand-in for ``run_ffmpeg`` writing a two-segment HLS variant."""
+    variant_dir = os.path.dirname(args[-1])
+    for index in range(2):
+        with open(os.path.join(variant_dir, f'seg_{index:05d}.ts'), 'wb') as f:
+            f.write(b't' * 100)
+    with open(args[-1], 'w') as f:
+        f.write('#EXTM3U\n#EXTINF:4.0,\nseg_00000.ts\n#EXTINF:4.0,\n')
+        f.write('seg_00001.ts\n#EXT-X-ENDLIST\n')
+    return True
+
+
+class AsgiToWsgi:
+    """Run each request of a WSGI test client through an ASGI app.
+
+    The whole response is collected before being returned, so endless
+    streams such as ``/events`` cannot be tested through it.
+    """
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    def __call__(self, environ, start_response):
+        headers = [
+            (key[5:].replace('_', '-').lower().encode(), value.encode())
+            for key, value in environ.items()
+            if key.startswith('HTTP_')
+        ]
+        for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            if environ.get(key):
+                name = key.replace('_', '-').lower().encode()
+                headers.append((name, environ[key].encode()))
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': environ['REQUEST_METHOD'],
+            'scheme': environ['wsgi.url_scheme'],
+            'path': environ['PATH_INFO'].encode('latin-1').decode('utf-8'),
+            'root_path': '',
+            'query_string': environ['QUERY_STRING'].encode('latin-1'),
+            'headers': headers,
+            'server': (environ['SERVER_NAME'], int(environ['SERVER_PORT'])),
+            'client': ('127.0.0.1', 12345),
+        }
+        body = environ['wsgi.input'].read()
+        status, response_headers, data = asyncio.run(self._run(scope, body))
+        start_response(
+            f'{status} {HTTP_STATUS_CODES.get(status, "")}', response_headers
+        )
+        return [data]
+
+    async def _run(self, scope, body):
+        done = asyncio.Event()
+        requested = False
+        response = {'body': []}
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': body}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = [
+                    (name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in message['headers']
+                ]
+            else:
+                response['body'].append(message.get('body', b''))
+                if not message.get('more_body', False):
+                    done.set()
+
+        await self.asgi_app(scope, receive, send)
+        return (
+            response['status'],
+            response['headers'],
+            b''.join(response['body']),
+        )
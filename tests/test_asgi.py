@@ -0,0 +1,152 @@
+import asyncio
+
+from flask import Flask, Response, request
+
+from karoloke.asgi import AsgiBridge, build_environ
+from karoloke.events import EventBroker
+
+
+def http_scope(path, method='GET', headers=(), query=b''):
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query,
+        'headers': list(headers),
+        'server': ('127.0.0.1', 5000),
+        'client': ('127.0.0.1', 50000),
+    }
+
+
+def test_build_environ():
+    scope = http_scope(
+        '/search',
+        headers=[
+            (b'content-type', b'text/plain'),
+            (b'cookie', b'a=1'),
+            (b'cookie', b'b=2'),
+            (b'range', b'bytes=0-9'),
+        ],
+        query=b'q=ol%C3%A1',
+    )
+    environ = build_environ(scope, b'body')
+    assert environ['PATH_INFO'] == '/search'
+    assert environ['QUERY_STRING'] == 'q=ol%C3%A1'
+    assert environ['CONTENT_TYPE'] == 'text/plain'
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['HTTP_RANGE'] == 'bytes=0-9'
+    assert environ['SERVER_PORT'] == '5000'
+    assert environ['wsgi.input'].read() == b'body'
+
+
+def test_body_is_bounded_by_content_length(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes(range(100)))
+    app = Flask(__name__)
+
+    @app.route('/file')
+    def file():
+        f = open(path, 'rb')
+        f.seek(10)
+        response = Response(
+            request.environ['wsgi.file_wrapper'](f, 7),
+            direct_passthrough=True,
+        )
+        response.content_length = 20
+        return response
+
+    bridge = AsgiBridge(app, max_workers=1)
+    sent = []
+
+    async def run():
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        await bridge(http_scope('/file'), receive, send)
+
+    asyncio.run(run())
+    bridge.executor.shutdown()
+    assert sent[0]['status'] == 200
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    assert body == bytes(range(10, 30))
+    assert sent[-1].get('more_body', False) is False
+
+
+def test_events_are_pushed_from_other_threads():
+    broker = EventBroker()
+    broker.publish('queue', {'queue': ['1']})
+    bridge = AsgiBridge(Flask(__name__), broker=broker, heartbeat=0.05)
+    sent = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        requested = asyncio.Event()
+        leave = asyncio.Event()
+
+        async def receive():
+            if not requested.is_set():
+                requested.set()
+                return {'type': 'http.request', 'body': b''}
+            await leave.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            body = message.get('body', b'')
+            if b'"queue":["1"]' in body:
+                # Published by a request thread while the stream is idle
+                loop.run_in_executor(
+                    None, broker.publish, 'queue', {'queue': ['1', '2']}
+                )
+            elif b'"queue":["1","2"]' in body:
+                leave.set()
+
+        await asyncio.wait_for(
+            bridge(http_scope('/events'), receive, send), timeout=5
+        )
+
+    asyncio.run(run())
+    bridge.executor.shutdown()
+    assert sent[0]['status'] == 200
+    assert (b'content-type', b'text/event-stream; charset=utf-8') in sent[0][
+        'headers'
+    ]
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    assert body.startswith(b'retry: 3000\n\n')
+    assert b'"queue":["1","2"]' in body
+    assert broker.subscriber_count() == 0
+
+
+def test_lifespan():
+    bridge = AsgiBridge(Flask(__name__), max_workers=1)
+    sent = []
+
+    async def run():
+        messages = [
+            {'type': 'lifespan.shutdown'},
+            {'type': 'lifespan.startup'},
+        ]
+
+        async def receive():
+            return messages.pop()
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await bridge({'type': 'lifespan'}, receive, send)
+
+    asyncio.run(run())
+    assert sent == [
+        'lifespan.startup.complete',
+        'lifespan.shutdown.complete',
+    ]
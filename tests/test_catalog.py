@@ -0,0 +1,253 @@
+import os
+import threading
+
+import pytest
+
+from karoloke import catalog as catalog_module
+from karoloke.catalog import (
+    CatalogChanges,
+    CatalogEntry,
+    VideoCatalog,
+    add_catalog_listener,
+    get_catalog,
+    register_rendition,
+    register_renditions,
+    reset_catalog,
+)
+
+
+@pytest.fixture
+def video_dir(tmp_path):
+    (tmp_path / '100.mp4').write_text('mp4 video')
+    (tmp_path / '100.webm').write_text('webm video')
+    (tmp_path / '200.ogg').write_text('ogg video')
+    (tmp_path / '300.mp4').write_text('')
+    (tmp_path / 'notes.txt').write_text('not a video')
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    (sub / '400.webm').write_text('nested video')
+    (sub / '300.webm').write_text('non empty fallback')
+    return tmp_path
+
+
+def test_catalog_indexes_supported_formats_only(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    assert len(catalog) == 4
+    assert 'notes' not in catalog
+    assert all(isinstance(e, CatalogEntry) for e in catalog.entries())
+
+
+def test_catalog_does_not_follow_directory_links(video_dir):
+    # Links back up the tree would index every video again, endlessly
+    os.symlink(video_dir, video_dir / 'sub' / 'loop')
+    (video_dir / 'other').mkdir()
+    os.symlink(video_dir, video_dir / 'other' / 'loop')
+    catalog = VideoCatalog(str(video_dir))
+    assert catalog.file_count() == 6
+
+
+def test_catalog_lookup_first_extension_wins(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    entry = catalog.lookup('100')
+    assert entry.ext == '.mp4'
+    assert entry.path == os.path.join(str(video_dir), '100.mp4')
+    assert entry.size == len('mp4 video')
+
+
+def test_catalog_lookup_in_subdirectory(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    entry = catalog.lookup('400')
+    assert entry.path == os.path.join(str(video_dir), 'sub', '400.webm')
+
+
+def test_catalog_lookup_non_empty_skips_zero_size(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    assert catalog.lookup('300').ext == '.mp4'
+    assert catalog.lookup('300', non_empty=True).ext == '.webm'
+
+
+def test_catalog_lookup_missing_song(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    assert catalog.lookup('999') is None
+
+
+def test_catalog_build_bumps_version(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    version = catalog.version
+    (video_dir / '500.mp4').write_text('new video')
+    assert '500' not in catalog
+    catalog.build()
+    assert catalog.version == version + 1
+    assert '500' in catalog
+
+
+def test_get_catalog_is_shared_per_directory(video_dir):
+    first = get_catalog(str(video_dir))
+    assert get_catalog(str(video_dir)) is first
+    reset_catalog(str(video_dir))
+    assert get_catalog(str(video_dir)) is not first
+
+
+def test_catalog_nonexistent_dir():
+    catalog = VideoCatalog('/nonexistent/path/for/karoloke')
+    assert len(catalog) == 0
+
+
+def test_catalog_add_and_remove_file(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    new_file = video_dir / '500.mp4'
+    new_file.write_text('new video')
+    assert catalog.add_file(str(new_file)) is True
+    assert catalog.lookup('500').path == str(new_file)
+    assert catalog.add_file(str(new_file)) is False
+    assert catalog.remove_file(str(new_file)) is True
+    assert '500' not in catalog
+    assert catalog.remove_file(str(new_file)) is False
+
+
+def test_catalog_listeners_are_told_about_changes(video_dir, monkeypatch):
+    monkeypatch.setattr(catalog_module, '_listeners', [])
+    changes = []
+    add_catalog_listener(lambda catalog: changes.append(catalog.version))
+    catalog = VideoCatalog(str(video_dir))
+    new_file = video_dir / '500.mp4'
+    new_file.write_text('new video')
+    catalog.add_file(str(new_file))
+    catalog.add_file(str(new_file))
+    catalog.remove_file(str(new_file))
+    assert changes == [1, 2, 3]
+
+
+def test_catalog_add_file_ignores_unsupported_format(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    assert catalog.add_file(str(video_dir / 'notes.txt')) is False
+
+
+def test_catalog_remove_tree(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    removed = catalog.remove_tree(str(video_dir / 'sub'))
+    assert removed == 2
+    assert '400' not in catalog
+    assert catalog.lookup('300', non_empty=True) is None
+
+
+def test_catalog_sync_directory(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    (video_dir / '200.ogg').unlink()
+    (video_dir / '600.webm').write_text('added')
+    subdirs = catalog.sync_directory(str(video_dir))
+    assert subdirs == [str(video_dir / 'sub')]
+    assert '200' not in catalog
+    assert '600' in catalog
+    assert '400' in catalog
+
+
+def test_catalog_songs_and_file_count(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    songs = dict(catalog.songs())
+    assert set(songs) == {'100', '200', '300', '400'}
+    assert songs['100'].ext == '.mp4'
+    assert catalog.file_count() == 6
+
+
+def test_renditions_take_precedence(tmp_path):
+    (tmp_path / '1.mp4').write_bytes(b'original')
+    rendition = tmp_path.parent / f'{tmp_path.name}-1.mp4'
+    rendition.write_bytes(b'converted')
+    catalog = VideoCatalog(str(tmp_path))
+    entry = CatalogEntry(str(rendition), 9, '.mp4', 0)
+    try:
+        register_rendition(str(tmp_path), '1', entry)
+        register_rendition(str(tmp_path), '7', entry._replace(size=10))
+        assert catalog.lookup('1') == entry
+        assert catalog.is_rendition(entry)
+        # Song 7 only exists as a rendition
+        assert len(catalog) == 2
+        assert dict(catalog.songs())['7'].size == 10
+    finally:
+        register_rendition(str(tmp_path), '1', None)
+        register_rendition(str(tmp_path), '7', None)
+    assert catalog.lookup('1').path == str(tmp_path / '1.mp4')
+    assert len(catalog) == 1
+
+
+def test_listeners_may_use_get_catalog_while_it_builds(video_dir, monkeypatch):
+    monkeypatch.setattr(catalog_module, '_listeners', [])
+    seen = []
+    add_catalog_listener(
+        lambda catalog: seen.append(get_catalog(catalog.video_dir))
+    )
+    reset_catalog()
+    try:
+        builder = threading.Thread(
+            target=get_catalog, args=(str(video_dir),), daemon=True
+        )
+        builder.start()
+        builder.join(timeout=5)
+        assert not builder.is_alive()
+        assert seen == [get_catalog(str(video_dir))]
+    finally:
+        reset_catalog()
+
+
+def test_changes_since_lists_new_and_modified_entries(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    version, changed = catalog.changes_since(0)
+    assert changed is None
+    assert catalog.changes_since(version) == (version, [])
+
+    (video_dir / '500.mp4').write_text('new video')
+    (video_dir / '100.mp4').write_text('edited video')
+    catalog.add_file(str(video_dir / '500.mp4'))
+    (video_dir / '200.ogg').unlink()
+    catalog.remove_file(str(video_dir / '200.ogg'))
+    catalog.sync_directory(str(video_dir))
+    latest, changed = catalog.changes_since(version)
+    assert latest == version + 3
+    assert sorted(os.path.basename(entry.path) for entry in changed) == [
+        '100.mp4',
+        '500.mp4',
+    ]
+
+
+def test_catalog_changes_tracks_each_catalog(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    changes = CatalogChanges()
+    assert len(changes(catalog)) == catalog.file_count()
+    assert changes(catalog) == []
+    (video_dir / '500.mp4').write_text('new video')
+    catalog.add_file(str(video_dir / '500.mp4'))
+    assert [entry.path for entry in changes(catalog)] == [
+        str(video_dir / '500.mp4')
+    ]
+    # A rebuild drops the change log: everything is listed again
+    catalog.build()
+    assert len(changes(catalog)) == catalog.file_count()
+
+
+def test_register_renditions_notifies_once(tmp_path, monkeypatch):
+    (tmp_path / '1.mp4').write_bytes(b'original')
+    notified = []
+    monkeypatch.setattr(catalog_module, '_listeners', [notified.append])
+    reset_catalog()
+    try:
+        catalog = get_catalog(str(tmp_path))
+        renditions = {
+            str(n): CatalogEntry(f'/renditions/{n}.mp4', 9, '.mp4', 0)
+            for n in range(1, 400)
+        }
+        register_renditions(str(tmp_path), renditions)
+        assert notified == [catalog, catalog]
+        assert catalog.lookup('399').path == '/renditions/399.mp4'
+        assert catalog.is_rendition(renditions['399'])
+        original = str(tmp_path / '1.mp4')
+        assert not catalog.is_rendition(CatalogEntry(original, 8, '.mp4', 0))
+        # Unchanged: no notification
+        register_renditions(str(tmp_path), renditions)
+        assert len(notified) == 2
+    finally:
+        register_renditions(
+            str(tmp_path), {song_num: None for song_num in renditions}
+        )
+        assert not catalog.is_rendition(renditions['399'])
+        reset_catalog()
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from karoloke.catalog import VideoCatalog
+from karoloke.catalog_store import CatalogStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CatalogStore(str(tmp_path / 'cache' / 'catalog.sqlite3'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def video_dir(tmp_path):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_text('video one')
+    sub = videos / 'sub'
+    sub.mkdir()
+    (sub / '2.webm').write_text('video two')
+    return videos
+
+
+def test_store_records_catalog_build(store, video_dir):
+    VideoCatalog(str(video_dir), store=store)
+    dirs = store.load_dirs(str(video_dir))
+    files = store.load_files(str(video_dir))
+    assert set(dirs) == {str(video_dir), str(video_dir / 'sub')}
+    assert [path for path, _, _ in files[str(video_dir)]] == [
+        str(video_dir / '1.mp4')
+    ]
+
+
+def test_unchanged_directories_are_not_listed_again(store, video_dir):
+    VideoCatalog(str(video_dir), store=store)
+
+    listed = []
+    original = VideoCatalog._list_directory
+
+    def spy(self, dirpath):
+        listed.append(dirpath)
+        return original(self, dirpath)
+
+    VideoCatalog._list_directory = spy
+    try:
+        catalog = VideoCatalog(str(video_dir), store=store)
+    finally:
+        VideoCatalog._list_directory = original
+
+    assert listed == []
+    assert catalog.lookup('2').path == str(video_dir / 'sub' / '2.webm')
+
+
+def test_changed_directory_is_revalidated(store, video_dir):
+    VideoCatalog(str(video_dir), store=store)
+    (video_dir / 'sub' / '2.webm').unlink()
+    (video_dir / 'sub' / '3.ogg').write_text('video three')
+    stat = os.stat(video_dir / 'sub')
+    os.utime(video_dir / 'sub', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    catalog = VideoCatalog(str(video_dir), store=store)
+    assert '2' not in catalog
+    assert '3' in catalog
+
+
+def test_removed_directory_is_forgotten(store, video_dir):
+    VideoCatalog(str(video_dir), store=store)
+    (video_dir / 'sub' / '2.webm').unlink()
+    (video_dir / 'sub').rmdir()
+
+    catalog = VideoCatalog(str(video_dir), store=store)
+    assert '2' not in catalog
+    assert str(video_dir / 'sub') not in store.load_dirs(str(video_dir))
+    assert str(video_dir / 'sub') not in store.load_files(str(video_dir))
+
+
+def test_catalog_changes_are_written_through(store, video_dir):
+    catalog = VideoCatalog(str(video_dir), store=store)
+    new_file = video_dir / 'sub' / '4.mp4'
+    new_file.write_text('video four')
+    catalog.add_file(str(new_file))
+    catalog.remove_file(str(video_dir / '1.mp4'))
+
+    files = store.load_files(str(video_dir))
+    sub_paths = [path for path, _, _ in files[str(video_dir / 'sub')]]
+    assert str(new_file) in sub_paths
+    assert str(video_dir) not in files
+
+
+def test_probe_results_survive_until_file_changes(store, video_dir):
+    VideoCatalog(str(video_dir), store=store)
+    path = str(video_dir / '1.mp4')
+    stat = os.stat(path)
+    store.save_probes([(path, stat.st_size, stat.st_mtime_ns, True)])
+    assert store.load_probes(str(video_dir))[path][2] is True
+
+    store.save_file(str(video_dir), path, stat.st_size + 1, stat.st_mtime_ns)
+    assert path not in store.load_probes(str(video_dir))
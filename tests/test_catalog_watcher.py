@@ -0,0 +1,150 @@
+import os
+import time
+
+import pytest
+
+from karoloke import catalog_watcher
+from karoloke.catalog import VideoCatalog
+from karoloke.catalog_watcher import CatalogWatcher, PollingWatcher
+
+
+def _bump_mtime(path):
+    # Make sure the directory mtime changes even on coarse filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_polling_watcher_detects_created_and_deleted_files(tmp_path):
+    (tmp_path / '1.mp4').write_text('video')
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = PollingWatcher(catalog, interval=0.1)
+
+    (tmp_path / '2.mp4').write_text('video')
+    (tmp_path / '1.mp4').unlink()
+    _bump_mtime(tmp_path)
+    watcher.poll_once()
+
+    assert '2' in catalog
+    assert '1' not in catalog
+
+
+def test_polling_watcher_detects_new_subdirectory(tmp_path):
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = PollingWatcher(catalog, interval=0.1)
+
+    sub = tmp_path / 'new'
+    sub.mkdir()
+    (sub / '3.webm').write_text('video')
+    _bump_mtime(tmp_path)
+    watcher.poll_once()
+
+    assert catalog.lookup('3').path == str(sub / '3.webm')
+
+
+def test_polling_watcher_ignores_directory_links(tmp_path):
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        os.symlink(tmp_path, tmp_path / name / 'loop')
+    (tmp_path / '1.mp4').write_text('video')
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = PollingWatcher(catalog, interval=0.1)
+    watcher.poll_once()
+    assert catalog.file_count() == 1
+
+
+def test_polling_watcher_detects_removed_subdirectory(tmp_path):
+    sub = tmp_path / 'old'
+    sub.mkdir()
+    (sub / '4.mp4').write_text('video')
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = PollingWatcher(catalog, interval=0.1)
+
+    (sub / '4.mp4').unlink()
+    sub.rmdir()
+    watcher.poll_once()
+
+    assert '4' not in catalog
+
+
+def test_polling_watcher_refreshes_size_of_growing_file(tmp_path):
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = PollingWatcher(catalog, interval=0.1)
+
+    growing = tmp_path / '5.mp4'
+    growing.write_text('')
+    _bump_mtime(tmp_path)
+    watcher.poll_once()
+    assert catalog.lookup('5', non_empty=True) is None
+
+    growing.write_text('copied video')
+    watcher.poll_once()
+    assert catalog.lookup('5', non_empty=True) is not None
+
+
+def test_catalog_watcher_falls_back_to_polling(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_watcher, '_load_inotify', lambda: None)
+    watcher = CatalogWatcher(VideoCatalog(str(tmp_path)), backend='auto')
+    assert watcher.backend == 'poll'
+
+
+@pytest.fixture
+def mounts(tmp_path, monkeypatch):
+    share = tmp_path / 'my share'
+    (share / 'local').mkdir(parents=True)
+    table = tmp_path / 'mounts'
+    escaped = str(share).replace(' ', '\\040')
+    table.write_text(
+        'sysfs /sys sysfs rw 0 0\n'
+        '/dev/sda1 / ext4 rw 0 0\n'
+        f'//nas/karaoke {escaped} cifs rw 0 0\n'
+        f'/dev/sdb1 {escaped}/local ext4 rw 0 0\n'
+    )
+    monkeypatch.setattr(catalog_watcher, 'MOUNTS', str(table))
+    return share
+
+
+def test_filesystem_type_uses_the_closest_mount(mounts):
+    assert catalog_watcher.filesystem_type(str(mounts)) == 'cifs'
+    assert catalog_watcher.filesystem_type(str(mounts / 'a')) == 'cifs'
+    assert catalog_watcher.filesystem_type(str(mounts / 'local')) == 'ext4'
+    assert catalog_watcher.filesystem_type('/sysfoo') == 'ext4'
+
+
+def test_catalog_watcher_polls_network_shares(mounts):
+    watcher = CatalogWatcher(VideoCatalog(str(mounts)), backend='auto')
+    assert watcher.backend == 'poll'
+
+
+@pytest.mark.skipif(
+    catalog_watcher._load_inotify() is None, reason='inotify not available'
+)
+def test_inotify_watcher_applies_deltas(tmp_path):
+    catalog = VideoCatalog(str(tmp_path))
+    watcher = CatalogWatcher(catalog, backend='inotify')
+    assert watcher.backend == 'inotify'
+    watcher.start()
+    try:
+        (tmp_path / '6.mp4').write_text('video')
+        assert _wait_for(lambda: '6' in catalog)
+
+        os.rename(tmp_path / '6.mp4', tmp_path / '7.mp4')
+        assert _wait_for(lambda: '7' in catalog and '6' not in catalog)
+
+        sub = tmp_path / 'sub'
+        sub.mkdir()
+        (sub / '8.webm').write_text('video')
+        assert _wait_for(lambda: '8' in catalog)
+
+        (tmp_path / '7.mp4').unlink()
+        assert _wait_for(lambda: '7' not in catalog)
+    finally:
+        watcher.stop()
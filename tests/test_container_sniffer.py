@@ -0,0 +1,135 @@
+import struct
+
+import pytest
+
+from karoloke.container_sniffer import (
+    MAX_ATOMS,
+    iter_mp4_atoms,
+    mp4_index_span,
+    sniff_container,
+)
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _webm():
+    ebml_header = b'\x1a\x45\xdf\xa3\x9f\x42\x82\x84webm'
+    return ebml_header + b'\x18\x53\x80\x67' + b'\x01' * 64
+
+
+def _ogg():
+    page = b'OggS\x00\x02' + b'\x01' * 60
+    return page + b'\x02' * 128 + b'OggS\x00\x04' + b'\x03' * 60
+
+
+def test_sniff_valid_mp4(tmp_path, mp4_bytes):
+    assert sniff_container(_write(tmp_path, '1.mp4', mp4_bytes)) is True
+
+
+def test_sniff_truncated_mp4(tmp_path, mp4_bytes):
+    path = _write(tmp_path, '1.mp4', mp4_bytes[:-10])
+    assert sniff_container(path) is False
+
+
+def test_sniff_mp4_without_moov(tmp_path):
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+    mdat = struct.pack('>I4s', 16, b'mdat') + b'\x01' * 8
+    assert sniff_container(_write(tmp_path, '1.mp4', ftyp + mdat)) is False
+
+
+def test_sniff_zero_filled_file(tmp_path):
+    path = _write(tmp_path, '1.mp4', b'\x00' * 8192)
+    assert sniff_container(path) is False
+
+
+def test_sniff_zero_padded_files(tmp_path, mp4_bytes):
+    # Padding at the end of a valid file is not an unfinished download
+    path = _write(tmp_path, '1.webm', _webm() + b'\x00' * 8192)
+    assert sniff_container(path) is True
+    free = struct.pack('>I4s', 8 + 8192, b'free') + b'\x00' * 8192
+    assert sniff_container(_write(tmp_path, '2.mp4', mp4_bytes + free))
+
+
+def test_sniff_long_fragmented_mp4(tmp_path):
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'iso6', 0x200)
+    moov = struct.pack('>I4s', 8, b'moov')
+    fragment = (
+        struct.pack('>I4s', 8, b'moof')
+        + struct.pack('>I4s', 12, b'mdat')
+        + b'\x01' * 4
+    )
+    data = ftyp + moov + fragment * (MAX_ATOMS // 2 + 10)
+    assert sniff_container(_write(tmp_path, '1.mp4', data)) is True
+
+
+def test_sniff_too_many_atoms_gives_no_verdict(tmp_path):
+    free = struct.pack('>I4s', 8, b'free')
+    data = free * (MAX_ATOMS + 10)
+    assert sniff_container(_write(tmp_path, '1.mp4', data)) is None
+
+
+def test_sniff_valid_webm(tmp_path):
+    assert sniff_container(_write(tmp_path, '1.webm', _webm())) is True
+
+
+def test_sniff_invalid_webm(tmp_path):
+    assert sniff_container(_write(tmp_path, '1.webm', b'not a webm')) is False
+
+
+def test_sniff_valid_ogg(tmp_path):
+    assert sniff_container(_write(tmp_path, '1.ogg', _ogg())) is True
+
+
+def test_sniff_invalid_ogg(tmp_path):
+    path = _write(tmp_path, '1.ogg', b'Ogg' + b'\x01' * 64)
+    assert sniff_container(path) is False
+
+
+def test_sniff_unknown_extension(tmp_path):
+    assert sniff_container(_write(tmp_path, '1.avi', b'RIFF')) is None
+
+
+def test_iter_mp4_atoms_reports_offsets(tmp_path, mp4_bytes):
+    path = _write(tmp_path, '1.mp4', mp4_bytes)
+    with open(path, 'rb') as f:
+        atoms = list(iter_mp4_atoms(f, len(mp4_bytes)))
+    assert [a.kind for a in atoms] == [b'ftyp', b'moov', b'mdat']
+    assert atoms[1].offset == 16
+    assert sum(a.size for a in atoms) == len(mp4_bytes)
+
+
+def test_iter_mp4_atoms_large_size_header(tmp_path):
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+    mdat = struct.pack('>I4sQ', 1, b'mdat', 24) + b'\x01' * 8
+    data = ftyp + mdat
+    path = _write(tmp_path, '1.mp4', data)
+    with open(path, 'rb') as f:
+        atoms = list(iter_mp4_atoms(f, len(data)))
+    assert atoms[1] == (b'mdat', 16, 24)
+
+
+def test_iter_mp4_atoms_rejects_garbage(tmp_path):
+    data = b'fake video content'
+    path = _write(tmp_path, '1.mp4', data)
+    with open(path, 'rb') as f:
+        with pytest.raises(ValueError):
+            list(iter_mp4_atoms(f, len(data)))
+
+
+def test_mp4_index_span(tmp_path, mp4_bytes):
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+    mdat = struct.pack('>I4s', 12, b'mdat') + b'\x01' * 4
+    moov = struct.pack('>I4s', 16, b'moov') + struct.pack('>I4s', 8, b'mvhd')
+    trailing = tmp_path / 'trailing.mp4'
+    trailing.write_bytes(ftyp + mdat + moov)
+    with open(trailing, 'rb') as f:
+        assert mp4_index_span(f, len(ftyp + mdat + moov)) == (28, 16)
+    # Index first (fast start)
+    with open(tmp_path / 'fast.mp4', 'wb') as f:
+        f.write(mp4_bytes)
+    with open(tmp_path / 'fast.mp4', 'rb') as f:
+        assert mp4_index_span(f, len(mp4_bytes)) is None
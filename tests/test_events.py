@@ -0,0 +1,59 @@
+import json
+
+from karoloke.events import EventBroker, Subscriber, format_event
+
+
+def parse(message: bytes) -> dict:
+    fields = dict(
+        line.split(': ', 1) for line in message.decode().strip().split('\n')
+    )
+    fields['data'] = json.loads(fields['data'])
+    return fields
+
+
+def test_format_event():
+    message = format_event(3, 'queue', {'queue': ['1']})
+    assert message == b'id: 3\nevent: queue\ndata: {"queue":["1"]}\n\n'
+
+
+def test_publish_fans_out_to_every_subscriber():
+    broker = EventBroker()
+    first, second = broker.subscribe(), broker.subscribe()
+    broker.publish('queue', {'queue': ['1']})
+    for subscriber in (first, second):
+        (message,) = subscriber.pop(timeout=1)
+        assert parse(message)['data'] == {'queue': ['1']}
+
+
+def test_subscriber_keeps_only_the_latest_state_per_event():
+    subscriber = Subscriber()
+    for n in range(100):
+        subscriber.push('queue', f'{n}'.encode())
+    subscriber.push('catalog', b'c')
+    subscriber.push('queue', b'last')
+    assert subscriber.pop(timeout=0) == [b'c', b'last']
+    assert subscriber.pop(timeout=0) == []
+
+
+def test_new_subscribers_receive_the_current_state():
+    broker = EventBroker()
+    broker.publish('now_playing', {'song': '1'})
+    broker.publish('now_playing', {'song': '2'})
+    (message,) = broker.subscribe().pop(timeout=1)
+    assert parse(message)['data'] == {'song': '2'}
+
+
+def test_stream_subscribes_lazily_and_cleans_up():
+    broker = EventBroker()
+    stream = broker.stream(heartbeat=0.01)
+    assert broker.subscriber_count() == 0
+
+    assert next(stream) == b'retry: 3000\n\n'
+    assert broker.subscriber_count() == 1
+    assert next(stream) == b': keep-alive\n\n'
+
+    broker.publish('queue', {'queue': []})
+    assert parse(next(stream))['event'] == 'queue'
+
+    stream.close()
+    assert broker.subscriber_count() == 0
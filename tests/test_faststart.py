@@ -0,0 +1,145 @@
+import os
+import struct
+from unittest import mock
+
+import pytest
+
+from karoloke import catalog as catalog_module
+from karoloke.catalog import (
+    CatalogChanges,
+    get_catalog,
+    register_rendition,
+    reset_catalog,
+)
+from karoloke.faststart import (
+    FASTSTART,
+    MOOV_AT_END,
+    OPTIMIZED,
+    PROGRESSIVE,
+    FaststartOptimizer,
+    find_trailing_index,
+)
+from tests.helpers import build_mp4
+
+FTYP = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+MOOV = struct.pack('>I4s', 16, b'moov') + struct.pack('>I4s', 8, b'mvhd')
+MDAT = struct.pack('>I4s', 40, b'mdat') + b'\x01' * 32
+
+
+def fake_remux(args, timeout=None):
+    # Same atoms, index first
+    with open(args[-1], 'wb') as f:
+        f.write(FTYP + MOOV + MDAT)
+    return True
+
+
+@pytest.fixture
+def library(tmp_path):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_bytes(FTYP + MDAT + MOOV)
+    (videos / '2.mp4').write_bytes(build_mp4())
+    reset_catalog()
+    yield str(videos)
+    for song_num in ('1', '2'):
+        register_rendition(str(videos), song_num, None)
+    reset_catalog()
+
+
+@pytest.fixture
+def optimizer(library, tmp_path):
+    return FaststartOptimizer(
+        library,
+        output_dir=str(tmp_path / 'renditions'),
+        ffmpeg='ffmpeg',
+        cpu_share=1.0,
+    )
+
+
+def test_find_trailing_index(library):
+    assert find_trailing_index(f'{library}/1.mp4') == (56, 16)
+    assert find_trailing_index(f'{library}/2.mp4') is None
+    assert find_trailing_index(f'{library}/missing.mp4') is None
+
+
+def test_flagged_files_are_remuxed_and_registered(library, optimizer):
+    catalog = get_catalog(library)
+    original = catalog.lookup('1')
+    with mock.patch('karoloke.faststart.run_ffmpeg', fake_remux):
+        assert optimizer.schedule(catalog.entries()) == 2
+        assert optimizer.jobs.wait(timeout=5)
+
+    copy = catalog.lookup('1')
+    assert copy.path.endswith('.faststart.mp4')
+    assert find_trailing_index(copy.path) is None
+    # Already fast-started: left alone
+    assert catalog.lookup('2').path == f'{library}/2.mp4'
+    assert optimizer.stats() == {'flagged': 1, 'optimized': 1}
+    assert optimizer.jobs.outputs(FASTSTART) == {original.path: copy.path}
+
+    assert optimizer.label(copy.path) == OPTIMIZED
+    assert optimizer.label(original.path) == MOOV_AT_END
+    assert optimizer.label(f'{library}/2.mp4') == PROGRESSIVE
+
+
+def truncated_remux(args, timeout=None):
+    # Killed half way: no moov at all, so no trailing index either
+    with open(args[-1], 'wb') as f:
+        f.write(FTYP + MDAT[:20])
+    return False
+
+
+@pytest.mark.parametrize(
+    'ffmpeg', [mock.Mock(return_value=False), truncated_remux]
+)
+def test_failed_remux_keeps_the_original(library, optimizer, ffmpeg):
+    catalog = get_catalog(library)
+    with mock.patch('karoloke.faststart.run_ffmpeg', ffmpeg):
+        optimizer.schedule(catalog.entries())
+        optimizer.jobs.wait(timeout=5)
+    assert catalog.lookup('1').path == f'{library}/1.mp4'
+    assert optimizer.jobs.progress()[FASTSTART]['failed'] == 1
+    assert optimizer.label(f'{library}/1.mp4') == MOOV_AT_END
+    assert os.listdir(optimizer.output_dir) == []
+
+
+def test_transcoded_rendition_wins(library, optimizer, tmp_path):
+    transcoded = tmp_path / '1-abc.mp4'
+    transcoded.write_bytes(build_mp4())
+    catalog = get_catalog(library)
+    entries = list(catalog.entries())
+    register_rendition(
+        library,
+        '1',
+        catalog.lookup('1')._replace(path=str(transcoded)),
+    )
+    with mock.patch('karoloke.faststart.run_ffmpeg', fake_remux):
+        optimizer.schedule(entries)
+        optimizer.jobs.wait(timeout=5)
+    assert catalog.lookup('1').path == str(transcoded)
+
+
+def test_existing_copies_are_registered_in_one_change(
+    library, optimizer, monkeypatch
+):
+    catalog = get_catalog(library)
+    with mock.patch('karoloke.faststart.run_ffmpeg', fake_remux):
+        optimizer.schedule(catalog.entries())
+        optimizer.jobs.wait(timeout=5)
+    copy = catalog.lookup('1')
+    register_rendition(library, '1', None)
+
+    # After a restart: the copy made by the previous run is registered
+    # again, and the listener sees no new file to check
+    changes = CatalogChanges()
+    changes(catalog)
+    notified = []
+
+    def on_catalog_change(changed_catalog):
+        notified.append(changes(changed_catalog))
+        optimizer.schedule(notified[-1], changed_catalog)
+
+    monkeypatch.setattr(catalog_module, '_listeners', [on_catalog_change])
+    optimizer.schedule(catalog.entries(), catalog)
+    assert catalog.lookup('1') == copy
+    assert notified == [[]]
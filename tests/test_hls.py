@@ -0,0 +1,129 @@
+import os
+from unittest import mock
+
+import pytest
+
+from karoloke.catalog import CatalogEntry
+from karoloke.hls import (
+    MASTER_PLAYLIST,
+    HlsPackager,
+    master_playlist,
+    package_name,
+)
+from tests.helpers import fake_hls_ffmpeg
+
+VARIANTS = ((360, 800, 96), (720, 2500, 128))
+
+
+def make_entry(tmp_path, song_num):
+    path = tmp_path / f'{song_num}.mp4'
+    path.write_bytes(b'v' * 1000)
+    stat = path.stat()
+    return CatalogEntry(str(path), stat.st_size, '.mp4', stat.st_mtime_ns)
+
+
+@pytest.fixture
+def packager(tmp_path):
+    return HlsPackager(
+        str(tmp_path / 'hls'), ffmpeg='ffmpeg', variants=VARIANTS
+    )
+
+
+def test_master_playlist_lists_every_variant():
+    playlist = master_playlist(VARIANTS)
+    assert playlist.startswith('#EXTM3U\n')
+    assert 'BANDWIDTH=976000,AVERAGE-BANDWIDTH=896000,NAME="360p"' in playlist
+    assert playlist.splitlines()[3] == 'v0/index.m3u8'
+    assert playlist.splitlines()[-1] == 'v1/index.m3u8'
+
+
+def test_package_writes_every_variant(packager, tmp_path):
+    entry = make_entry(tmp_path, '7')
+    assert packager.lookup(entry) is None
+    with mock.patch(
+        'karoloke.hls.run_ffmpeg', side_effect=fake_hls_ffmpeg
+    ) as run:
+        package = packager.package(entry)
+    assert package == packager.lookup(entry)
+    assert os.path.basename(package) == package_name(entry)
+    assert os.path.isfile(os.path.join(package, MASTER_PLAYLIST))
+    assert os.path.isfile(os.path.join(package, 'v1', 'seg_00001.ts'))
+    commands = [call.args[0] for call in run.call_args_list]
+    assert [command[command.index('-vf') + 1] for command in commands] == [
+        'scale=-2:360',
+        'scale=-2:720',
+    ]
+    assert 'expr:gte(t,n_forced*4)' in commands[0]
+    assert packager.stats()['packages'] == 1
+    # Already packaged: ffmpeg is not run again
+    with mock.patch('karoloke.hls.run_ffmpeg') as run:
+        assert packager.package(entry) == package
+    run.assert_not_called()
+
+
+def test_failed_package_leaves_nothing(packager, tmp_path):
+    entry = make_entry(tmp_path, '7')
+    with mock.patch('karoloke.hls.run_ffmpeg', return_value=False):
+        assert packager.package(entry) is None
+    assert os.listdir(packager.output_dir) == []
+    assert packager.lookup(entry) is None
+
+
+def test_least_recently_played_package_is_evicted(tmp_path):
+    # Each package takes 2 variants * 200 bytes of segments + playlists
+    packager = HlsPackager(
+        str(tmp_path / 'hls'), 'ffmpeg', VARIANTS, max_bytes=1500
+    )
+    first, second, third = (make_entry(tmp_path, n) for n in '123')
+    with mock.patch('karoloke.hls.run_ffmpeg', side_effect=fake_hls_ffmpeg):
+        packager.package(first)
+        packager.package(second)
+        packager.lookup(first)
+        packager.package(third)
+    assert packager.lookup(second) is None
+    assert not os.path.exists(
+        os.path.join(packager.output_dir, package_name(second))
+    )
+    assert packager.lookup(first) is not None
+    assert packager.lookup(third) is not None
+    assert packager.stats()['used_bytes'] <= 1500
+
+
+def test_packages_survive_a_restart(packager, tmp_path):
+    entry = make_entry(tmp_path, '7')
+    with mock.patch('karoloke.hls.run_ffmpeg', side_effect=fake_hls_ffmpeg):
+        packager.package(entry)
+    os.makedirs(os.path.join(packager.output_dir, 'x-123.part'))
+
+    restarted = HlsPackager(packager.output_dir, 'ffmpeg', VARIANTS)
+    assert restarted.lookup(entry) is not None
+    assert restarted.stats()['used_bytes'] == packager.stats()['used_bytes']
+    assert not os.path.exists(os.path.join(packager.output_dir, 'x-123.part'))
+
+
+def test_schedule_packages_in_the_background(packager, tmp_path):
+    entries = [make_entry(tmp_path, n) for n in '12']
+    with mock.patch('karoloke.hls.run_ffmpeg', side_effect=fake_hls_ffmpeg):
+        packager.schedule(entries)
+        assert packager.wait(timeout=5)
+    assert all(packager.lookup(entry) for entry in entries)
+
+
+def test_packaging_errors_are_logged(packager, tmp_path, caplog):
+    entries = [make_entry(tmp_path, n) for n in '12']
+    with mock.patch.object(
+        packager, 'package', side_effect=[OSError('disk full'), None]
+    ) as package:
+        packager.schedule(entries)
+        assert packager.wait(timeout=5)
+    # The next song is still packaged
+    assert package.call_count == 2
+    assert 'HLS packaging of' in caplog.text
+    assert 'disk full' in caplog.text
+
+
+def test_schedule_without_ffmpeg_does_nothing(tmp_path):
+    packager = HlsPackager(str(tmp_path / 'hls'), ffmpeg=None)
+    packager.schedule([make_entry(tmp_path, '1')])
+    assert packager.wait(timeout=1)
+    assert packager.stats()['packages'] == 0
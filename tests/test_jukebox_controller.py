@@ -1,3 +1,4 @@
+import json
 import os
 import pathlib
 import random
@@ -6,12 +7,17 @@ from unittest import mock
 
 import pytest
 
+from karoloke.catalog import get_catalog
 from karoloke.jukebox_controller import (
     get_background_img,
     get_background_subfolders,
+    get_playlist_view,
+    get_video_details,
     get_video_file,
     validate_song_for_queue,
 )
+from karoloke.probe_cache import get_probe_cache
+from karoloke.queue_store import get_song_queue
 
 BACKGROUND_FOLDER = os.path.join(
     pathlib.Path(__file__).parents[1], 'karoloke', 'backgrounds'
@@ -75,6 +81,23 @@ def test_get_background_subfolders_returns_list(tmpdir):
     assert result[0] == 'default'
 
 
+def test_background_listings_are_cached_until_the_folder_changes(tmpdir):
+    folder = tmpdir.mkdir('default')
+    folder.join('a.png').write('fake')
+    assert get_background_img(str(tmpdir)) == os.path.join('default', 'a.png')
+    assert get_background_subfolders(str(tmpdir)) == ['default']
+
+    with mock.patch('os.listdir', side_effect=AssertionError):
+        get_background_img(str(tmpdir))
+        assert get_background_subfolders(str(tmpdir)) == ['default']
+
+    folder.join('a.png').remove()
+    folder.join('b.png').write('fake')
+    stat = os.stat(str(folder))
+    os.utime(str(folder), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert get_background_img(str(tmpdir)) == os.path.join('default', 'b.png')
+
+
 def test_get_background_subfolders_nonexistent_dir():
     result = get_background_subfolders('/nonexistent/path')
     assert result == ['default']
@@ -94,9 +117,6 @@ def test_validate_song_for_queue_valid(tmpdir):
     from karoloke import jukebox_router
 
     with jukebox_router.app.test_request_context():
-        from flask import session
-
-        session['queue'] = []
         result = validate_song_for_queue('123', str(tmpdir))
         assert result['valid'] is True
         assert result['reason'] is None
@@ -109,9 +129,7 @@ def test_validate_song_for_queue_duplicate(tmpdir):
     from karoloke import jukebox_router
 
     with jukebox_router.app.test_request_context():
-        from flask import session
-
-        session['queue'] = ['123']
+        get_song_queue().add('123')
         result = validate_song_for_queue('123', str(tmpdir))
         assert result['valid'] is False
         assert result['reason'] == 'duplicate'
@@ -121,9 +139,6 @@ def test_validate_song_for_queue_not_found(tmpdir):
     from karoloke import jukebox_router
 
     with jukebox_router.app.test_request_context():
-        from flask import session
-
-        session['queue'] = []
         result = validate_song_for_queue('999', str(tmpdir))
         assert result['valid'] is False
         assert result['reason'] == 'error'
@@ -137,9 +152,6 @@ def test_validate_song_for_queue_empty_file(tmpdir):
     from karoloke import jukebox_router
 
     with jukebox_router.app.test_request_context():
-        from flask import session
-
-        session['queue'] = []
         result = validate_song_for_queue('123', str(tmpdir))
         assert result['valid'] is False
         assert result['reason'] == 'error'
@@ -167,3 +179,56 @@ def test_get_video_file_in_subdirectory(tmpdir):
 def test_get_video_file_not_found(tmpdir):
     result = get_video_file('999', str(tmpdir))
     assert result is None
+
+
+def test_get_playlist_view_joins_playlist_and_catalog(tmp_path, mp4_bytes):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_bytes(mp4_bytes)
+    playlist_file = tmp_path / 'playlist.json'
+    playlist_file.write_text(
+        json.dumps(
+            [
+                {'filename': '1', 'artist': 'A', 'title': 'T', 'part': ''},
+                {'filename': '2', 'artist': 'B', 'title': 'U', 'part': ''},
+            ]
+        )
+    )
+
+    view = get_playlist_view(str(playlist_file), str(videos))
+    # First request: the video is still being probed
+    assert [row['filename'] for row in view['items']] == ['1']
+    assert view['error_count'] == 1
+
+    get_probe_cache(str(videos)).wait(timeout=5)
+    view = get_playlist_view(str(playlist_file), str(videos))
+    assert view['ok_count'] == 1
+    assert view['pending_count'] == 0
+    assert 'pending' not in view['items'][0]
+
+
+def test_get_playlist_view_is_memoized(tmp_path, mp4_bytes):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    playlist_file = tmp_path / 'playlist.json'
+    playlist_file.write_text(json.dumps([{'filename': '1', 'title': 'T'}]))
+
+    first = get_playlist_view(str(playlist_file), str(videos))
+    with mock.patch('karoloke.jukebox_controller.load_playlist') as loader:
+        assert get_playlist_view(str(playlist_file), str(videos)) is first
+        loader.assert_not_called()
+
+    # A catalog change invalidates the memo
+    (videos / '1.mp4').write_bytes(mp4_bytes)
+    get_catalog(str(videos)).add_file(str(videos / '1.mp4'))
+    assert get_playlist_view(str(playlist_file), str(videos)) is not first
+
+
+def test_get_video_details(tmp_path):
+    (tmp_path / '42.webm').write_bytes(b'x' * 10)
+    assert get_video_details('42', str(tmp_path)) == {
+        'video': '42.webm',
+        'size': 10,
+        'mimetype': 'video/webm',
+    }
+    assert get_video_details('43', str(tmp_path)) is None
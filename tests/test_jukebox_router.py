@@ -1,7 +1,9 @@
+import json
 import os
 import re
 import sys
 import tempfile
+import threading
 from io import BytesIO
 from unittest import mock
 
@@ -9,16 +11,37 @@ import pytest
 
 if not sys.platform.startswith('darwin'):
     import pyzbar.pyzbar as pyzbar
+
 from PIL import Image
+from werkzeug.test import Client
 
 from karoloke import jukebox_router
-
-
-@pytest.fixture
-def client():
+from karoloke.asgi import create_asgi_app
+from karoloke.catalog import CatalogEntry, register_rendition
+from karoloke.hls import HlsPackager
+from karoloke.jukebox_controller import get_playlist_view
+from karoloke.previews import PreviewGenerator
+from karoloke.probe_cache import get_probe_cache
+from karoloke.queue_store import get_song_queue
+from karoloke.streaming import FileRange
+from karoloke.video_cache import close_video_cache, open_video_cache
+from tests.helpers import AsgiToWsgi, fake_hls_ffmpeg
+
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def client(request):
+    """Test client of the Flask app, or of the same app behind the ASGI
+    bridge: every route must behave identically on both servers."""
     jukebox_router.app.config['TESTING'] = True
-    with jukebox_router.app.test_client() as client:
-        yield client
+    if request.param == 'wsgi':
+        with jukebox_router.app.test_client() as client:
+            yield client
+        return
+    bridge = create_asgi_app(jukebox_router.app, max_workers=2)
+    yield Client(
+        AsgiToWsgi(bridge), response_wrapper=jukebox_router.app.response_class
+    )
+    bridge.executor.shutdown()
 
 
 def test_index_get(client):
@@ -46,12 +69,32 @@ def test_playlist(client):
     assert b'<html' in response.data
 
 
+def test_playlist_follows_queue_events(client, request):
+    page = client.get('/playlist').data.decode()
+    assert 'id="queue-songs"' in page
+    # Streams are only held open by phones on the ASGI server
+    live = request.node.callspec.params['client'] == 'asgi'
+    assert f'if ({str(live).lower()} && window.EventSource)' in page
+    assert "fetch('/get_queue')" in page
+
+
 def test_playlist_qr(client):
     response = client.get('/playlist_qr')
     assert response.status_code == 200
     assert response.mimetype == 'image/png'
 
 
+def test_playlist_qr_is_cached_and_conditional(client):
+    first = client.get('/playlist_qr')
+    with mock.patch('qrcode.make', side_effect=AssertionError):
+        second = client.get('/playlist_qr')
+    assert second.data == first.data
+
+    etag = first.headers['ETag']
+    response = client.get('/playlist_qr', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
 # @pytest.mark.skipif(
 #     sys.platform.startswith('darwin'),
 #     reason='QR code IP test skipped on macOS',
@@ -81,6 +124,13 @@ def test_background(client):
     try:
         response = client.get(f'/background/{fname}')
         assert response.status_code == 200
+        assert 'max-age=604800' in response.headers['Cache-Control']
+
+        etag = response.headers['ETag']
+        response = client.get(
+            f'/background/{fname}', headers={'If-None-Match': etag}
+        )
+        assert response.status_code == 304
     finally:
         os.remove(temp_file_name)
 
@@ -129,9 +179,6 @@ def test_score(client):
 
 
 def test_add_to_queue_valid(client):
-    with client.session_transaction() as sess:
-        sess['queue'] = []
-
     with mock.patch(
         'karoloke.jukebox_router.validate_song_for_queue',
         return_value={'valid': True, 'reason': None},
@@ -143,6 +190,24 @@ def test_add_to_queue_valid(client):
         assert '123' in data['queue']
 
 
+def test_add_to_queue_is_shared_between_clients(client):
+    version = get_song_queue().version
+    with mock.patch(
+        'karoloke.jukebox_router.validate_song_for_queue',
+        return_value={'valid': True, 'reason': None},
+    ):
+        client.post('/add_to_queue', data={'song': '123'})
+        # A second guest (no cookies) queues a song from their phone
+        with jukebox_router.app.test_client() as phone:
+            phone.post('/add_to_queue', data={'song': '456'})
+            response = phone.post('/add_to_queue', data={'song': '123'})
+            assert response.status_code == 409
+
+    data = client.get('/get_queue').get_json()
+    assert data['queue'] == ['123', '456']
+    assert data['version'] == version + 2
+
+
 def test_add_to_queue_duplicate(client):
     with mock.patch(
         'karoloke.jukebox_router.validate_song_for_queue',
@@ -173,8 +238,8 @@ def test_add_to_queue_empty_song(client):
 
 
 def test_get_queue(client):
-    with client.session_transaction() as sess:
-        sess['queue'] = ['123', '456']
+    get_song_queue().add('123')
+    get_song_queue().add('456')
 
     response = client.get('/get_queue')
     assert response.status_code == 200
@@ -190,9 +255,9 @@ def test_get_queue_empty(client):
 
 
 def test_next_song_with_queue(client):
-    with client.session_transaction() as sess:
-        sess['queue'] = ['123', '456']
-        sess['current_song'] = '123'
+    get_song_queue().add('123')
+    get_song_queue().add('456')
+    get_song_queue().play('123')
 
     response = client.get('/next_song')
     assert response.status_code == 200
@@ -202,9 +267,8 @@ def test_next_song_with_queue(client):
 
 
 def test_next_song_empty_queue(client):
-    with client.session_transaction() as sess:
-        sess['queue'] = ['123']
-        sess['current_song'] = '123'
+    get_song_queue().add('123')
+    get_song_queue().play('123')
 
     response = client.get('/next_song')
     assert response.status_code == 200
@@ -267,8 +331,7 @@ def test_set_background_folder_empty(client):
 
 
 def test_index_auto_load_from_queue(client):
-    with client.session_transaction() as sess:
-        sess['queue'] = ['123']
+    get_song_queue().add('123')
 
     with mock.patch(
         'karoloke.jukebox_controller.get_video_file', return_value='123.mp4'
@@ -289,3 +352,316 @@ def test_playlist_invalid_page_size(client):
     response = client.get('/playlist?page=1&page_size=999')
     assert response.status_code == 200
     assert b'<html' in response.data
+
+
+def test_search_returns_only_available_songs(
+    client, tmp_path, monkeypatch, mp4_bytes
+):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_bytes(mp4_bytes)
+    # Listed in the playlist, but empty or not a video
+    (videos / '3.mp4').write_bytes(b'')
+    (videos / '4.mp4').write_text('video')
+    playlist_file = tmp_path / 'playlist.json'
+    playlist_file.write_text(
+        json.dumps(
+            [
+                {'filename': '1', 'artist': 'Elis', 'title': 'Canção'},
+                {'filename': '2', 'artist': 'Elis', 'title': 'Cancao'},
+                {'filename': '3', 'artist': 'Elis', 'title': 'Cancão'},
+                {'filename': '4', 'artist': 'Elis', 'title': 'Cançao'},
+            ]
+        )
+    )
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    monkeypatch.setattr(jukebox_router, 'playlist_path', str(playlist_file))
+    # Same rule as the song book
+    get_playlist_view(str(playlist_file), str(videos))
+    get_probe_cache(str(videos)).wait(timeout=5)
+
+    response = client.get('/search?q=CANCAO')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [row['filename'] for row in data['results']] == ['1']
+    assert data['fuzzy'] is False
+
+    # No prefix match: falls back to the typo-tolerant index
+    data = client.get('/search?q=cancaoo').get_json()
+    assert [row['filename'] for row in data['results']] == ['1']
+    assert data['fuzzy'] is True
+
+
+def test_search_empty_query(client):
+    response = client.get('/search?q=')
+    assert response.status_code == 200
+    assert response.get_json()['results'] == []
+
+
+def test_metrics(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert isinstance(response.get_json(), dict)
+
+
+def test_events_stream_pushes_queue_changes():
+    # Endless stream: see test_asgi.py for the ASGI variant
+    client = jukebox_router.app.test_client()
+    get_song_queue().add('123')
+    response = client.get('/events')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    chunks = iter(response.response)
+    assert next(chunks) == b'retry: 3000\n\n'
+    message = next(chunks).decode()
+    assert 'event: queue' in message
+    assert '"queue":["123"]' in message
+    response.close()
+
+
+def test_events_streams_are_capped_under_wsgi(monkeypatch):
+    monkeypatch.setattr(
+        jukebox_router, '_event_streams', threading.BoundedSemaphore(1)
+    )
+    client = jukebox_router.app.test_client()
+    first = client.get('/events')
+    assert first.status_code == 200
+    # The thread pool must keep serving other requests
+    assert client.get('/events').status_code == 503
+    assert client.get('/get_queue').status_code == 200
+    first.close()
+    second = client.get('/events')
+    assert second.status_code == 200
+    second.close()
+
+
+def test_video_served_from_local_cache(client, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '7.mp4').write_bytes(b'v' * 4000)
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    origin = client.get('/video/7.mp4')
+
+    cache = open_video_cache(str(tmp_path / 'cache'), max_bytes=10_000)
+    try:
+        get_song_queue().add('7')
+        assert cache.wait(timeout=5)
+        response = client.get('/video/7.mp4', headers={'Range': 'bytes=0-99'})
+        assert response.status_code == 206
+        assert response.data == b'v' * 100
+        # Same validators as the origin copy
+        assert response.headers['ETag'] == origin.headers['ETag']
+
+        stats = client.get('/metrics').get_json()['video_cache']
+        assert stats['hits'] == 1
+        assert stats['bytes_saved'] == 100
+
+        # A client going away early only saved what was sent to it (the
+        # ASGI bridge reads the whole body, so go straight to WSGI)
+        response = jukebox_router.app.test_client().get(
+            '/video/7.mp4',
+            buffered=False,
+            environ_base={
+                'wsgi.file_wrapper': lambda f, size: FileRange(f, 4000, 300)
+            },
+        )
+        next(iter(response.response))
+        response.close()
+        stats = client.get('/metrics').get_json()['video_cache']
+        assert stats['bytes_saved'] == 400
+    finally:
+        close_video_cache()
+
+
+def test_next_song_announces_the_next_video(client, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '456.mp4').write_bytes(b'v' * 1234)
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    get_song_queue().add('123')
+    get_song_queue().add('456')
+    get_song_queue().play('123')
+
+    response = client.get('/next_song')
+    video = response.get_json()['video']
+    assert video == {
+        'url': '/video/456.mp4',
+        'size': 1234,
+        'mimetype': 'video/mp4',
+    }
+    # Read with fetch(): a preload header would be ignored
+    assert 'Link' not in response.headers
+
+    # The score screen shown before it preloads it
+    response = client.get('/score')
+    assert response.headers['Link'] == (
+        '</video/456.mp4>; rel=preload; as=video; type="video/mp4"'
+    )
+    assert b'rel="preload" href="/video/456.mp4"' in response.data
+
+
+def test_next_song_without_video_has_no_preload(client):
+    get_song_queue().add('123')
+    get_song_queue().add('999999')
+    get_song_queue().play('123')
+
+    response = client.get('/next_song')
+    assert response.get_json()['video'] is None
+    assert 'Link' not in response.headers
+
+
+def test_preview_routes(client, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '5.mp4').write_bytes(b'video')
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    generator = PreviewGenerator(
+        str(tmp_path / 'previews'), ffmpeg='ffmpeg', cpu_share=1.0
+    )
+    monkeypatch.setattr(jukebox_router, 'get_previews', lambda: generator)
+
+    # Not generated yet
+    assert client.get('/preview/5/poster').status_code == 404
+
+    def fake_ffmpeg(args):
+        with open(args[-1], 'wb') as f:
+            f.write(b'jpeg')
+        return True
+
+    with mock.patch('karoloke.previews.run_ffmpeg', side_effect=fake_ffmpeg):
+        generator.schedule(jukebox_router.get_catalog(str(videos)).entries())
+        assert generator.jobs.wait(timeout=5)
+    response = client.get('/preview/5/poster')
+    assert response.status_code == 200
+    assert response.data == b'jpeg'
+    assert client.get('/preview/6/poster').status_code == 404
+    assert client.get('/preview/5/other').status_code == 404
+
+    progress = client.get('/previews/progress').get_json()
+    assert progress['enabled'] is True
+    assert progress['poster']['done'] == 1
+
+
+def test_previews_disabled(client, monkeypatch):
+    monkeypatch.setattr(jukebox_router, 'get_previews', lambda: None)
+    assert client.get('/preview/1/poster').status_code == 404
+    assert client.get('/previews/progress').get_json() == {'enabled': False}
+
+
+def test_video_serves_renditions(client, tmp_path, monkeypatch):
+    (tmp_path / '3-abc.mp4').write_bytes(b'converted')
+    monkeypatch.setattr(jukebox_router, 'TRANSCODE_DIR', str(tmp_path))
+    response = client.get('/video/.renditions/3-abc.mp4')
+    assert response.status_code == 200
+    assert response.data == b'converted'
+    assert client.get('/video/.renditions/../x.mp4').status_code == 404
+    # Only the leading prefix names a rendition
+    response = client.get('/video/songs/.renditions/3-abc.mp4')
+    assert response.status_code == 404
+
+
+def test_rendition_metrics_use_the_song_number(client, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    renditions = tmp_path / 'renditions'
+    renditions.mkdir()
+    (renditions / '3-abc.mp4').write_bytes(b'converted')
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    monkeypatch.setattr(jukebox_router, 'TRANSCODE_DIR', str(renditions))
+    entry = CatalogEntry(str(renditions / '3-abc.mp4'), 9, '.mp4', 0)
+    register_rendition(str(videos), '3', entry)
+    jukebox_router.get_metrics().reset()
+    try:
+        assert client.get('/video/.renditions/3-abc.mp4').status_code == 200
+    finally:
+        register_rendition(str(videos), '3', None)
+    snapshot = client.get('/metrics').get_json()
+    assert snapshot['requests'] == {'3': 1}
+    assert snapshot['bytes_served'] == {'3': 9}
+
+
+def test_ttff_reports(client, monkeypatch):
+    jukebox_router.get_metrics().reset()
+    response = client.post(
+        '/ttff', json={'video': 'http://tv:5000/video/1.mp4', 'ms': 800}
+    )
+    assert response.get_json() == {'label': 'progressive'}
+    client.post('/ttff', json={'video': '/video/2.mp4', 'ms': 400})
+    assert client.post('/ttff', json={'ms': 1}).status_code == 400
+    assert (
+        client.post(
+            '/ttff', json={'video': '/video/1.mp4', 'ms': -5}
+        ).status_code
+        == 400
+    )
+
+    data = client.get('/metrics').get_json()
+    assert data['ttff_avg_ms'] == {'progressive': 600}
+    assert 'faststart' not in data
+
+
+def test_ttff_labels_faststart_copies(client, monkeypatch):
+    jukebox_router.get_metrics().reset()
+    optimizer = mock.Mock()
+    optimizer.label.side_effect = lambda path: (
+        'faststart' if path.endswith('.faststart.mp4') else 'moov_at_end'
+    )
+    optimizer.stats.return_value = {'flagged': 1, 'optimized': 1}
+    monkeypatch.setattr(
+        jukebox_router, 'get_faststart_optimizer', lambda: optimizer
+    )
+    client.post('/ttff', json={'video': '/video/1.mp4', 'ms': 3000})
+    client.post(
+        '/ttff',
+        json={'video': '/video/.renditions/1-x.faststart.mp4', 'ms': 500},
+    )
+    faststart = client.get('/metrics').get_json()['faststart']
+    assert faststart == {'flagged': 1, 'optimized': 1, 'ttff_saved_ms': 2500}
+
+
+def test_hls_served_once_packaged(client, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '7.mp4').write_bytes(b'v' * 1000)
+    monkeypatch.setattr(jukebox_router, 'VIDEO_DIR', str(videos))
+    assert client.get('/hls/7/').status_code == 404
+
+    packager = HlsPackager(
+        str(tmp_path / 'hls'), 'ffmpeg', variants=((360, 800, 96),)
+    )
+    monkeypatch.setattr(jukebox_router, 'get_hls_packager', lambda: packager)
+    assert client.get('/hls/7/').status_code == 404
+    with mock.patch('karoloke.hls.run_ffmpeg', side_effect=fake_hls_ffmpeg):
+        get_song_queue().add('7')
+        assert packager.wait(timeout=5)
+
+    version = os.listdir(packager.output_dir)[0]
+    base = f'/hls/7/{version}/'
+    master = client.get(base)
+    assert master.status_code == 200
+    assert master.mimetype == 'application/vnd.apple.mpegurl'
+    assert b'v0/index.m3u8' in master.data
+    assert client.get(base + 'v0/index.m3u8').status_code == 200
+    segment = client.get(base + 'v0/seg_00000.ts')
+    assert segment.mimetype == 'video/mp2t'
+    assert segment.cache_control.max_age == jukebox_router.VIDEO_MAX_AGE
+    assert client.get(base + 'v0/missing.ts').status_code == 404
+    assert client.get(base + '../../etc/passwd').status_code == 404
+    # URLs of another version of the video are gone
+    assert client.get('/hls/7/7-000000000000/').status_code == 404
+
+    page = client.get('/').data.decode()
+    assert f'<source src="{base}" type="application/vnd.apple.mpegurl">' in (
+        page
+    )
+    assert client.get('/metrics').get_json()['hls']['packages'] == 1
+
+
+def test_ttff_labels_hls_playback(client):
+    jukebox_router.get_metrics().reset()
+    response = client.post(
+        '/ttff', json={'video': 'http://tv:5000/hls/7/', 'ms': 700}
+    )
+    assert response.get_json() == {'label': 'hls'}
+    assert client.get('/metrics').get_json()['ttff_avg_ms'] == {'hls': 700}
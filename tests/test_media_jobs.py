@@ -0,0 +1,143 @@
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+from karoloke.catalog import CatalogEntry
+from karoloke.media_jobs import (
+    DONE,
+    FAILED,
+    PENDING,
+    JobStore,
+    MediaJobQueue,
+    replace_output,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / '1.mp4'
+    path.write_bytes(b'video')
+    stat = path.stat()
+    return CatalogEntry(str(path), stat.st_size, '.mp4', stat.st_mtime_ns)
+
+
+def copy_task(tmp_path):
+    def task(entry):
+        output = str(tmp_path / (os.path.basename(entry.path) + '.out'))
+        with open(output + '.part', 'wb') as f:
+            f.write(b'done')
+        return replace_output(output + '.part', output)
+
+    return task
+
+
+def test_runs_each_job_once(tmp_path, store, source):
+    calls = []
+    task = copy_task(tmp_path)
+    jobs = MediaJobQueue(
+        {'copy': lambda entry: calls.append(entry) or task(entry)},
+        store=store,
+        cpu_share=1.0,
+    )
+    assert jobs.submit('copy', source)
+    assert jobs.wait(timeout=5)
+    assert not jobs.submit('copy', source)
+    assert len(calls) == 1
+    assert jobs.result('copy', source) == str(tmp_path / '1.mp4.out')
+    assert jobs.progress()['copy'][DONE] == 1
+
+
+def test_submit_many_saves_new_jobs_at_once(tmp_path, store):
+    entries = [
+        CatalogEntry(str(tmp_path / f'{n}.mp4'), 5, '.mp4', n)
+        for n in range(3)
+    ]
+    jobs = MediaJobQueue(
+        {'copy': lambda entry: None}, store=store, cpu_share=1.0
+    )
+    with mock.patch.object(
+        store, 'save_many', wraps=store.save_many
+    ) as save_many:
+        assert jobs.submit_many('copy', entries + entries[:1]) == 3
+        assert jobs.wait(timeout=5)
+    save_many.assert_called_once_with('copy', entries, PENDING)
+    assert jobs.progress()['copy'][DONE] == 3
+    assert jobs.submit_many('copy', entries) == 0
+
+
+def test_changed_source_runs_again(tmp_path, source):
+    jobs = MediaJobQueue({'copy': copy_task(tmp_path)}, cpu_share=1.0)
+    jobs.submit('copy', source)
+    jobs.wait(timeout=5)
+    changed = source._replace(mtime_ns=source.mtime_ns + 1)
+    assert jobs.result('copy', changed) is None
+    assert jobs.submit('copy', changed)
+    jobs.wait(timeout=5)
+    assert jobs.result('copy', changed)
+
+
+def test_failures_are_recorded_and_not_retried(store, source):
+    def broken(entry):
+        raise RuntimeError('cannot decode')
+
+    jobs = MediaJobQueue({'copy': broken}, store=store, cpu_share=1.0)
+    jobs.submit('copy', source)
+    jobs.wait(timeout=5)
+    assert jobs.progress()['copy'][FAILED] == 1
+    assert jobs.result('copy', source) is None
+
+    reopened = MediaJobQueue({'copy': broken}, store=store, cpu_share=1.0)
+    assert not reopened.submit('copy', source)
+
+
+def test_unfinished_jobs_are_resumed(tmp_path, store, source):
+    release = threading.Event()
+
+    def blocked(entry):
+        release.wait(5)
+        raise RuntimeError('interrupted')
+
+    first = MediaJobQueue({'copy': blocked}, store=store, cpu_share=1.0)
+    first.submit('copy', source)
+    first.shutdown()
+    # The job is still recorded as unfinished in the store
+    assert store.load('copy')[source.path][2] in (PENDING, 'running')
+    release.set()
+
+    resumed = MediaJobQueue(
+        {'copy': copy_task(tmp_path)}, store=store, cpu_share=1.0
+    )
+    # Restored state: not scheduled twice by a plain submit
+    assert not resumed.submit('copy', source)
+    assert resumed.resume() == 1
+    assert resumed.wait(timeout=5)
+    assert resumed.result('copy', source)
+
+
+def test_throttles_to_cpu_share(tmp_path, source):
+    with mock.patch('os.cpu_count', return_value=1):
+        jobs = MediaJobQueue(
+            {'copy': copy_task(tmp_path)}, workers=1, cpu_share=0.25
+        )
+    assert jobs.duty == 0.25
+    with mock.patch('karoloke.media_jobs.time.monotonic') as clock:
+        clock.side_effect = [0.0, 2.0]
+        with mock.patch('karoloke.media_jobs.time.sleep') as sleep:
+            jobs.submit('copy', source)
+            jobs.wait(timeout=5)
+    # Idle three times as long as the job ran
+    sleep.assert_called_once_with(pytest.approx(6.0))
+
+
+def test_replace_output_requires_a_file(tmp_path):
+    with pytest.raises(RuntimeError):
+        replace_output(str(tmp_path / 'x.part'), str(tmp_path / 'x'))
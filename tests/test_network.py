@@ -0,0 +1,28 @@
+import socket
+from unittest import mock
+
+from karoloke.network import LocalAddress, discover_local_ip
+
+
+def test_discover_local_ip_uses_host_address():
+    with mock.patch('socket.gethostbyname', return_value='192.168.0.10'):
+        assert discover_local_ip() == '192.168.0.10'
+
+
+def test_discover_local_ip_falls_back_when_offline():
+    with mock.patch('socket.gethostbyname', side_effect=socket.gaierror):
+        with mock.patch('socket.socket') as mock_socket:
+            mock_socket.return_value.connect.side_effect = OSError
+            assert discover_local_ip() == 'localhost'
+            mock_socket.return_value.close.assert_called_once()
+
+
+def test_local_address_refreshes_in_background():
+    address = LocalAddress(interval=60)
+    assert address.ip == 'localhost'
+    with mock.patch(
+        'karoloke.network.discover_local_ip', return_value='10.0.0.2'
+    ):
+        address.start()
+        address.stop(timeout=5)
+    assert address.ip == '10.0.0.2'
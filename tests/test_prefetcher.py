@@ -0,0 +1,71 @@
+import os
+import struct
+from unittest import mock
+
+import pytest
+
+from karoloke.catalog import VideoCatalog
+from karoloke.metrics import get_metrics
+from karoloke.prefetcher import Prefetcher
+from karoloke.queue_store import SongQueue
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    (tmp_path / '1.webm').write_bytes(b'a' * 5000)
+    (tmp_path / '2.webm').write_bytes(b'b' * 5000)
+    (tmp_path / '3.webm').write_bytes(b'c' * 5000)
+    return VideoCatalog(str(tmp_path))
+
+
+def test_warm_reads_the_head_of_the_file(catalog):
+    prefetcher = Prefetcher(catalog.lookup, head_bytes=1000, rate=0)
+    entry = catalog.lookup('1')
+    assert prefetcher.warm(entry, '1') == 1000
+    # Recently warmed files are not read again
+    assert prefetcher.warm(entry, '1') == 0
+
+
+def test_warm_hints_the_kernel(catalog):
+    if not hasattr(os, 'posix_fadvise'):
+        pytest.skip('posix_fadvise is not available')
+    prefetcher = Prefetcher(catalog.lookup, head_bytes=1000, rate=0)
+    with mock.patch('os.posix_fadvise') as fadvise:
+        prefetcher.warm(catalog.lookup('1'))
+    fadvise.assert_called_once_with(mock.ANY, 0, 1000, os.POSIX_FADV_WILLNEED)
+
+
+def test_warm_includes_a_trailing_mp4_index(tmp_path):
+    mdat = struct.pack('>I4s', 8 + 4000, b'mdat') + b'\x01' * 4000
+    moov = struct.pack('>I4s', 300, b'moov') + b'\x02' * 292
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0x200)
+    (tmp_path / '9.mp4').write_bytes(ftyp + mdat + moov)
+    catalog = VideoCatalog(str(tmp_path))
+    prefetcher = Prefetcher(catalog.lookup, head_bytes=100, rate=0)
+    assert prefetcher.warm(catalog.lookup('9')) == 100 + 100
+
+
+def test_rate_limits_reads(catalog):
+    prefetcher = Prefetcher(catalog.lookup, head_bytes=5000, rate=1000)
+    with mock.patch('time.sleep') as sleep:
+        prefetcher.warm(catalog.lookup('1'))
+    slept = sum(call.args[0] for call in sleep.call_args_list)
+    assert slept == pytest.approx(5.0, abs=0.5)
+
+
+def test_queue_changes_warm_the_next_songs(catalog):
+    get_metrics().reset()
+    prefetcher = Prefetcher(catalog.lookup, depth=2, head_bytes=10, rate=0)
+    queue = SongQueue()
+    queue.add_listener(lambda q, change: prefetcher.schedule(q.songs()))
+    for song in ('1', '2', '3'):
+        queue.add(song)
+    assert prefetcher.wait(timeout=5)
+    warmed = get_metrics().snapshot()['prefetch_bytes']
+    assert set(warmed) == {'1', '2'}
+
+
+def test_missing_songs_are_skipped(catalog):
+    prefetcher = Prefetcher(catalog.lookup, rate=0)
+    prefetcher.schedule(['404'])
+    assert prefetcher.wait(timeout=5)
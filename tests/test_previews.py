@@ -0,0 +1,113 @@
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from karoloke import previews
+from karoloke.catalog import VideoCatalog
+from karoloke.media_jobs import DONE
+from karoloke.previews import CLIP, POSTER, PreviewGenerator, preview_key
+
+
+def fake_ffmpeg(args):
+    # The output file is the last argument
+    with open(args[-1], 'wb') as f:
+        f.write(b'rendered')
+    return True
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_bytes(b'video')
+    (videos / '2.mp4').write_bytes(b'')
+    return VideoCatalog(str(videos))
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return PreviewGenerator(
+        str(tmp_path / 'previews'), ffmpeg='ffmpeg', cpu_share=1.0
+    )
+
+
+def test_generates_poster_and_clip(catalog, generator):
+    entry = catalog.lookup('1')
+    with mock.patch('karoloke.previews.run_ffmpeg', side_effect=fake_ffmpeg):
+        # Empty files are skipped
+        assert generator.schedule(catalog.entries()) == 2
+        assert generator.jobs.wait(timeout=5)
+    key = preview_key(entry)
+    assert generator.poster(entry) == os.path.join(
+        generator.output_dir, key + '.jpg'
+    )
+    assert generator.clip(entry) == os.path.join(
+        generator.output_dir, key + '.mp4'
+    )
+    progress = generator.progress()
+    assert progress[POSTER][DONE] == progress[CLIP][DONE] == 1
+
+
+def test_short_videos_fall_back_to_the_start(catalog, generator):
+    calls = []
+
+    def ffmpeg(args):
+        calls.append(args[args.index('-ss') + 1])
+        # Nothing to extract 30 s into a short video
+        return calls[-1] == '0' and fake_ffmpeg(args)
+
+    with mock.patch('karoloke.previews.run_ffmpeg', side_effect=ffmpeg):
+        assert generator.make_poster(catalog.lookup('1'))
+    assert calls == ['30', '0']
+
+
+@pytest.mark.parametrize('leaves_part', [False, True])
+def test_undecodable_video_fails(catalog, generator, leaves_part):
+    def failing_ffmpeg(args):
+        if leaves_part:
+            fake_ffmpeg(args)
+        return False
+
+    with mock.patch(
+        'karoloke.previews.run_ffmpeg', side_effect=failing_ffmpeg
+    ):
+        generator.schedule([catalog.lookup('1')])
+        generator.jobs.wait(timeout=5)
+    assert generator.poster(catalog.lookup('1')) is None
+    assert generator.progress()[POSTER]['failed'] == 1
+    assert not [
+        name
+        for name in os.listdir(generator.output_dir)
+        if name.endswith('.part')
+    ]
+
+
+def test_without_ffmpeg_nothing_is_scheduled(catalog, tmp_path):
+    generator = PreviewGenerator(str(tmp_path / 'previews'), ffmpeg=None)
+    assert generator.schedule(catalog.entries()) == 0
+
+
+def test_previews_are_off_until_generated(monkeypatch, catalog, generator):
+    listeners = []
+    monkeypatch.setattr(previews, '_previews', None)
+    monkeypatch.setattr(previews, 'get_preview_generator', lambda: generator)
+    monkeypatch.setattr(previews, 'get_catalog', lambda video_dir: catalog)
+    monkeypatch.setattr(previews, 'add_catalog_listener', listeners.append)
+    assert previews.get_previews() is None
+
+    with mock.patch.object(generator, 'schedule', return_value=0) as schedule:
+        assert previews.generate_previews(catalog.video_dir)
+        assert previews.get_previews() is generator
+        deadline = time.monotonic() + 5
+        while not schedule.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(schedule.call_args.args[0]) == 2
+        # Only the new file is scheduled on the next catalog change
+        new = os.path.join(catalog.video_dir, '3.mp4')
+        with open(new, 'wb') as f:
+            f.write(b'video')
+        catalog.add_file(new)
+        listeners[0](catalog)
+    assert [entry.path for entry in schedule.call_args.args[0]] == [new]
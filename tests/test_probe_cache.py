@@ -0,0 +1,89 @@
+from unittest import mock
+
+import pytest
+
+from karoloke.catalog import VideoCatalog
+from karoloke.catalog_store import CatalogStore
+from karoloke.probe_cache import ProbeCache
+
+
+@pytest.fixture
+def video_dir(tmp_path, mp4_bytes):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.mp4').write_bytes(mp4_bytes)
+    (videos / '2.mp4').write_bytes(mp4_bytes)
+    return videos
+
+
+def _entry(catalog, song_num):
+    return catalog.lookup(song_num)
+
+
+def test_probe_cache_reports_pending_then_result(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    with mock.patch('shutil.which', return_value=None):
+        probes = ProbeCache(str(video_dir), max_workers=2)
+
+    entry = _entry(catalog, '1')
+    assert probes.status(entry) is None
+    assert probes.wait(timeout=5)
+    assert probes.status(entry) is True
+    probes.shutdown()
+
+
+def test_probe_cache_resolves_ffprobe_once(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    with mock.patch('shutil.which', return_value=None) as mock_which:
+        probes = ProbeCache(str(video_dir))
+        probes.status(_entry(catalog, '1'))
+        probes.status(_entry(catalog, '2'))
+        probes.wait(timeout=5)
+    assert mock_which.call_count == 1
+    probes.shutdown()
+
+
+def test_probe_cache_probes_each_file_once(video_dir):
+    catalog = VideoCatalog(str(video_dir))
+    probes = ProbeCache(str(video_dir))
+    with mock.patch(
+        'karoloke.probe_cache.is_playable', return_value=False
+    ) as mock_probe:
+        entry = _entry(catalog, '1')
+        probes.status(entry)
+        probes.status(entry)
+        probes.wait(timeout=5)
+        assert probes.status(entry) is False
+    assert mock_probe.call_count == 1
+    probes.shutdown()
+
+
+def test_probe_cache_reprobes_modified_file(video_dir, mp4_bytes):
+    catalog = VideoCatalog(str(video_dir))
+    probes = ProbeCache(str(video_dir))
+    with mock.patch('karoloke.probe_cache.is_playable', return_value=True):
+        probes.status(_entry(catalog, '1'))
+        probes.wait(timeout=5)
+
+    (video_dir / '1.mp4').write_bytes(mp4_bytes + b'\x00' * 8)
+    catalog.add_file(str(video_dir / '1.mp4'))
+    assert probes.status(_entry(catalog, '1')) is None
+    probes.wait(timeout=5)
+    probes.shutdown()
+
+
+def test_probe_cache_batches_results_into_store(video_dir, tmp_path):
+    store = CatalogStore(str(tmp_path / 'catalog.sqlite3'))
+    catalog = VideoCatalog(str(video_dir), store=store)
+    probes = ProbeCache(str(video_dir), store=store, batch_size=10)
+    with mock.patch('karoloke.probe_cache.is_playable', return_value=True):
+        probes.status(_entry(catalog, '1'))
+        probes.status(_entry(catalog, '2'))
+        probes.wait(timeout=5)
+    probes.shutdown()
+
+    restored = ProbeCache(str(video_dir), store=store)
+    assert restored.status(_entry(catalog, '1')) is True
+    assert restored.status(_entry(catalog, '2')) is True
+    restored.shutdown()
+    store.close()
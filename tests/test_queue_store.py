@@ -0,0 +1,64 @@
+import threading
+
+from karoloke.queue_store import SongQueue
+
+
+def test_add_rejects_duplicates():
+    queue = SongQueue()
+    assert queue.add('123') is True
+    assert queue.add('123') is False
+    assert '123' in queue
+    assert queue.songs() == ['123']
+    assert queue.version == 1
+
+
+def test_advance_drops_the_current_song():
+    queue = SongQueue()
+    for song in ('1', '2', '3'):
+        queue.add(song)
+    queue.play('1')
+    assert queue.advance() == '2'
+    assert '1' not in queue
+
+    # The current song is removed even when it is not the first one
+    queue.play('3')
+    assert queue.advance() == '2'
+    assert queue.songs() == ['2']
+
+    queue.play('2')
+    assert queue.advance() is None
+    assert len(queue) == 0
+
+
+def test_advance_without_current_song_keeps_the_queue():
+    queue = SongQueue()
+    queue.add('1')
+    version = queue.version
+    assert queue.advance() == '1'
+    assert queue.version == version
+
+
+def test_concurrent_adds_keep_one_copy_of_each_song():
+    queue = SongQueue()
+
+    def add_all():
+        for song in range(200):
+            queue.add(str(song))
+
+    threads = [threading.Thread(target=add_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert queue.songs() == [str(song) for song in range(200)]
+    assert queue.version == 200
+
+
+def test_clear():
+    queue = SongQueue()
+    queue.add('1')
+    queue.play('1')
+    queue.clear()
+    assert queue.songs() == []
+    assert queue.current_song is None
+    assert queue.first() is None
@@ -0,0 +1,189 @@
+import json
+import os
+
+import pytest
+
+import karoloke.search as search_module
+from karoloke.search import (
+    FuzzyIndex,
+    SearchIndex,
+    get_fuzzy_index,
+    get_search_index,
+    normalize_text,
+    tokenize,
+    trigrams,
+    wait_for_search_indexes,
+    warm_search_indexes,
+)
+
+ROWS = [
+    {'filename': '1001', 'artist': 'Roberto Carlos', 'title': 'Detalhes'},
+    {'filename': '1002', 'artist': 'Elis Regina', 'title': 'CANÇÃO DO SAL'},
+    {'filename': '1003', 'artist': 'Queen', 'title': 'Bohemian Rhapsody'},
+    {
+        'filename': '1004',
+        'artist': 'Caetano Veloso',
+        'title': 'Sozinho',
+        'part': 'Ao vivo',
+    },
+]
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(ROWS)
+
+
+def test_normalize_text_strips_accents_and_case():
+    assert normalize_text('CANÇÃO') == 'cancao'
+    assert normalize_text(None) == ''
+
+
+def test_tokenize_splits_on_punctuation():
+    assert tokenize("Guns N' Roses - Patience") == [
+        'guns',
+        'n',
+        'roses',
+        'patience',
+    ]
+
+
+def test_search_is_accent_insensitive(index):
+    assert index.search('cancao') == [ROWS[1]]
+
+
+def test_search_matches_prefixes(index):
+    assert index.search('boh rhap') == [ROWS[2]]
+    assert index.search('c') == [ROWS[0], ROWS[1], ROWS[3]]
+
+
+def test_search_requires_every_token(index):
+    assert index.search('caetano vivo') == [ROWS[3]]
+    assert index.search('caetano queen') == []
+
+
+def test_search_by_song_number(index):
+    assert index.search('1003') == [ROWS[2]]
+
+
+def test_search_limit_and_filter(index):
+    assert index.search('10', limit=2) == ROWS[:2]
+
+    def accept(row):
+        return row['filename'] != '1001'
+
+    assert index.search('10', limit=2, accept=accept) == ROWS[1:3]
+
+
+def test_search_empty_query(index):
+    assert index.search('  ') == []
+
+
+def test_get_search_index_rebuilds_when_playlist_changes(tmp_path):
+    path = tmp_path / 'playlist.json'
+    path.write_text(json.dumps(ROWS[:1]))
+    first = get_search_index(str(path))
+    assert get_search_index(str(path)) is first
+
+    path.write_text(json.dumps(ROWS))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    # The previous index is served while the new one is built
+    assert get_search_index(str(path)) is first
+    assert wait_for_search_indexes(timeout=5)
+    second = get_search_index(str(path))
+    assert second is not first
+    assert len(second) == len(ROWS)
+
+
+def test_trigrams_ignore_spacing_and_punctuation():
+    assert trigrams('10 cc') == trigrams('10cc')
+    assert trigrams('  - ') == set()
+
+
+def test_fuzzy_search_tolerates_typos():
+    index = FuzzyIndex(ROWS)
+    results = index.search('bohemain rapsody')
+    assert [row['filename'] for row in results] == ['1003']
+    assert index.search('roberto carlo')[0]['filename'] == '1001'
+    assert index.search('elis regina canção')[0]['filename'] == '1002'
+
+
+def test_fuzzy_search_ranks_by_similarity():
+    rows = [
+        {'filename': '1', 'artist': 'Queens of the Stone Age'},
+        {'filename': '2', 'artist': 'Queen'},
+    ]
+    results = FuzzyIndex(rows).search('queen')
+    assert [row['filename'] for row in results] == ['2', '1']
+
+
+def test_fuzzy_search_limit_and_filter():
+    index = FuzzyIndex(ROWS)
+    assert index.search('xyzzy') == []
+    assert index.search('') == []
+    results = index.search(
+        'elis regina', accept=lambda row: row['filename'] != '1002'
+    )
+    assert results == []
+
+
+def test_fuzzy_index_update_is_incremental():
+    index = FuzzyIndex(ROWS[:2])
+    added, removed = index.update(ROWS[1:])
+    assert (added, removed) == (2, 1)
+    assert len(index) == 3
+    assert index.search('detalhes') == []
+    assert index.search('caetano veloso')[0]['filename'] == '1004'
+
+
+def test_fuzzy_index_updated_leaves_the_original_untouched():
+    index = FuzzyIndex(ROWS[:2])
+    copy = index.updated(ROWS[1:])
+    assert len(index) == 2
+    assert len(copy) == 3
+    assert index.search('detalhes')[0]['filename'] == ROWS[0]['filename']
+    assert copy.search('detalhes') == []
+    assert copy.search('caetano veloso')[0]['filename'] == '1004'
+    assert index.search('caetano veloso') == []
+
+
+def test_fuzzy_candidates_are_capped_for_common_words(monkeypatch):
+    monkeypatch.setattr(search_module, 'FUZZY_CANDIDATE_LIMIT', 10)
+    rows = [
+        {'filename': str(n), 'artist': 'Banda', 'title': f'Amor {n}'}
+        for n in range(100)
+    ]
+    rows.append({'filename': '999', 'artist': 'Zeca', 'title': 'Amor Zeca'})
+    results = FuzzyIndex(rows).search('amor zeca')
+    assert results[0]['filename'] == '999'
+    assert len(results) <= 11
+
+
+def test_get_fuzzy_index_updates_when_playlist_changes(tmp_path):
+    path = tmp_path / 'playlist.json'
+    path.write_text(json.dumps(ROWS[:1]))
+    first = get_fuzzy_index(str(path))
+    assert get_fuzzy_index(str(path)) is first
+
+    path.write_text(json.dumps(ROWS))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert get_fuzzy_index(str(path)) is first
+    assert wait_for_search_indexes(timeout=5)
+    second = get_fuzzy_index(str(path))
+    # A new index is swapped in; the old one is left as searches saw it
+    assert second is not first
+    assert len(second) == len(ROWS)
+    assert len(first) == 1
+
+
+def test_warm_search_indexes_builds_in_the_background(tmp_path):
+    path = tmp_path / 'playlist.json'
+    path.write_text(json.dumps(ROWS))
+    warm_search_indexes(str(path))
+    assert wait_for_search_indexes(timeout=5)
+    assert search_module._indexes[str(path)][1] is get_search_index(str(path))
+    fuzzy = search_module._fuzzy_indexes[str(path)][1]
+    assert fuzzy is get_fuzzy_index(str(path))
+    assert len(fuzzy) == len(ROWS)
@@ -218,3 +218,50 @@ def test_main_creates_directories_with_makedirs():
                 # Check that exist_ok=True is used
                 for call in calls:
                     assert call[1]['exist_ok'] is True
+
+
+def test_main_production_uses_waitress(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        'karoloke.start_karaoke.BACKGROUND_DIR', tmp_path / 'backgrounds'
+    )
+    monkeypatch.setattr(
+        'karoloke.start_karaoke.VIDEO_DIR', tmp_path / 'videos'
+    )
+
+    with mock.patch('threading.Timer'):
+        with mock.patch.object(start_karaoke, 'serve') as mock_serve:
+            with mock.patch.object(start_karaoke.app, 'run') as mock_run:
+                start_karaoke.main(['--production', '--threads', '8'])
+
+    mock_run.assert_not_called()
+    mock_serve.assert_called_once_with(
+        start_karaoke.app,
+        host='0.0.0.0',
+        port=5000,
+        threads=8,
+        connection_limit=200,
+        channel_timeout=60,
+    )
+
+
+def test_parse_args_ignores_unknown_arguments():
+    args = start_karaoke.parse_args(['-q', '--channel-timeout', '5'])
+    assert args.production is False
+    assert args.channel_timeout == 5
+
+
+@pytest.mark.parametrize('argv', [[], ['--previews']])
+def test_previews_are_opt_in(monkeypatch, tmp_path, argv):
+    monkeypatch.setattr(
+        'karoloke.start_karaoke.BACKGROUND_DIR', tmp_path / 'backgrounds'
+    )
+    monkeypatch.setattr(
+        'karoloke.start_karaoke.VIDEO_DIR', tmp_path / 'videos'
+    )
+
+    with mock.patch('threading.Timer'):
+        with mock.patch.object(start_karaoke, 'generate_previews') as gen:
+            with mock.patch.object(start_karaoke.app, 'run'):
+                start_karaoke.main(argv)
+
+    assert gen.called == bool(argv)
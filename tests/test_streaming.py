@@ -0,0 +1,158 @@
+import pytest
+from flask import Flask
+
+from karoloke.metrics import Metrics, get_metrics
+from karoloke.streaming import FileRange, send_video
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / '1001.mp4').write_bytes(DATA)
+    app = Flask(__name__)
+
+    @app.route('/video/<path:filename>')
+    def video(filename):
+        return send_video(str(tmp_path), filename)
+
+    get_metrics().reset()
+    with app.test_client() as client:
+        yield client
+
+
+def test_full_response_has_validators(client):
+    response = client.get('/video/1001.mp4')
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert 'max-age' in response.headers['Cache-Control']
+    assert response.mimetype == 'video/mp4'
+
+
+def test_range_request(client):
+    response = client.get('/video/1001.mp4', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == DATA[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(DATA)}'
+    assert response.content_length == 10
+
+
+def test_suffix_range_and_unsatisfiable_range(client):
+    response = client.get('/video/1001.mp4', headers={'Range': 'bytes=-5'})
+    assert response.data == DATA[-5:]
+
+    response = client.get(
+        '/video/1001.mp4', headers={'Range': f'bytes={len(DATA)}-'}
+    )
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_if_range(client):
+    etag = client.get('/video/1001.mp4').headers['ETag']
+    response = client.get(
+        '/video/1001.mp4', headers={'Range': 'bytes=0-9', 'If-Range': etag}
+    )
+    assert response.status_code == 206
+
+    # The file changed since the client cached its beginning
+    response = client.get(
+        '/video/1001.mp4',
+        headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'},
+    )
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_conditional_get(client):
+    etag = client.get('/video/1001.mp4').headers['ETag']
+    response = client.get('/video/1001.mp4', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_missing_and_outside_files(client):
+    assert client.get('/video/404.mp4').status_code == 404
+    assert client.get('/video/../secret.mp4').status_code == 404
+
+
+def test_server_file_wrapper_starts_at_range(client):
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append(f.tell())
+        return FileRange(f, 10)
+
+    response = client.get(
+        '/video/1001.mp4',
+        headers={'Range': 'bytes=100-109'},
+        environ_base={'wsgi.file_wrapper': file_wrapper},
+    )
+    assert wrapped == [100]
+    assert response.data == DATA[100:110]
+
+
+def test_bytes_served_metric(client):
+    client.get('/video/1001.mp4')
+    client.get('/video/1001.mp4', headers={'Range': 'bytes=0-99'})
+    snapshot = get_metrics().snapshot()
+    assert snapshot['bytes_served'] == {'1001': len(DATA) + 100}
+    assert snapshot['requests'] == {'1001': 2}
+
+
+def test_bytes_served_counts_what_was_sent(client):
+    response = client.get(
+        '/video/1001.mp4',
+        buffered=False,
+        environ_base={
+            'wsgi.file_wrapper': lambda f, size: FileRange(f, len(DATA), 100)
+        },
+    )
+    # The client goes away after the first chunk
+    next(iter(response.response))
+    response.close()
+    assert get_metrics().snapshot()['bytes_served'] == {'1001': 100}
+
+
+def test_bytes_read_again_are_counted_once(client):
+    def peeking_wrapper(f, block_size):
+        # Like waitress: read ahead, then rewind to what was not sent
+        start = f.tell()
+        f.read(300)
+        f.seek(start + 100)
+        return FileRange(f, 200)
+
+    response = client.get(
+        '/video/1001.mp4',
+        headers={'Range': 'bytes=0-299'},
+        environ_base={'wsgi.file_wrapper': peeking_wrapper},
+    )
+    assert response.data == DATA[100:300]
+    assert get_metrics().snapshot()['bytes_served'] == {'1001': 300}
+
+
+def test_bytes_served_with_sendfile(client):
+    def sendfile_wrapper(f, block_size):
+        # Such servers send the descriptor without reading through Python
+        f.fileno()
+        return FileRange(f, 0)
+
+    response = client.get(
+        '/video/1001.mp4',
+        headers={'Range': 'bytes=0-99'},
+        environ_base={'wsgi.file_wrapper': sendfile_wrapper},
+    )
+    response.close()
+    assert get_metrics().snapshot()['bytes_served'] == {'1001': 100}
+
+
+def test_metrics_snapshot_is_sorted():
+    metrics = Metrics()
+    metrics.increment('bytes_served', 'a', 1)
+    metrics.increment('bytes_served', 'b', 5)
+    assert list(metrics.snapshot()['bytes_served']) == ['b', 'a']
+    metrics.reset()
+    assert metrics.snapshot() == {}
@@ -0,0 +1,171 @@
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from karoloke.catalog import get_catalog, register_rendition, reset_catalog
+from karoloke.jukebox_controller import get_video_file
+from karoloke.transcoder import (
+    Transcoder,
+    browser_compatible,
+    probe_streams,
+)
+
+H264 = {'codec_name': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p'}
+HIGH10 = {'codec_name': 'h264', 'profile': 'High 10', 'pix_fmt': 'yuv420p10le'}
+AAC = {'codec_name': 'aac'}
+AC3 = {'codec_name': 'ac3'}
+
+
+@pytest.fixture
+def library(tmp_path):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / '1.avi').write_bytes(b'avi')
+    (videos / '2.mp4').write_bytes(b'mp4')
+    (videos / '2.mkv').write_bytes(b'mkv')
+    reset_catalog()
+    yield str(videos)
+    for song_num in ('1', '2'):
+        register_rendition(str(videos), song_num, None)
+    reset_catalog()
+
+
+@pytest.fixture
+def transcoder(library, tmp_path):
+    return Transcoder(
+        library,
+        output_dir=str(tmp_path / 'renditions'),
+        ffmpeg='ffmpeg',
+        ffprobe='ffprobe',
+        cpu_share=1.0,
+    )
+
+
+def fake_ffmpeg(args, timeout=None):
+    with open(args[-1], 'wb') as f:
+        f.write(b'rendition')
+    return True
+
+
+def test_browser_compatible():
+    assert browser_compatible({'video': H264, 'audio': AAC}) == {
+        'video': True,
+        'audio': True,
+    }
+    assert browser_compatible({'video': HIGH10, 'audio': AC3}) == {
+        'video': False,
+        'audio': False,
+    }
+    assert (
+        browser_compatible({'video': {'codec_name': 'mpeg4'}, 'audio': {}})[
+            'video'
+        ]
+        is False
+    )
+
+
+def test_probe_streams_keeps_first_streams():
+    output = json.dumps(
+        {
+            'streams': [
+                dict(H264, codec_type='video'),
+                dict(AAC, codec_type='audio'),
+                dict(AC3, codec_type='audio'),
+            ]
+        }
+    ).encode()
+    result = mock.Mock(returncode=0, stdout=output)
+    with mock.patch('subprocess.run', return_value=result):
+        streams = probe_streams('x.mkv', 'ffprobe')
+    assert streams['video']['profile'] == 'High'
+    assert streams['audio']['codec_name'] == 'aac'
+
+    result = mock.Mock(returncode=1, stdout=b'')
+    with mock.patch('subprocess.run', return_value=result):
+        assert probe_streams('x.mkv', 'ffprobe') is None
+
+
+def test_transcoded_rendition_is_registered(library, transcoder):
+    source = next(transcoder.sources())
+    assert source.path.endswith('1.avi')
+    with mock.patch(
+        'karoloke.transcoder.probe_streams',
+        return_value={'video': H264, 'audio': AC3},
+    ), mock.patch('karoloke.transcoder.run_ffmpeg', fake_ffmpeg):
+        output = transcoder.transcode(source)
+
+    assert os.path.dirname(output) == transcoder.output_dir
+    assert get_catalog(library).lookup('1').path == output
+    assert get_video_file('1', library) == (
+        f'.renditions/{os.path.basename(output)}'
+    )
+    assert '1' in get_catalog(library)
+
+
+def test_command_copies_compatible_streams(transcoder):
+    source = next(transcoder.sources())
+    args = transcoder.command(source, {'video': H264, 'audio': AC3}, 'out')
+    assert args[args.index('-c:v') + 1] == 'copy'
+    assert args[args.index('-c:a') + 1] == 'aac'
+    args = transcoder.command(source, {'video': HIGH10, 'audio': AAC}, 'out')
+    assert args[args.index('-c:v') + 1] == 'libx264'
+    assert args[args.index('-c:a') + 1] == 'copy'
+
+
+def test_playable_videos_are_left_alone(library, transcoder):
+    entry = get_catalog(library).lookup('2')
+    with mock.patch(
+        'karoloke.transcoder.probe_streams',
+        return_value={'video': H264, 'audio': AAC},
+    ), mock.patch('karoloke.transcoder.run_ffmpeg') as ffmpeg:
+        assert transcoder.transcode(entry) is None
+    ffmpeg.assert_not_called()
+
+
+def test_failed_conversion_raises(transcoder):
+    source = next(transcoder.sources())
+    with mock.patch(
+        'karoloke.transcoder.probe_streams',
+        return_value={'video': HIGH10, 'audio': AAC},
+    ), mock.patch('karoloke.transcoder.run_ffmpeg', return_value=False):
+        with pytest.raises(RuntimeError):
+            transcoder.transcode(source)
+
+
+def test_truncated_conversion_is_not_registered(library, transcoder):
+    def failing_ffmpeg(args, timeout=None):
+        # Killed half way: a non-empty but truncated file
+        fake_ffmpeg(args)
+        return False
+
+    with mock.patch(
+        'karoloke.transcoder.probe_streams',
+        return_value={'video': HIGH10, 'audio': AAC},
+    ), mock.patch('karoloke.transcoder.run_ffmpeg', failing_ffmpeg):
+        transcoder.scan()
+        assert transcoder.jobs.wait(timeout=5)
+    assert get_catalog(library).lookup('2').path == f'{library}/2.mp4'
+    assert os.listdir(transcoder.output_dir) == []
+    assert transcoder.jobs.progress()['transcode']['failed'] == 2
+
+
+def test_scan_skips_sources_of_available_songs(library, transcoder):
+    with mock.patch(
+        'karoloke.transcoder.probe_streams',
+        return_value={'video': HIGH10, 'audio': AAC},
+    ), mock.patch('karoloke.transcoder.run_ffmpeg', fake_ffmpeg):
+        # 1.avi and the undecodable 2.mp4; 2.mkv is redundant
+        assert transcoder.scan() == 2
+        assert transcoder.jobs.wait(timeout=5)
+    catalog = get_catalog(library)
+    assert catalog.is_rendition(catalog.lookup('1'))
+    assert catalog.is_rendition(catalog.lookup('2'))
+    assert transcoder.jobs.progress()['transcode']['done'] == 2
+
+
+def test_unavailable_without_ffmpeg(library, tmp_path):
+    transcoder = Transcoder(library, output_dir=str(tmp_path / 'r'))
+    assert not transcoder.available
+    assert transcoder.scan() == 0
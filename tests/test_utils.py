@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tempfile
@@ -6,7 +7,12 @@ from unittest import mock
 import pytest
 
 from karoloke.settings import VIDEO_FORMATS
-from karoloke.utils import collect_playlist, is_playable
+from karoloke.utils import (
+    collect_playlist,
+    is_playable,
+    iter_playlist,
+    load_playlist,
+)
 
 
 @pytest.fixture
@@ -80,10 +86,10 @@ def test_is_playable_empty_file():
         os.remove(temp_path)
 
 
-def test_is_playable_valid_file_no_ffprobe():
+def test_is_playable_valid_file_no_ffprobe(mp4_bytes):
     """Test is_playable with valid file when ffprobe is not available."""
     with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
-        f.write(b'fake video content')
+        f.write(mp4_bytes)
         temp_path = f.name
 
     try:
@@ -94,10 +100,10 @@ def test_is_playable_valid_file_no_ffprobe():
         os.remove(temp_path)
 
 
-def test_is_playable_with_ffprobe_success():
+def test_is_playable_with_ffprobe_success(mp4_bytes):
     """Test is_playable when ffprobe is available and succeeds."""
     with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
-        f.write(b'fake video content')
+        f.write(mp4_bytes)
         temp_path = f.name
 
     try:
@@ -111,10 +117,10 @@ def test_is_playable_with_ffprobe_success():
         os.remove(temp_path)
 
 
-def test_is_playable_with_ffprobe_failure():
+def test_is_playable_with_ffprobe_failure(mp4_bytes):
     """Test is_playable when ffprobe is available but fails."""
     with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
-        f.write(b'fake video content')
+        f.write(mp4_bytes)
         temp_path = f.name
 
     try:
@@ -127,10 +133,10 @@ def test_is_playable_with_ffprobe_failure():
         os.remove(temp_path)
 
 
-def test_is_playable_with_ffprobe_exception():
+def test_is_playable_with_ffprobe_exception(mp4_bytes):
     """Test is_playable when ffprobe raises an exception."""
     with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
-        f.write(b'fake video content')
+        f.write(mp4_bytes)
         temp_path = f.name
 
     try:
@@ -156,3 +162,80 @@ def test_is_playable_os_error_on_size():
             assert is_playable(temp_path) is False
     finally:
         os.remove(temp_path)
+
+
+def test_is_playable_rejects_truncated_container():
+    """Test that a broken MP4 header is rejected before running ffprobe."""
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+        f.write(b'fake video content')
+        temp_path = f.name
+
+    try:
+        with mock.patch('shutil.which', return_value='/usr/bin/ffprobe'):
+            with mock.patch('subprocess.run') as mock_run:
+                assert is_playable(temp_path) is False
+                mock_run.assert_not_called()
+    finally:
+        os.remove(temp_path)
+
+
+def test_is_playable_fast_mode_skips_ffprobe(mp4_bytes):
+    """Test that the fast validation mode trusts the container check."""
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+        f.write(mp4_bytes)
+        temp_path = f.name
+
+    try:
+        with mock.patch('subprocess.run') as mock_run:
+            assert (
+                is_playable(temp_path, ffprobe='/usr/bin/ffprobe', mode='fast')
+                is True
+            )
+            mock_run.assert_not_called()
+    finally:
+        os.remove(temp_path)
+
+
+def test_load_playlist_parses_file(tmp_path):
+    """Test that load_playlist returns the parsed JSON rows."""
+    path = tmp_path / 'playlist.json'
+    path.write_text(json.dumps([{'filename': '1', 'title': 'Song'}]))
+    assert load_playlist(str(path)) == [{'filename': '1', 'title': 'Song'}]
+
+
+def test_load_playlist_is_memoized_until_file_changes(tmp_path):
+    """Test that the JSON is parsed again only when the file changes."""
+    path = tmp_path / 'playlist.json'
+    path.write_text(json.dumps([{'filename': '1'}]))
+    first = load_playlist(str(path))
+    with mock.patch('json.load') as mock_load:
+        assert load_playlist(str(path)) is first
+        mock_load.assert_not_called()
+
+    path.write_text(json.dumps([{'filename': '1'}, {'filename': '2'}]))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert len(load_playlist(str(path))) == 2
+
+
+def test_load_playlist_missing_or_invalid_file(tmp_path):
+    """Test that a missing or invalid file yields an empty playlist."""
+    assert load_playlist(str(tmp_path / 'missing.json')) == []
+    path = tmp_path / 'broken.json'
+    path.write_text('{not json')
+    assert load_playlist(str(path)) == []
+
+
+def test_collect_playlist_skips_duplicate_filenames(temp_video_dir):
+    """Test that a file name found in several folders is listed once."""
+    playlist = collect_playlist(temp_video_dir)
+    names = [os.path.basename(f) for f in playlist]
+    assert names.count('duplicate.mp4') == 1
+    assert len(names) == len(set(names))
+
+
+def test_iter_playlist_is_lazy_and_matches_collect(temp_video_dir):
+    """Test that iter_playlist streams the same files as collect_playlist."""
+    iterator = iter_playlist(temp_video_dir)
+    assert not isinstance(iterator, list)
+    assert sorted(iterator) == sorted(collect_playlist(temp_video_dir))
@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from karoloke.catalog import VideoCatalog
+from karoloke.queue_store import SongQueue
+from karoloke.video_cache import (
+    PART_SUFFIX,
+    VideoCache,
+    cache_name,
+    close_video_cache,
+    get_video_cache,
+    open_video_cache,
+)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    origin = tmp_path / 'origin'
+    origin.mkdir()
+    for song_num in ('1', '2', '3'):
+        (origin / f'{song_num}.mp4').write_bytes(song_num.encode() * 1000)
+    return VideoCatalog(str(origin))
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+def test_copy_keeps_the_origin_validators(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    entry = catalog.lookup('1')
+    assert cache.lookup(entry) is None
+
+    cache.schedule([entry])
+    assert cache.wait(timeout=5)
+    path = cache.lookup(entry)
+    assert path == os.path.join(cache_dir, cache_name(entry))
+    stat = os.stat(path)
+    assert stat.st_size == entry.size
+    assert stat.st_mtime_ns == entry.mtime_ns
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hit_ratio'] == 0.5
+
+
+def test_changed_origin_is_a_miss(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    entry = catalog.lookup('1')
+    cache.schedule([entry])
+    cache.wait(timeout=5)
+    newer = entry._replace(mtime_ns=entry.mtime_ns + 1)
+    assert cache.lookup(newer) is None
+
+
+def test_origin_modified_during_copy_is_discarded(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    # The catalog entry no longer matches the file on disk
+    stale = catalog.lookup('1')._replace(mtime_ns=1)
+    assert not cache.copy(stale)
+    assert os.listdir(cache_dir) == []
+
+
+def test_evicts_least_recently_used(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=2500)
+    first, second, third = (catalog.lookup(s) for s in ('1', '2', '3'))
+    cache.schedule([first, second])
+    cache.wait(timeout=5)
+    # Playing the first song makes the second one the oldest
+    assert cache.lookup(first)
+
+    cache.schedule([third])
+    cache.wait(timeout=5)
+    assert cache.lookup(first)
+    assert cache.lookup(second) is None
+    assert cache.lookup(third)
+    assert cache.stats()['used_bytes'] == 2000
+
+
+def test_files_larger_than_the_budget_are_skipped(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=500)
+    entry = catalog.lookup('1')
+    cache.schedule([entry])
+    cache.wait(timeout=5)
+    assert cache.lookup(entry) is None
+
+
+def test_reopening_keeps_copies_and_drops_partial_ones(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    entry = catalog.lookup('1')
+    cache.schedule([entry])
+    cache.wait(timeout=5)
+    partial = os.path.join(cache_dir, 'x.mp4' + PART_SUFFIX)
+    with open(partial, 'wb') as f:
+        f.write(b'half')
+
+    reopened = VideoCache(cache_dir, max_bytes=10_000)
+    assert reopened.lookup(entry)
+    assert not os.path.exists(partial)
+    assert reopened.stats()['files'] == 1
+
+
+def test_reopening_with_a_smaller_budget_evicts(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    entries = [catalog.lookup(s) for s in ('1', '2', '3')]
+    for entry in entries:
+        cache.schedule([entry])
+        cache.wait(timeout=5)
+
+    reopened = VideoCache(cache_dir, max_bytes=2000)
+    assert reopened.stats()['used_bytes'] == 2000
+    assert len(os.listdir(cache_dir)) == 2
+    # The oldest copy goes first
+    assert reopened.lookup(entries[0]) is None
+    assert reopened.lookup(entries[2])
+
+
+def test_queue_changes_copy_the_next_songs(catalog, cache_dir):
+    cache = VideoCache(cache_dir, max_bytes=10_000)
+    queue = SongQueue()
+    queue.add_listener(
+        lambda q, change: cache.schedule(
+            [catalog.lookup(song_num) for song_num in q.songs()]
+        )
+    )
+    queue.add('2')
+    queue.add('3')
+    assert cache.wait(timeout=5)
+    assert cache.lookup(catalog.lookup('2'))
+    assert cache.lookup(catalog.lookup('3'))
+
+
+def test_open_and_close_shared_cache(cache_dir):
+    try:
+        assert open_video_cache(cache_dir) is get_video_cache()
+        assert open_video_cache(cache_dir) is get_video_cache()
+    finally:
+        close_video_cache()
+    assert get_video_cache() is None